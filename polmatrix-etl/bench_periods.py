@@ -0,0 +1,178 @@
+# bench_periods.py
+#
+# Shows that the ETL and extraction paths scale linearly with sub-annual data.
+#
+# For each region count, generates synthetic facts (synth_data.py; annual plus
+# quarterly rows with --quarterly, i.e. 5x the rows) and times, in a scratch
+# schema:
+#
+#   resolve   periods.resolve_time_ids for every row's (year, quarter), one
+#             query plus a dict lookup per row; the old per-row get_time_id
+#             query is timed on a sample and extrapolated for comparison
+#   load      facts_loader.upsert_facts (COPY into staging + one merge)
+#   extract   extract_training_data.py's COPY-based read and pivot
+#
+# Passes when the cost per row at each size is at most --tolerance x the cost
+# per row at the previous size, for every stage.
+#
+# Usage:
+#   python bench_periods.py --regions 40 160 640 --quarterly
+#   python bench_periods.py --regions 40 160 640               # annual only, for comparison
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+
+from facts_loader import get_connection, upsert_facts
+from periods import resolve_time_ids
+from synth_data import DEFAULT_FIRST_YEAR, DEFAULT_SEED, iter_fact_chunks, pick_metrics
+
+BENCH_SCHEMA = "polmatrix_bench_periods"
+LEGACY_SAMPLE = 2000
+STAGES = ("resolve", "load", "extract")
+
+EXTRACT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "polmatrix-forecast", "extract_training_data.py")
+
+LEGACY_TIME_SQL = """
+SELECT time_id
+  FROM time
+ WHERE year = :year
+   AND quarter IS NOT DISTINCT FROM :quarter
+ ORDER BY time_id
+ LIMIT 1
+"""
+
+
+def load_extractor():
+    spec = importlib.util.spec_from_file_location("extract_training_data", EXTRACT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_schema(conn, years):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+        cur.execute("""
+            CREATE TABLE facts (
+                region_id   VARCHAR(10),
+                year        INTEGER,
+                quarter     SMALLINT NOT NULL DEFAULT 0,
+                metric_code VARCHAR(50),
+                value       NUMERIC,
+                PRIMARY KEY (region_id, year, quarter, metric_code)
+            )
+        """)
+        cur.execute("CREATE TABLE time (time_id INTEGER PRIMARY KEY, year INTEGER, quarter INTEGER)")
+        # Same layout as synth_data.time_frame: the annual row, then four quarters per year
+        periods = [(year, quarter) for year in years for quarter in (None, 1, 2, 3, 4)]
+        cur.executemany("INSERT INTO time VALUES (%s, %s, %s)",
+                        [(i + 1, year, quarter) for i, (year, quarter) in enumerate(periods)])
+        cur.execute("CREATE INDEX ON time (year, quarter) INCLUDE (time_id)")
+    conn.commit()
+
+
+def time_resolve(engine, keys):
+    """(bulk seconds, estimated per-row seconds) to map every key to a time_id"""
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL search_path TO {BENCH_SCHEMA}"))
+        started = time.perf_counter()
+        time_ids = resolve_time_ids(conn, set(keys))
+        resolved = [time_ids.get(key) for key in keys]
+        bulk = time.perf_counter() - started
+        assert all(t is not None for t in resolved)
+
+        sample = keys[:LEGACY_SAMPLE]
+        started = time.perf_counter()
+        for year, quarter in sample:
+            conn.execute(text(LEGACY_TIME_SQL), {"year": year, "quarter": quarter or None}).fetchone()
+        legacy = (time.perf_counter() - started) * len(keys) / max(len(sample), 1)
+    return bulk, legacy
+
+
+def run_size(conn, engine, extractor, n_regions, metrics, years, quarterly):
+    """{stage: seconds} plus row counts for one region count"""
+    chunks = list(iter_fact_chunks(DEFAULT_SEED, n_regions, metrics, years, quarterly=quarterly))
+    rows = sum(len(c) for c in chunks)
+    keys = [(int(y), int(q)) for c in chunks for y, q in zip(c["year"], c["quarter"])]
+    result = {"regions": n_regions, "rows": rows}
+
+    result["resolve"], result["legacy_resolve"] = time_resolve(engine, keys)
+
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE facts")
+    conn.commit()
+    started = time.perf_counter()
+    upsert_facts(conn, chunks)
+    conn.commit()
+    result["load"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    granularity = "quarter" if quarterly else "year"
+    facts = extractor.read_facts(conn, extractor.target_metrics, granularity)
+    training = extractor.to_training(facts, granularity)
+    result["extract"] = time.perf_counter() - started
+    result["extract_rows"] = len(facts)
+    result["training_rows"] = len(training)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ETL/extraction cost per row as data volume grows")
+    parser.add_argument("--regions", type=int, nargs="+", default=[40, 160, 640])
+    parser.add_argument("--years", type=int, default=24)
+    parser.add_argument("--metrics", type=int, help="Metric count (default: every known metric)")
+    parser.add_argument("--quarterly", action="store_true", help="Add quarterly rows (5x volume)")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Allowed growth of the per-row cost from one size to the next")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {BENCH_SCHEMA} schema")
+    args = parser.parse_args()
+
+    metrics = pick_metrics(args.metrics)
+    years = list(range(DEFAULT_FIRST_YEAR, DEFAULT_FIRST_YEAR + args.years))
+    extractor = load_extractor()
+    conn = get_connection()
+    engine = create_engine("postgresql+psycopg2://", creator=get_connection)
+    results = []
+    try:
+        create_schema(conn, years)
+        print(f"{'regions':>8} {'rows':>10} {'resolve s':>10} {'(per-row) s':>12} "
+              f"{'load s':>8} {'extract s':>10}   us/row resolve/load/extract")
+        for n_regions in sorted(args.regions):
+            r = run_size(conn, engine, extractor, n_regions, metrics, years, args.quarterly)
+            results.append(r)
+            per_row = "/".join(f"{r[s] / r['rows'] * 1e6:.2f}" for s in STAGES)
+            print(f"{r['regions']:>8} {r['rows']:>10} {r['resolve']:>10.3f} {r['legacy_resolve']:>12.1f} "
+                  f"{r['load']:>8.2f} {r['extract']:>10.2f}   {per_row}")
+    finally:
+        conn.rollback()
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+        engine.dispose()
+
+    failures = []
+    for prev, cur in zip(results, results[1:]):
+        for stage in STAGES:
+            growth = (cur[stage] / cur["rows"]) / (prev[stage] / prev["rows"])
+            if growth > args.tolerance:
+                failures.append(f"{stage}: cost per row grew {growth:.2f}x from "
+                                f"{prev['rows']} to {cur['rows']} rows")
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[OK] Cost per row stays within {args.tolerance}x across sizes "
+          f"({results[0]['rows']} -> {results[-1]['rows']} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@ import requests
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+from etl_metrics import RunReport
+from periods import ANNUAL, QUARTERS, parse_period, resolve_time_ids
+
 # Load .env into environment
 load_dotenv()
 
@@ -19,6 +22,14 @@ INDICATORS = {
 COUNTRY_CODE = "USA"
 YEARS = list(range(2000, 2026))
 
+# Monthly BLS series, loaded as quarterly rows (mean of the quarter's three months)
+BLS_BASE = "https://api.bls.gov/publicAPI/v2/timeseries/data/"
+BLS_SERIES = {
+    "LNS14000000": "unemployment_rate",   # civilian unemployment rate, seasonally adjusted
+}
+BLS_API_KEY = os.getenv("BLS_API_KEY", "")
+BLS_MAX_YEARS = 20 if BLS_API_KEY else 10   # years per request the API allows
+
 # --- DATABASE CONNECTION PARAMS ---
 db_host = os.getenv('DB_HOST', 'localhost')
 db_name = os.getenv('DB_NAME', 'polmatrix')
@@ -44,68 +55,139 @@ def get_geography_id(conn, code):
         raise RuntimeError(f"No geography entry for country_code={code}")
     return geo_id
 
-def get_time_id(conn, year):
-    row = conn.execute(
-        text("""
-          SELECT time_id
-            FROM time
-           WHERE year = :year
-             AND quarter IS NULL
-        ORDER BY time_id
-           LIMIT 1
-        """),
-        {"year": year}
-    ).fetchone()
-    return row[0] if row else None
+def upsert_sql(col_name):
+    return f"""
+    INSERT INTO economy
+      (geography_id, time_id, indicator_code, {col_name}, source)
+    VALUES
+      (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
+    ON CONFLICT (geography_id, time_id, indicator_code)
+    DO UPDATE
+      SET {col_name} = EXCLUDED.{col_name},
+          source    = EXCLUDED.source;
+    """
+
+def fetch_bls_series(run, series_id):
+    """Raw BLS observations for every year in YEARS, one request per BLS_MAX_YEARS years"""
+    data = []
+    for lo in range(0, len(YEARS), BLS_MAX_YEARS):
+        years = YEARS[lo:lo + BLS_MAX_YEARS]
+        payload = {"seriesid": [series_id], "startyear": str(years[0]), "endyear": str(years[-1])}
+        if BLS_API_KEY:
+            payload["registrationkey"] = BLS_API_KEY
+        with run.span("http_fetch", indicator=series_id) as span:
+            resp = requests.post(BLS_BASE, json=payload)
+            resp.raise_for_status()
+            span.add(bytes=len(resp.content))
+        with run.span("decode", indicator=series_id) as span:
+            body = resp.json()
+            if body.get("status") != "REQUEST_SUCCEEDED":
+                print(f"[WARN] BLS request for {series_id} {years[0]}-{years[-1]} failed: {body.get('message')}")
+                continue
+            series = body["Results"]["series"]
+            batch = series[0]["data"] if series else []
+            span.add(rows=len(batch))
+        data.extend(batch)
+    return data
+
+def monthly_to_quarterly(data):
+    """[((year, quarter), mean)] for quarters with all three months published"""
+    months = {}
+    for entry in data:
+        # M01..M12 are months, M13 is the annual average
+        if not entry.get("period", "").startswith("M") or entry["period"] == "M13":
+            continue
+        try:
+            value = float(entry["value"])
+        except (TypeError, ValueError):
+            continue  # "-" marks a missing month
+        months.setdefault(parse_period(f"{entry['year']}{entry['period']}"), []).append(value)
+    return [(period, sum(values) / 3) for period, values in sorted(months.items()) if len(values) == 3]
 
 # --- ETL PROCESS ---
-with engine.begin() as conn:
-    geo_id = get_geography_id(conn, COUNTRY_CODE)
+with RunReport("economy_fetcher") as run, engine.begin() as conn:
+    with run.span("resolve_ids", kind="geography"):
+        geo_id = get_geography_id(conn, COUNTRY_CODE)
+    # Every year's time_id in one query instead of one lookup per data point
+    with run.span("resolve_ids", kind="time") as span:
+        time_ids = resolve_time_ids(conn, YEARS + [(year, q) for year in YEARS for q in QUARTERS])
+        span.add(rows=len(time_ids))
 
     for indicator_code, col_name in INDICATORS.items():
         # 1) Fetch from World Bank
-        resp = requests.get(
-            f"{WB_BASE}/country/{COUNTRY_CODE}/indicator/{indicator_code}",
-            params={"date": f"{YEARS[0]}:{YEARS[-1]}",
-                    "format": "json",
-                    "per_page": 1000}
-        )
-        resp.raise_for_status()
-        _, data = resp.json()
-
-        # 2) Upsert each year’s value
-        for entry in data:
-            year_str = entry.get("date")
-            value = entry.get("value")
-            if not year_str or value is None:
-                continue
+        with run.span("http_fetch", indicator=indicator_code) as span:
+            resp = requests.get(
+                f"{WB_BASE}/country/{COUNTRY_CODE}/indicator/{indicator_code}",
+                params={"date": f"{YEARS[0]}:{YEARS[-1]}",
+                        "format": "json",
+                        "per_page": 1000}
+            )
+            resp.raise_for_status()
+            span.add(bytes=len(resp.content))
 
-            year = int(year_str)
-            time_id = get_time_id(conn, year)
-            if time_id is None:
-                # Skip if you don’t have this year in your table
-                continue
+        with run.span("decode", indicator=indicator_code) as span:
+            _, data = resp.json()
+            span.add(rows=len(data or []))
+
+        # 2) Keep entries that carry a year and a value
+        with run.span("transform", indicator=indicator_code) as span:
+            points = [
+                (int(entry["date"]), entry["value"])
+                for entry in data or []
+                if entry.get("date") and entry.get("value") is not None
+            ]
+            span.add(rows=len(points))
+
+        with run.span("resolve_ids", kind="time") as span:
+            rows = []
+            for year, value in points:
+                time_id = time_ids.get((year, ANNUAL))
+                if time_id is None:
+                    # Skip if you don’t have this year in your table
+                    continue
+                rows.append({
+                    "geography_id":   geo_id,
+                    "time_id":        time_id,
+                    "indicator_code": indicator_code,
+                    col_name:         value,
+                    "source":         "WorldBank"
+                })
+            span.add(rows=len(rows))
+
+        # 3) Upsert every year’s value in one executemany
+        with run.span("db_write", table="economy") as span:
+            if rows:
+                conn.execute(text(upsert_sql(col_name)), rows)
+            span.add(rows=len(rows))
+
+    # --- QUARTERLY SERIES (BLS) ---
+    for series_id, col_name in BLS_SERIES.items():
+        data = fetch_bls_series(run, series_id)
+
+        with run.span("transform", indicator=series_id) as span:
+            points = monthly_to_quarterly(data)
+            span.add(rows=len(points))
+
+        with run.span("resolve_ids", kind="time") as span:
+            rows = [
+                {
+                    "geography_id":   geo_id,
+                    "time_id":        time_ids[period],
+                    "indicator_code": f"BLS.{series_id}",
+                    col_name:         value,
+                    "source":         "BLS"
+                }
+                for period, value in points
+                if period in time_ids
+            ]
+            span.add(rows=len(rows))
+            if len(rows) < len(points):
+                print(f"[WARN] {series_id}: skipped {len(points) - len(rows)} of {len(points)} quarters "
+                      f"with no time row (schema_manager.py migrate adds them)")
 
-            params = {
-                "geography_id":   geo_id,
-                "time_id":        time_id,
-                "indicator_code": indicator_code,
-                col_name:         value,
-                "source":         "WorldBank"
-            }
-
-            sql = f"""
-            INSERT INTO economy
-              (geography_id, time_id, indicator_code, {col_name}, source)
-            VALUES
-              (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
-            ON CONFLICT (geography_id, time_id, indicator_code)
-            DO UPDATE
-              SET {col_name} = EXCLUDED.{col_name},
-                  source    = EXCLUDED.source;
-            """
-
-            # Pass params dict as second argument, not keywords
-            conn.execute(text(sql), params)
+        with run.span("db_write", table="economy") as span:
+            if rows:
+                conn.execute(text(upsert_sql(col_name)), rows)
+            span.add(rows=len(rows))
 
     print("✅ Economy data for USA loaded successfully.")
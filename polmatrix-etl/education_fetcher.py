@@ -1,8 +1,11 @@
 import os
-import requests
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+from etl_metrics import RunReport
+from periods import ANNUAL, resolve_time_ids
+from stream_json import NonJSONResponse, iter_sdg_frames, open_stream
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -41,67 +44,65 @@ def get_geography_id(conn, code):
         raise RuntimeError(f"No geography entry for country_code={code}")
     return geo_id
 
-def get_time_id(conn, year):
-    row = conn.execute(
-        text("""
-            SELECT time_id
-              FROM time
-             WHERE year = :year
-               AND quarter IS NULL
-          ORDER BY time_id
-             LIMIT 1
-        """),
-        {"year": year}
-    ).fetchone()
-    return row[0] if row else None
-
 # --- ETL PROCESS ---
-with engine.begin() as conn:
-    geo_id = get_geography_id(conn, COUNTRY_CODE)
+with RunReport("education_fetcher") as run, engine.begin() as conn:
+    with run.span("resolve_ids", kind="geography"):
+        geo_id = get_geography_id(conn, COUNTRY_CODE)
+    # Every year's time_id in one query instead of one lookup per data point
+    with run.span("resolve_ids", kind="time") as span:
+        time_ids = resolve_time_ids(conn, YEARS)
+        span.add(rows=len(time_ids))
 
     for indicator_code, col_name in INDICATORS.items():
-        # 1) Fetch from SDG API
-        resp = requests.get(
-            SDG_API_BASE,
-            params={
-                "indicator": indicator_code,
-                "area": COUNTRY_CODE,
-                "period": f"{YEARS[0]}-{YEARS[-1]}"
-            }
-        )
-        resp.raise_for_status()
-        data = resp.json().get("data", [])
-
-        # 2) Upsert each year’s value
-        for entry in data:
-            year = entry.get("timePeriod")
-            value = entry.get("value")
-            if year is None or value is None:
-                continue
-
-            time_id = get_time_id(conn, int(year))
-            if time_id is None:
-                continue  # skip missing time rows
-
-            params = {
-                "geography_id":   geo_id,
-                "time_id":        time_id,
-                "indicator_code": indicator_code,
-                col_name:         float(value),
-                "source":         "UNSDG"
-            }
+        sql = f"""
+        INSERT INTO education
+          (geography_id, time_id, indicator_code, {col_name}, source)
+        VALUES
+          (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
+        ON CONFLICT (geography_id, time_id, indicator_code)
+        DO UPDATE
+          SET {col_name} = EXCLUDED.{col_name},
+              source    = EXCLUDED.source;
+        """
 
-            sql = f"""
-            INSERT INTO education
-              (geography_id, time_id, indicator_code, {col_name}, source)
-            VALUES
-              (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
-            ON CONFLICT (geography_id, time_id, indicator_code)
-            DO UPDATE
-              SET {col_name} = EXCLUDED.{col_name},
-                  source    = EXCLUDED.source;
-            """
-            conn.execute(text(sql), params)
+        # 1) Stream from SDG API in batches (body download is counted under decode)
+        with run.span("http_fetch", indicator=indicator_code) as fetch_span:
+            resp = open_stream(
+                SDG_API_BASE,
+                params={
+                    "indicator": indicator_code,
+                    "area": COUNTRY_CODE,
+                    "period": f"{YEARS[0]}-{YEARS[-1]}"
+                }
+            )
+        with resp:
+            resp.raise_for_status()
+            try:
+                for frame in run.timed_iter("decode", iter_sdg_frames(resp),
+                                            indicator=indicator_code):
+                    # 2) Upsert each batch with one executemany
+                    with run.span("resolve_ids", kind="time") as span:
+                        rows = []
+                        for year, value in zip(frame["year"], frame["value"]):
+                            time_id = time_ids.get((int(year), ANNUAL))
+                            if time_id is None:
+                                continue  # skip missing time rows
+                            rows.append({
+                                "geography_id":   geo_id,
+                                "time_id":        time_id,
+                                "indicator_code": indicator_code,
+                                col_name:         float(value),
+                                "source":         "UNSDG"
+                            })
+                        span.add(rows=len(rows))
+                    with run.span("db_write", table="education") as span:
+                        if rows:
+                            conn.execute(text(sql), rows)
+                        span.add(rows=len(rows))
+            except NonJSONResponse as e:
+                print(f"[WARN] Non-JSON response for indicator {indicator_code} ({e})")
+            finally:
+                fetch_span.add(bytes=resp.raw.tell())
 
     print("✅ Education data for USA loaded successfully.")
 # Note: This code assumes the existence of a 'education' table with appropriate columns.
\ No newline at end of file
@@ -8,6 +8,9 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from requests.exceptions import JSONDecodeError
 
+from etl_metrics import RunReport
+from periods import ANNUAL, resolve_time_ids
+
 # — Optional: force UTF-8 console output on Windows —
 if hasattr(sys.stdout, "reconfigure"):
     sys.stdout.reconfigure(encoding="utf-8")
@@ -67,30 +70,20 @@ def get_geography_id(conn, code):
         raise RuntimeError(f"No geography entry for country_code={code}")
     return geo
 
-def get_time_id(conn, year):
-    row = conn.execute(
-        text("""
-          SELECT time_id
-            FROM time
-           WHERE year = :y
-             AND quarter IS NULL
-        ORDER BY time_id
-           LIMIT 1
-        """), {"y": year}
-    ).fetchone()
-    return row[0] if row else None
-
-def download_and_extract_edgar_data(file_name):
+def download_and_extract_edgar_data(file_name, run):
     """Download and extract EDGAR data file"""
     url = f"{EDGAR_BASE}/{file_name}"
     
     try:
         print(f"[INFO] Downloading EDGAR data: {file_name}")
-        resp = requests.get(url, timeout=300)  # 5 minute timeout for large files
-        resp.raise_for_status()
+        with run.span("http_fetch", indicator=file_name) as span:
+            resp = requests.get(url, timeout=300)  # 5 minute timeout for large files
+            resp.raise_for_status()
+            span.add(bytes=len(resp.content))
         
         # Extract the Excel file from the ZIP
-        with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
+        with run.span("decode", indicator=file_name) as span, \
+                zipfile.ZipFile(io.BytesIO(resp.content)) as z:
             # Look for Excel files in the ZIP
             excel_files = [f for f in z.namelist() if f.endswith(('.xlsx', '.xls'))]
             if not excel_files:
@@ -104,6 +97,7 @@ def download_and_extract_edgar_data(file_name):
             with z.open(excel_file) as excel_data:
                 # Read Excel file into pandas DataFrame
                 df = pd.read_excel(excel_data)
+                span.add(rows=len(df), bytes=len(resp.content))
                 return df
                 
     except Exception as e:
@@ -156,8 +150,13 @@ def process_edgar_data(df, country_code, col_name):
     return records
 
 # — ETL PROCESS —
-with engine.begin() as conn:
-    geo_id = get_geography_id(conn, COUNTRY)
+with RunReport("environment_fetcher") as run, engine.begin() as conn:
+    with run.span("resolve_ids", kind="geography"):
+        geo_id = get_geography_id(conn, COUNTRY)
+    # Every year's time_id in one query instead of one lookup per data point
+    with run.span("resolve_ids", kind="time") as span:
+        time_ids = resolve_time_ids(conn, YEARS)
+        span.add(rows=len(time_ids))
 
     for indicator_code, col_name in INDICATORS.items():
         url = f"{WB_BASE}/country/{COUNTRY}/indicator/{indicator_code}"
@@ -166,11 +165,14 @@ with engine.begin() as conn:
             "format":   "json",
             "per_page": 1000
         }
-        resp = requests.get(url, params=params)
+        with run.span("http_fetch", indicator=indicator_code) as span:
+            resp = requests.get(url, params=params)
+            span.add(bytes=len(resp.content))
 
         # 1) Try to parse JSON
         try:
-            payload = resp.json()
+            with run.span("decode", indicator=indicator_code):
+                payload = resp.json()
         except JSONDecodeError:
             print(f"[WARN] Indicator {indicator_code} returned non-JSON:")
             print(resp.text[:300].replace("\n", " "))
@@ -190,48 +192,58 @@ with engine.begin() as conn:
         # 3) Grab data_array = payload[1]
         data_array = payload[1]
         if not isinstance(data_array, list) or len(data_array) == 0:
-            print(f"[INFO] Indicator {indicator_code} data array is empty (len={len(data_array)}).")
+            print(f"[INFO] Indicator {indicator_code} data array is empty (len={len(data_array or [])}).")
             continue
 
-        # 4) Upsert each entry in the array
-        for entry in data_array:
-            year_str = entry.get("date")
-            raw_val  = entry.get("value")
-            if not year_str or raw_val is None:
-                continue
+        # 4) Keep entries with a year in range and a numeric value
+        with run.span("transform", indicator=indicator_code) as span:
+            points = []
+            for entry in data_array:
+                year_str = entry.get("date")
+                raw_val  = entry.get("value")
+                if not year_str or raw_val is None:
+                    continue
 
-            year = int(year_str)
-            if year not in YEARS:
-                continue
+                year = int(year_str)
+                if year not in YEARS:
+                    continue
 
-            time_id = get_time_id(conn, year)
-            if time_id is None:
-                continue
+                # Cast to float; skip if invalid
+                try:
+                    points.append((year, float(raw_val)))
+                except (TypeError, ValueError):
+                    continue
+            span.add(rows=len(points))
 
-            # Cast to float; skip if invalid
-            try:
-                value = float(raw_val)
-            except (TypeError, ValueError):
-                continue
+        with run.span("resolve_ids", kind="time") as span:
+            rows = []
+            for year, value in points:
+                time_id = time_ids.get((year, ANNUAL))
+                if time_id is None:
+                    continue
+                rows.append({
+                    "geography_id":   geo_id,
+                    "time_id":        time_id,
+                    "indicator_code": indicator_code,
+                    col_name:         value,
+                    "source":         "WorldBank"
+                })
+            span.add(rows=len(rows))
 
-            params = {
-                "geography_id":   geo_id,
-                "time_id":        time_id,
-                "indicator_code": indicator_code,
-                col_name:         value,
-                "source":         "WorldBank"
-            }
-
-            sql = f"""
-            INSERT INTO environment
-              (geography_id, time_id, indicator_code, {col_name}, source)
-            VALUES
-              (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
-            ON CONFLICT (geography_id, time_id, indicator_code)
-            DO UPDATE SET
-              {col_name}  = EXCLUDED.{col_name},
-              source      = EXCLUDED.source;            """
-            conn.execute(text(sql), params)
+        # 5) Upsert all entries in one executemany
+        sql = f"""
+        INSERT INTO environment
+          (geography_id, time_id, indicator_code, {col_name}, source)
+        VALUES
+          (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
+        ON CONFLICT (geography_id, time_id, indicator_code)
+        DO UPDATE SET
+          {col_name}  = EXCLUDED.{col_name},
+          source      = EXCLUDED.source;            """
+        with run.span("db_write", table="environment") as span:
+            if rows:
+                conn.execute(text(sql), rows)
+            span.add(rows=len(rows))
 
         print(f"[OK] Upserted {col_name} for USA.")
 
@@ -242,47 +254,49 @@ with engine.begin() as conn:
         print(f"\n[INFO] Processing EDGAR file: {file_name}")
         
         # Download and extract data
-        df = download_and_extract_edgar_data(file_name)
+        df = download_and_extract_edgar_data(file_name, run)
         if df is None:
             continue
         
         # Process the data to get records
-        records = process_edgar_data(df, COUNTRY, col_name)
+        with run.span("transform", indicator=f"EDGAR_{col_name.upper()}") as span:
+            records = process_edgar_data(df, COUNTRY, col_name)
+            span.add(rows=len(records))
         
         if not records:
             print(f"[INFO] No data found for {COUNTRY} in {file_name}")
             continue
         
+        with run.span("resolve_ids", kind="time") as span:
+            rows = []
+            for record in records:
+                time_id = time_ids.get((record['year'], ANNUAL))
+                if time_id is None:
+                    continue
+                rows.append({
+                    "geography_id":   geo_id,
+                    "time_id":        time_id,
+                    "indicator_code": record['indicator_code'],
+                    col_name:         record['value'],
+                    "source":         "EDGAR"
+                })
+            span.add(rows=len(rows))
+        
         # Insert records into database
-        for record in records:
-            year = record['year']
-            value = record['value']
-            indicator_code = record['indicator_code']
-            column_name = record['column_name']
-            
-            time_id = get_time_id(conn, year)
-            if time_id is None:
-                continue
-            
-            params = {
-                "geography_id":   geo_id,
-                "time_id":        time_id,
-                "indicator_code": indicator_code,
-                column_name:      value,
-                "source":         "EDGAR"
-            }
-            
-            sql = f"""
-            INSERT INTO environment
-              (geography_id, time_id, indicator_code, {column_name}, source)
-            VALUES
-              (:geography_id, :time_id, :indicator_code, :{column_name}, :source)
-            ON CONFLICT (geography_id, time_id, indicator_code)
-            DO UPDATE SET
-              {column_name}  = EXCLUDED.{column_name},
-              source         = EXCLUDED.source;
-            """
-            conn.execute(text(sql), params)
+        sql = f"""
+        INSERT INTO environment
+          (geography_id, time_id, indicator_code, {col_name}, source)
+        VALUES
+          (:geography_id, :time_id, :indicator_code, :{col_name}, :source)
+        ON CONFLICT (geography_id, time_id, indicator_code)
+        DO UPDATE SET
+          {col_name}  = EXCLUDED.{col_name},
+          source         = EXCLUDED.source;
+        """
+        with run.span("db_write", table="environment") as span:
+            if rows:
+                conn.execute(text(sql), rows)
+            span.add(rows=len(rows))
         
         print(f"[OK] Inserted {len(records)} EDGAR {col_name} records for USA.")
 
@@ -0,0 +1,215 @@
+# etl_metrics.py
+#
+# Per-stage timing spans and a machine-readable run report for the fetchers.
+#
+# Every fetcher wraps its run in a RunReport and each unit of work in a span
+# (http_fetch, decode, transform, resolve_ids, db_write). Spans with the same
+# stage and labels are aggregated, so timing a loop body per batch is cheap.
+# On exit the run writes etl_reports/<job>_<timestamp>.json, which can be
+# compared across runs:
+#
+#   python etl_metrics.py diff etl_reports/health_fetcher_A.json etl_reports/health_fetcher_B.json
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+REPORT_DIR = os.getenv("ETL_REPORT_DIR", "etl_reports")
+
+
+class Span:
+    """Accumulated timings for one (stage, labels) pair"""
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.calls = 0
+
+    def add(self, rows=0, bytes=0):
+        self.rows += rows
+        self.bytes += bytes
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            **self.labels,
+            "seconds": round(self.seconds, 6),
+            "calls": self.calls,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rows_per_sec": _rate(self.rows, self.seconds),
+            "bytes_per_sec": _rate(self.bytes, self.seconds),
+        }
+
+
+def _rate(amount, seconds):
+    return round(amount / seconds, 2) if seconds > 0 and amount else 0.0
+
+
+class RunReport:
+    """Collects spans for one fetcher run and writes a JSON report when the run ends.
+
+    Usage:
+        with RunReport("health_fetcher") as run:
+            with run.span("http_fetch", indicator=code) as s:
+                resp = requests.get(url)
+                s.add(bytes=len(resp.content))
+    """
+
+    def __init__(self, job, report_dir=REPORT_DIR):
+        self.job = job
+        self.report_dir = report_dir
+        self.run_id = uuid.uuid4().hex[:12]
+        self.spans = {}
+        self.started_at = None
+        self.duration = None
+        self.status = "running"
+        self.error = None
+        self.path = None
+        self._t0 = None
+
+    def __enter__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.status = "error" if exc_type else "ok"
+        if exc_type:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.duration = time.perf_counter() - self._t0
+        self.write()
+        return False
+
+    def _get(self, stage, labels):
+        key = (stage, tuple(sorted(labels.items())))
+        span = self.spans.get(key)
+        if span is None:
+            span = self.spans[key] = Span(stage, labels)
+        return span
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time a block; call .add(rows=..., bytes=...) on the yielded span"""
+        span = self._get(stage, labels)
+        t0 = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds += time.perf_counter() - t0
+            span.calls += 1
+
+    def timed_iter(self, stage, iterable, **labels):
+        """Yield from `iterable`, timing each next() and counting len() of each item as rows.
+
+        Used for streamed payloads where fetching and decoding are interleaved
+        with the caller's own work.
+        """
+        span = self._get(stage, labels)
+        iterator = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                span.seconds += time.perf_counter() - t0
+                span.calls += 1
+            span.rows += len(item)
+            yield item
+
+    def stage_totals(self):
+        totals = {}
+        for span in self.spans.values():
+            total = totals.setdefault(span.stage, Span(span.stage, {}))
+            total.seconds += span.seconds
+            total.calls += span.calls
+            total.add(rows=span.rows, bytes=span.bytes)
+        return {stage: {k: v for k, v in s.to_dict().items() if k != "stage"}
+                for stage, s in totals.items()}
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id,
+            "job": self.job,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "duration_s": round(self.duration if self.duration is not None
+                                else time.perf_counter() - self._t0, 6),
+            "stages": self.stage_totals(),
+            "spans": [span.to_dict() for span in self.spans.values()],
+        }
+
+    def write(self):
+        """Write the report as JSON and print one [SPAN] line per stage"""
+        report = self.to_dict()
+        os.makedirs(self.report_dir, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%dT%H%M%SZ")
+        self.path = os.path.join(self.report_dir, f"{self.job}_{stamp}_{self.run_id}.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        for stage, totals in report["stages"].items():
+            print(f"[SPAN] {json.dumps({'job': self.job, 'run_id': self.run_id, 'stage': stage, **totals})}")
+        print(f"[INFO] Run report written to {self.path} ({self.status}, {report['duration_s']:.2f}s)")
+        return self.path
+
+
+# --- REPORT DIFF ---
+def diff_reports(old, new, threshold=1.5, min_seconds=0.5):
+    """Stages whose time grew by more than `threshold`x (ignoring stages under `min_seconds`)"""
+    regressions = []
+    for stage, cur in new["stages"].items():
+        prev = old["stages"].get(stage)
+        if not prev or cur["seconds"] < min_seconds:
+            continue
+        ratio = cur["seconds"] / prev["seconds"] if prev["seconds"] else float("inf")
+        if ratio > threshold:
+            regressions.append({
+                "stage": stage,
+                "old_seconds": prev["seconds"],
+                "new_seconds": cur["seconds"],
+                "ratio": round(ratio, 2),
+                "old_rows_per_sec": prev["rows_per_sec"],
+                "new_rows_per_sec": cur["rows_per_sec"],
+            })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare ETL run reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    diff = sub.add_parser("diff", help="exit 1 if any stage got slower than --threshold")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=1.5)
+    diff.add_argument("--min-seconds", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = diff_reports(old, new, args.threshold, args.min_seconds)
+    for r in regressions:
+        print(f"[WARN] {new['job']} {r['stage']}: {r['old_seconds']:.2f}s -> "
+              f"{r['new_seconds']:.2f}s ({r['ratio']}x)")
+    if new.get("status") != "ok":
+        print(f"[WARN] {new['job']} run {new['run_id']} ended with {new.get('error')}")
+    if regressions or new.get("status") != "ok":
+        sys.exit(1)
+    print(f"[OK] No stage regressed more than {args.threshold}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# facts_loader.py
+#
+# Generic bulk loader for the `facts` table.
+#
+# Reads a wide CSV (one column per metric, e.g. data/us_gdp.csv) or a long CSV
+# (region, year, metric_code, value) in chunks, streams every chunk into a
+# temporary staging table with COPY and upserts the staging table into `facts`
+# with a single INSERT ... ON CONFLICT.
+#
+# Sub-annual rows carry a `quarter` column (1-4, empty or 0 for the whole year)
+# or a `period` column instead of `year` ("2024", "2024Q3", "2024-07"; months
+# fold into their quarter, and the last row for a quarter wins). Needs the
+# 004_facts_quarter migration (schema_manager.py migrate). Rows with a
+# malformed period, year, quarter or value are skipped with a [WARN] count per
+# chunk rather than failing the load.
+#
+# Usage:
+#   python facts_loader.py data/us_gdp.csv --map gdp=gdp --region US
+#   python facts_loader.py data/us_co2.csv data/us_health.csv --region US \
+#       --map co2_emissions=co2_emissions --map health_index=health
+#   python facts_loader.py state_facts.csv --format long
+import argparse
+import io
+import os
+
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+from periods import parse_period
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+DEFAULT_CHUNKSIZE = 200_000
+FACT_COLUMNS = ["region_id", "year", "quarter", "metric_code", "value"]
+
+# Column names accepted for the key columns of an input CSV
+REGION_COLUMNS = ("region_id", "region")
+YEAR_COLUMN = "year"
+QUARTER_COLUMN = "quarter"
+PERIOD_COLUMN = "period"
+METRIC_COLUMN = "metric_code"
+VALUE_COLUMN = "value"
+
+STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS facts_staging (
+    seq         BIGSERIAL,
+    region_id   TEXT             NOT NULL,
+    year        INTEGER          NOT NULL,
+    quarter     SMALLINT         NOT NULL,
+    metric_code TEXT             NOT NULL,
+    value       DOUBLE PRECISION NOT NULL
+) ON COMMIT DROP
+"""
+
+COPY_SQL = """
+COPY facts_staging (region_id, year, quarter, metric_code, value)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# Last occurrence of a (region, year, quarter, metric) key wins, like the old row-by-row loaders
+MERGE_SQL = """
+INSERT INTO facts (region_id, year, quarter, metric_code, value)
+SELECT DISTINCT ON (region_id, year, quarter, metric_code)
+       region_id, year, quarter, metric_code, value
+  FROM facts_staging
+ ORDER BY region_id, year, quarter, metric_code, seq DESC
+ON CONFLICT (region_id, year, quarter, metric_code)
+DO UPDATE SET value = EXCLUDED.value
+"""
+
+
+# --- HELPERS ---
+def get_connection():
+    """Open a psycopg2 connection from the DB_* environment variables"""
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME", "polmatrix"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", os.getenv("DB_PASS", "")),
+    )
+
+
+def _find_region_column(columns):
+    for col in REGION_COLUMNS:
+        if col in columns:
+            return col
+    return None
+
+
+def _try_parse_period(value):
+    """parse_period, or None for a malformed period (the row is dropped and counted by _clean)"""
+    try:
+        return parse_period(value)
+    except ValueError:
+        return None
+
+
+def _split_periods(chunk):
+    """Add year and quarter columns parsed from a `period` column, if the chunk has one"""
+    if PERIOD_COLUMN not in chunk.columns or YEAR_COLUMN in chunk.columns:
+        return chunk
+    parsed = {p: _try_parse_period(p) for p in chunk[PERIOD_COLUMN].dropna().unique()}
+    periods = chunk[PERIOD_COLUMN].map(parsed)
+    chunk = chunk.drop(columns=[PERIOD_COLUMN])
+    chunk[YEAR_COLUMN] = periods.str[0]
+    chunk[QUARTER_COLUMN] = periods.str[1]
+    return chunk
+
+
+def wide_to_facts(chunk, mapping=None, region=None):
+    """Melt a wide chunk (year [, quarter] [, region] + one column per metric) into fact rows.
+
+    `mapping` maps CSV column -> metric_code; when omitted every non-key column
+    is loaded under its own name. `region` is used when the CSV has no region column.
+    """
+    chunk = _split_periods(chunk)
+    region_col = _find_region_column(chunk.columns)
+    if region_col is None and region is None:
+        raise ValueError("CSV has no region column; pass region=... (--region)")
+
+    if mapping is None:
+        keys = {YEAR_COLUMN, QUARTER_COLUMN, region_col}
+        mapping = {c: c for c in chunk.columns if c not in keys}
+
+    missing = [c for c in mapping if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Mapped columns not found in CSV: {missing}")
+
+    id_cols = [YEAR_COLUMN] + ([QUARTER_COLUMN] if QUARTER_COLUMN in chunk.columns else []) \
+        + ([region_col] if region_col else [])
+    long_df = chunk[id_cols + list(mapping)].melt(
+        id_vars=id_cols, var_name="metric_code", value_name="value"
+    )
+    long_df["metric_code"] = long_df["metric_code"].map(mapping)
+    long_df["region_id"] = long_df[region_col] if region_col else region
+    return _clean(long_df)
+
+
+def long_to_facts(chunk, mapping=None, region=None):
+    """Normalise a long chunk (region, year [, quarter], metric_code, value) into fact rows.
+
+    When `mapping` is given only the listed metric codes are kept and renamed.
+    """
+    chunk = _split_periods(chunk)
+    region_col = _find_region_column(chunk.columns)
+    if region_col is None and region is None:
+        raise ValueError("CSV has no region column; pass region=... (--region)")
+
+    long_df = pd.DataFrame({
+        "region_id": chunk[region_col] if region_col else region,
+        "year": chunk[YEAR_COLUMN],
+        "quarter": chunk[QUARTER_COLUMN] if QUARTER_COLUMN in chunk.columns else 0,
+        "metric_code": chunk[METRIC_COLUMN],
+        "value": chunk[VALUE_COLUMN],
+    })
+    if mapping is not None:
+        long_df = long_df[long_df["metric_code"].isin(list(mapping))]
+        long_df["metric_code"] = long_df["metric_code"].map(mapping)
+    return _clean(long_df)
+
+
+def _clean(long_df):
+    """Coerce types and drop unusable rows; no quarter means the whole year.
+
+    Rows with a missing or malformed period, year, quarter or value are
+    dropped, and a [WARN] gives how many.
+    """
+    if "quarter" not in long_df.columns:
+        long_df = long_df.assign(quarter=0)
+    long_df = long_df[FACT_COLUMNS].copy()
+    total = len(long_df)
+    long_df["year"] = pd.to_numeric(long_df["year"], errors="coerce")
+    quarter = pd.to_numeric(long_df["quarter"], errors="coerce")
+    # An empty quarter is the whole year; anything else must be 0-4
+    bad_quarter = (quarter.isna() & long_df["quarter"].notna()) | ~quarter.fillna(0).isin(range(5))
+    long_df["quarter"] = quarter.fillna(0)
+    long_df["value"] = pd.to_numeric(long_df["value"], errors="coerce")
+    long_df = long_df[~bad_quarter].dropna(subset=["region_id", "year", "metric_code", "value"])
+    long_df["year"] = long_df["year"].astype("int64")
+    long_df["quarter"] = long_df["quarter"].astype("int64")
+    if len(long_df) < total:
+        print(f"[WARN] Skipped {total - len(long_df)} of {total} row(s) without a valid "
+              f"region, period, year, quarter, metric or value")
+    return long_df
+
+
+def copy_facts(cur, facts_df):
+    """Stream a DataFrame of fact rows into facts_staging with COPY"""
+    buf = io.StringIO()
+    facts_df.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    cur.copy_expert(COPY_SQL, buf)
+
+
+def upsert_facts(conn, frames):
+    """Bulk-upsert an iterable of fact DataFrames into `facts`.
+
+    Every frame is COPY'd into a temporary staging table and merged with one
+    INSERT ... ON CONFLICT at the end. Runs in the caller's transaction; the
+    staging table is dropped on commit. Returns the number of staged rows.
+    """
+    staged = 0
+    with conn.cursor() as cur:
+        cur.execute(STAGING_DDL)
+        cur.execute("TRUNCATE facts_staging")
+        for facts_df in frames:
+            if facts_df.empty:
+                continue
+            copy_facts(cur, facts_df)
+            staged += len(facts_df)
+        if staged:
+            cur.execute(MERGE_SQL)
+    return staged
+
+
+def iter_csv_facts(path, mapping=None, region=None, fmt="wide", chunksize=DEFAULT_CHUNKSIZE):
+    """Yield fact DataFrames for a CSV file, `chunksize` input rows at a time"""
+    to_facts = wide_to_facts if fmt == "wide" else long_to_facts
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        yield to_facts(chunk, mapping=mapping, region=region)
+
+
+def load_csv(conn, path, mapping=None, region=None, fmt="wide", chunksize=DEFAULT_CHUNKSIZE):
+    """Load one CSV file into `facts` and commit. Returns the number of rows staged."""
+    try:
+        staged = upsert_facts(conn, iter_csv_facts(path, mapping, region, fmt, chunksize))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return staged
+
+
+def parse_mapping(pairs):
+    """Turn ["col=metric", ...] into {"col": "metric", ...}"""
+    if not pairs:
+        return None
+    mapping = {}
+    for pair in pairs:
+        col, sep, metric = pair.partition("=")
+        if not sep or not col or not metric:
+            raise ValueError(f"Invalid mapping '{pair}', expected column=metric_code")
+        mapping[col] = metric
+    return mapping
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load CSV files into the facts table")
+    parser.add_argument("paths", nargs="+", help="CSV files to load")
+    parser.add_argument("--map", action="append", dest="mapping", metavar="COLUMN=METRIC",
+                        help="column -> metric_code mapping (repeatable); default loads every column")
+    parser.add_argument("--region", help="region_id for CSVs without a region column, e.g. US")
+    parser.add_argument("--format", choices=["wide", "long"], default="wide", dest="fmt")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    mapping = parse_mapping(args.mapping)
+    conn = get_connection()
+    try:
+        for path in args.paths:
+            # Only keep the mapped columns that exist in this file when loading several files
+            file_mapping = mapping
+            if mapping is not None and args.fmt == "wide" and len(args.paths) > 1:
+                header = pd.read_csv(path, nrows=0).columns
+                file_mapping = {c: m for c, m in mapping.items() if c in header}
+                if not file_mapping:
+                    print(f"[INFO] No mapped columns in {path}, skipping.")
+                    continue
+            rows = load_csv(conn, path, file_mapping, args.region, args.fmt, args.chunksize)
+            print(f"[OK] Upserted {rows} fact rows from {path}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# facts_sync.py
+#
+# Incremental sync from the domain tables (economy, education, environment,
+# health) into facts(region_id, year, quarter, metric_code, value).
+#
+# Annual domain rows (time.quarter NULL) become quarter 0 facts; quarterly rows
+# keep their quarter. Needs the 004_facts_quarter migration (schema_manager.py).
+#
+# Change tracking is an `updated_at` column on every domain table, maintained
+# by a trigger, plus a per-table watermark in `facts_sync_state`. Each pass only
+# reads rows touched since the last watermark, unpivots their metric columns
+# and upserts them into `facts` with one set-based INSERT ... ON CONFLICT.
+#
+# Usage:
+#   python facts_sync.py --install          # one-off: add updated_at + triggers
+#   python facts_sync.py                    # one sync pass
+#   python facts_sync.py --loop --interval 60
+#   python facts_sync.py --full             # ignore watermarks, resync everything
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Domain table -> {column: metric_code}. Columns are the ones the fetchers write;
+# metric codes follow the names the simulator asks for.
+DOMAIN_METRICS = {
+    "economy": {
+        "gdp_growth":                "gdp_growth_rate",
+        "unemployment_rate":         "unemployment_rate",
+        "inflation_rate":            "inflation_rate",
+        "trade_balance":             "trade_balance",
+        "foreign_direct_investment": "foreign_direct_investment",
+        "gdp_per_capita":            "gdp_per_capita",
+    },
+    "education": {
+        "primary_completion_rate":   "primary_completion_rate",
+        "secondary_enrollment":      "secondary_enrollment",
+        "pupil_teacher_ratio":       "pupil_teacher_ratio",
+    },
+    "environment": {
+        "co2_emissions":               "co2_emissions",
+        "ch4_emissions":               "ch4_emissions",
+        "n2o_emissions":               "n2o_emissions",
+        "renewable_energy_percentage": "renewable_energy_percentage",
+        "forest_area_pct":             "forest_area_percentage",
+        "pm25":                        "pm25",
+    },
+    "health": {
+        "life_expectancy":            "life_expectancy",
+        "infant_mortality_rate":      "infant_mortality_rate",
+        "maternal_mortality_ratio":   "maternal_mortality_rate",
+        "health_expenditure_pct_gdp": "health_expenditure_pct_gdp",
+    },
+}
+
+# geography.country_code -> facts.region_id; unmapped codes are used as-is
+REGION_IDS = {
+    "USA": "US",
+}
+
+# Re-read rows this far behind the watermark. The fetchers hold one long
+# transaction, so rows can commit with an updated_at older than the last sync.
+LOOKBACK = os.getenv("FACTS_SYNC_LOOKBACK", "30 minutes")
+
+# --- DATABASE CONNECTION ---
+db_host = os.getenv("DB_HOST", "localhost")
+db_name = os.getenv("DB_NAME", "polmatrix")
+db_user = os.getenv("DB_USER", "postgres")
+db_pass = os.getenv("DB_PASSWORD", "")
+db_port = os.getenv("DB_PORT", "5432")
+
+if db_pass:
+    db_url = f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
+else:
+    db_url = f"postgresql://{db_user}@{db_host}:{db_port}/{db_name}"
+
+# --- CHANGE TRACKING DDL ---
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS facts_sync_state (
+    table_name  TEXT PRIMARY KEY,
+    watermark   TIMESTAMPTZ NOT NULL DEFAULT 'epoch',
+    synced_at   TIMESTAMPTZ,
+    rows_synced BIGINT NOT NULL DEFAULT 0
+)
+"""
+
+TOUCH_FUNCTION_DDL = """
+CREATE OR REPLACE FUNCTION polmatrix_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def install_change_tracking(conn, tables=None):
+    """Add updated_at, its trigger and index to each domain table (idempotent)"""
+    conn.execute(text(STATE_DDL))
+    conn.execute(text(TOUCH_FUNCTION_DDL))
+    for table in tables or DOMAIN_METRICS:
+        conn.execute(text(
+            f"ALTER TABLE {table} "
+            f"ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_touch_updated_at ON {table}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {table}_touch_updated_at "
+            f"BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION polmatrix_touch_updated_at()"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {table}_updated_at_idx ON {table} (updated_at)"
+        ))
+        conn.execute(text(
+            "INSERT INTO facts_sync_state (table_name) VALUES (:t) ON CONFLICT DO NOTHING"
+        ), {"t": table})
+        print(f"[OK] Change tracking installed on {table}")
+
+
+# --- SYNC ---
+def build_sync_sql(table, metrics, regions=None):
+    """Set-based upsert of one domain table's changed rows into facts.
+
+    Binds: :since, :until and the region map parameters returned alongside.
+    """
+    regions = regions or REGION_IDS
+    region_values = ", ".join(
+        f"(:cc{i}, :rid{i})" for i in range(len(regions))
+    ) or "(NULL, NULL)"
+    params = {}
+    for i, (code, region_id) in enumerate(regions.items()):
+        params[f"cc{i}"] = code
+        params[f"rid{i}"] = region_id
+
+    unpivot = ",\n                   ".join(
+        f"('{metric}', d.{col}::double precision)" for col, metric in metrics.items()
+    )
+
+    sql = f"""
+    WITH region_map (country_code, region_id) AS (
+        VALUES {region_values}
+    ), changed AS (
+        SELECT COALESCE(m.region_id, g.country_code) AS region_id,
+               t.year,
+               COALESCE(t.quarter, 0) AS quarter,
+               v.metric_code,
+               v.value,
+               d.updated_at
+          FROM {table} d
+          JOIN geography g ON g.geography_id = d.geography_id
+          JOIN time t      ON t.time_id = d.time_id
+          LEFT JOIN region_map m ON m.country_code = g.country_code
+         CROSS JOIN LATERAL (
+            VALUES {unpivot}
+         ) AS v (metric_code, value)
+         WHERE d.updated_at >  :since
+           AND d.updated_at <= :until
+           AND v.value IS NOT NULL
+    )
+    INSERT INTO facts (region_id, year, quarter, metric_code, value)
+    SELECT DISTINCT ON (region_id, year, quarter, metric_code)
+           region_id, year, quarter, metric_code, value
+      FROM changed
+     ORDER BY region_id, year, quarter, metric_code, updated_at DESC
+    ON CONFLICT (region_id, year, quarter, metric_code)
+    DO UPDATE SET value = EXCLUDED.value
+     WHERE facts.value IS DISTINCT FROM EXCLUDED.value
+    """
+    return sql, params
+
+
+def sync_table(conn, table, metrics, full=False):
+    """Propagate one table's changes into facts and advance its watermark.
+
+    Returns the number of fact rows inserted or changed.
+    """
+    watermark = conn.execute(text(
+        "SELECT watermark FROM facts_sync_state WHERE table_name = :t FOR UPDATE"
+    ), {"t": table}).scalar_one_or_none()
+    if watermark is None:
+        raise RuntimeError(f"No sync state for {table}; run with --install first")
+
+    since = conn.execute(
+        text("SELECT CASE WHEN :full THEN 'epoch'::timestamptz "
+             "ELSE CAST(:wm AS timestamptz) - CAST(:lookback AS interval) END"),
+        {"full": full, "wm": watermark, "lookback": LOOKBACK}
+    ).scalar_one()
+    until = conn.execute(
+        text(f"SELECT max(updated_at) FROM {table} WHERE updated_at > :since"),
+        {"since": since}
+    ).scalar_one_or_none()
+    if until is None:
+        return 0
+
+    sql, params = build_sync_sql(table, metrics)
+    result = conn.execute(text(sql), {**params, "since": since, "until": until})
+
+    conn.execute(text("""
+        UPDATE facts_sync_state
+           SET watermark   = GREATEST(watermark, :until),
+               synced_at   = now(),
+               rows_synced = rows_synced + :n
+         WHERE table_name = :t
+    """), {"until": until, "n": result.rowcount, "t": table})
+    return result.rowcount
+
+
+def sync_all(engine, tables=None, full=False):
+    """One sync pass; every table commits independently. Returns {table: rows}."""
+    synced = {}
+    for table in tables or DOMAIN_METRICS:
+        with engine.begin() as conn:
+            synced[table] = sync_table(conn, table, DOMAIN_METRICS[table], full=full)
+        print(f"[OK] Synced {synced[table]} fact rows from {table}")
+    return synced
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally sync domain tables into facts")
+    parser.add_argument("--install", action="store_true",
+                        help="add updated_at columns, triggers and sync state, then exit")
+    parser.add_argument("--table", action="append", dest="tables", choices=list(DOMAIN_METRICS),
+                        help="only sync these tables (repeatable)")
+    parser.add_argument("--full", action="store_true", help="ignore watermarks for this pass")
+    parser.add_argument("--loop", action="store_true", help="keep syncing every --interval seconds")
+    parser.add_argument("--interval", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(db_url)
+
+    if args.install:
+        with engine.begin() as conn:
+            install_change_tracking(conn, args.tables)
+        return
+
+    sync_all(engine, args.tables, full=args.full)
+    while args.loop:
+        time.sleep(args.interval)
+        sync_all(engine, args.tables)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import os
-import re
 import sys
-import requests
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
-from requests.exceptions import JSONDecodeError
+
+from etl_metrics import RunReport
+from periods import ANNUAL, resolve_time_ids
+from stream_json import NonJSONResponse, iter_gho_frames, open_stream
 
 # --- FORCE UTF-8 OUTPUT (optional) ---
 if hasattr(sys.stdout, "reconfigure"):
@@ -48,95 +49,75 @@ def get_geography_id(conn, code):
         raise RuntimeError(f"No geography entry for country_code={code}")
     return geo
 
-def get_time_id(conn, year):
-    row = conn.execute(
-        text("""
-          SELECT time_id
-            FROM time
-           WHERE year = :y
-             AND quarter IS NULL
-        ORDER BY time_id
-           LIMIT 1
-        """), {"y": year}
-    ).fetchone()
-    return row[0] if row else None
-
 # --- ETL PROCESS ---
-with engine.begin() as conn:
-    geo_id = get_geography_id(conn, COUNTRY_CODE)
+with RunReport("health_fetcher") as run, engine.begin() as conn:
+    with run.span("resolve_ids", kind="geography"):
+        geo_id = get_geography_id(conn, COUNTRY_CODE)
+    # Every year's time_id in one query instead of one lookup per data point
+    with run.span("resolve_ids", kind="time") as span:
+        time_ids = resolve_time_ids(conn, YEARS)
+        span.add(rows=len(time_ids))
 
     for code, col in INDICATORS.items():
         url = f"{GHO_BASE}/{code}"
-        resp = requests.get(url, params={
+        params = {
             "filter": f"COUNTRY:{COUNTRY_CODE}",
             "format": "json",
             "profile": "simple"
-        })
-
-        # 1) Try parsing JSON, else log & skip
-        try:
-            payload = resp.json()
-        except JSONDecodeError:
-            print(f"[WARN] Non-JSON response for indicator {code} (HTTP {resp.status_code}):")
-            print(resp.text[:300].replace("\n"," "))
-            continue
-        text_body = resp.text.strip()
-        # WHO sometimes returns "{ , }" for no-data stubs
-        if re.fullmatch(r"\{\s*,\s*\}", text_body):
-            print(f"[INFO] No JSON payload for {code}, skipping.")
-            continue
-        try:
-            payload = resp.json()
-        except JSONDecodeError:
-            print(f"[WARN] Unexpected non-JSON for {code} (HTTP {resp.status_code}):")
-            print(text_body[:300])
-            continue
-
-        facts = payload.get("fact", [])
-        if not facts:
-            print(f"[INFO] No data for {code}.")
-            continue
-
-        # 2) Process each fact
-        for fact in facts:
-            dim  = fact.get("dim", {})
-            year = dim.get("YEAR")
-            raw  = fact.get("Value")
-            if year is None or raw is None:
-                continue
-
-            # Extract leading float (e.g. "23.3" from "23.3 [15.0-34.2]")
-            m = re.match(r"^([0-9]+(?:\.[0-9]+)?)", raw)
-            if not m:
-                continue
-            value = float(m.group(1))
-
-            year = int(year)
-            if year not in YEARS:
+        }
+
+        sql = f"""
+        INSERT INTO health
+          (geography_id, time_id, indicator_code, {col}, source)
+        VALUES
+          (:geography_id, :time_id, :indicator_code, :{col}, :source)
+        ON CONFLICT (geography_id, time_id, indicator_code)
+        DO UPDATE
+          SET {col}   = EXCLUDED.{col},
+              source  = EXCLUDED.source;
+        """
+
+        # 1) Stream facts off the response in batches; values are parsed vectorized.
+        #    http_fetch covers the request up to the headers; the body is
+        #    downloaded while it is parsed, so that time is counted under decode.
+        loaded = 0
+        with run.span("http_fetch", indicator=code) as fetch_span:
+            resp = open_stream(url, params=params)
+        with resp:
+            try:
+                for frame in run.timed_iter("decode", iter_gho_frames(resp, years=YEARS),
+                                            indicator=code):
+                    # 2) Upsert each batch with one executemany
+                    with run.span("resolve_ids", kind="time") as span:
+                        rows = []
+                        for year, value in zip(frame["year"], frame["value"]):
+                            time_id = time_ids.get((int(year), ANNUAL))
+                            if time_id is None:
+                                continue
+                            rows.append({
+                                "geography_id":   geo_id,
+                                "time_id":        time_id,
+                                "indicator_code": code,
+                                col:               float(value),
+                                "source":         "WHO_GHO"
+                            })
+                        span.add(rows=len(rows))
+                    with run.span("db_write", table="health") as span:
+                        if rows:
+                            conn.execute(text(sql), rows)
+                        span.add(rows=len(rows))
+                    loaded += len(rows)
+            except NonJSONResponse as e:
+                # WHO sometimes returns "{ , }" for no-data stubs
+                if e.empty_stub:
+                    print(f"[INFO] No JSON payload for {code}, skipping.")
+                else:
+                    print(f"[WARN] Non-JSON response for indicator {code} ({e})")
                 continue
+            finally:
+                fetch_span.add(bytes=resp.raw.tell())
 
-            time_id = get_time_id(conn, year)
-            if time_id is None:
-                continue
-
-            params = {
-                "geography_id":   geo_id,
-                "time_id":        time_id,
-                "indicator_code": code,
-                col:               value,
-                "source":         "WHO_GHO"
-            }
-
-            sql = f"""
-            INSERT INTO health
-              (geography_id, time_id, indicator_code, {col}, source)
-            VALUES
-              (:geography_id, :time_id, :indicator_code, :{col}, :source)
-            ON CONFLICT (geography_id, time_id, indicator_code)
-            DO UPDATE
-              SET {col}   = EXCLUDED.{col},
-                  source  = EXCLUDED.source;
-            """
-            conn.execute(text(sql), params)
+        if not loaded:
+            print(f"[INFO] No data for {code}.")
 
     print("Health data for USA loaded successfully.")
@@ -0,0 +1,89 @@
+# periods.py
+#
+# Period encoding and bulk time_id resolution shared by the fetchers, the facts
+# loader and the sync job.
+#
+# A period is (year, quarter) with quarter 0 for the whole year. In `time` the
+# annual row has quarter NULL; in `facts` it has quarter 0, so facts keys stay
+# NOT NULL. Where one sortable integer is handier (training extracts, forecast
+# output) a period is encoded as year * 10 + quarter, e.g. 2024 -> 20240 and
+# 2024 Q3 -> 20243. Monthly source data is folded into quarters.
+#
+# Usage:
+#   time_ids = resolve_time_ids(conn, YEARS)                 # annual rows
+#   time_ids = resolve_time_ids(conn, [(2024, 1), (2024, 2)])
+#   time_ids.get((2024, 0))                                  # None if `time` has no such row
+import re
+
+from sqlalchemy import text
+
+ANNUAL = 0
+QUARTERS = (1, 2, 3, 4)
+
+# "2024", "2024Q3", "2024-Q3", "2024 Q3", "2024M07", "2024-07"
+_PERIOD_RE = re.compile(r"^\s*(\d{4})(?:[-\s]?(?:Q(\d)|M?(\d{1,2})))?\s*$", re.IGNORECASE)
+
+
+def encode_period(year, quarter=ANNUAL):
+    """Sortable integer for a period: year * 10 + quarter"""
+    return int(year) * 10 + int(quarter or ANNUAL)
+
+
+def decode_period(period):
+    """(year, quarter) from encode_period's integer"""
+    return divmod(int(period), 10)
+
+
+def period_label(year, quarter=ANNUAL):
+    """Display label, e.g. 2024 or 2024Q3"""
+    return f"{year}Q{quarter}" if quarter else str(year)
+
+
+def month_to_quarter(month):
+    return (int(month) - 1) // 3 + 1
+
+
+def parse_period(value):
+    """(year, quarter) from a source date string; months map to their quarter"""
+    match = _PERIOD_RE.match(str(value))
+    if match is None:
+        raise ValueError(f"Unrecognised period {value!r}")
+    year, quarter, month = match.groups()
+    if quarter is not None:
+        if not 1 <= int(quarter) <= 4:
+            raise ValueError(f"Invalid quarter in {value!r}")
+        return int(year), int(quarter)
+    if month is not None:
+        if not 1 <= int(month) <= 12:
+            raise ValueError(f"Invalid month in {value!r}")
+        return int(year), month_to_quarter(month)
+    return int(year), ANNUAL
+
+
+def _as_period(key):
+    if isinstance(key, tuple):
+        return int(key[0]), int(key[1] or ANNUAL)
+    return int(key), ANNUAL
+
+
+def resolve_time_ids(conn, periods):
+    """{(year, quarter): time_id} for every period that has a `time` row, in one query.
+
+    `periods` holds years (annual) or (year, quarter) pairs. When `time` has
+    duplicates the lowest time_id wins, like the old per-row get_time_id.
+    """
+    wanted = {_as_period(p) for p in periods}
+    if not wanted:
+        return {}
+    rows = conn.execute(
+        text("""
+          SELECT time_id, year, quarter
+            FROM time
+           WHERE year = ANY(:years)
+        ORDER BY time_id DESC
+        """),
+        {"years": sorted({year for year, _ in wanted})}
+    ).fetchall()
+    # Descending order, so the lowest time_id is written last and wins
+    found = {(year, quarter or ANNUAL): time_id for time_id, year, quarter in rows}
+    return {period: found[period] for period in wanted if period in found}
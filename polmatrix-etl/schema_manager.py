@@ -0,0 +1,402 @@
+# schema_manager.py
+#
+# Index/partition migrations for the hot read paths, plus a local benchmark.
+#
+# Hot queries:
+#   - simulator.js::runSimulation history lookup
+#       facts WHERE region_id = $1 AND year < $2 AND quarter = 0 AND metric_code = ANY($3)
+#   - extract_training_data.py
+#       facts WHERE metric_code IN (...) AND quarter = 0
+#   - every fetcher's periods.resolve_time_ids
+#       time WHERE year = ANY(:years)
+#
+# Usage:
+#   python schema_manager.py status
+#   python schema_manager.py migrate [--concurrently]
+#   python schema_manager.py migrate --partition 16      # also hash-partition facts by region
+#   python schema_manager.py bench --regions 500 --years 40 --metrics 20 [--partition 16] [--quarterly]
+import argparse
+import json
+import re
+import statistics
+import time
+
+from facts_loader import get_connection
+
+# --- MIGRATIONS ---
+# (id, description, table, statements). {concurrently} is filled in at apply time.
+MIGRATIONS = [
+    (
+        # metric_code = ANY(...) expands to one range scan per metric on
+        # (metric_code, region_id, year), so a single covering index serves
+        # both the history lookup and the training extract as index-only scans
+        "001_facts_metric_region_year_idx",
+        "covering index for history lookups and training extracts",
+        "facts",
+        ["CREATE INDEX {concurrently} IF NOT EXISTS facts_metric_region_year_idx "
+         "ON facts (metric_code, region_id, year) INCLUDE (value)"],
+    ),
+    (
+        "002_time_year_quarter_idx",
+        "index for (year, quarter) -> time_id lookups",
+        "time",
+        ["CREATE INDEX {concurrently} IF NOT EXISTS time_year_quarter_idx "
+         "ON time (year, quarter) INCLUDE (time_id)"],
+    ),
+    (
+        # Sub-annual facts: quarter 0 is the whole year, 1-4 are quarters.
+        # Annual readers filter quarter = 0, so it joins the key and the
+        # covering index, which replaces 001's
+        "004_facts_quarter",
+        "quarter column in the facts key and covering index",
+        "facts",
+        ["ALTER TABLE facts ADD COLUMN IF NOT EXISTS quarter SMALLINT NOT NULL DEFAULT 0 "
+         "CHECK (quarter BETWEEN 0 AND 4)",
+         "ALTER TABLE facts DROP CONSTRAINT IF EXISTS facts_pkey",
+         "ALTER TABLE facts ADD PRIMARY KEY (region_id, year, quarter, metric_code)",
+         "CREATE INDEX {concurrently} IF NOT EXISTS facts_metric_region_year_quarter_idx "
+         "ON facts (metric_code, region_id, year, quarter) INCLUDE (value)",
+         "DROP INDEX {concurrently} IF EXISTS facts_metric_region_year_idx"],
+    ),
+    (
+        # Quarterly source data (e.g. BLS) needs a time_id per quarter; add
+        # quarters 1-4 for every year `time` has. time_id is assigned past the
+        # current maximum, and its sequence, if any, moved along
+        "005_time_quarter_rows",
+        "quarter rows in time for every year",
+        "time",
+        ["INSERT INTO time (time_id, year, quarter) "
+         "SELECT (SELECT COALESCE(max(time_id), 0) FROM time) "
+         "       + row_number() OVER (ORDER BY y.year, q.quarter), y.year, q.quarter "
+         "  FROM (SELECT DISTINCT year FROM time) y "
+         " CROSS JOIN generate_series(1, 4) AS q(quarter) "
+         " WHERE NOT EXISTS (SELECT 1 FROM time t WHERE t.year = y.year AND t.quarter = q.quarter)",
+         "SELECT setval(pg_get_serial_sequence('time', 'time_id'), (SELECT max(time_id) FROM time)) "
+         " WHERE pg_get_serial_sequence('time', 'time_id') IS NOT NULL"],
+    ),
+]
+
+PARTITION_MIGRATION = "003_partition_facts_by_region"
+
+MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id          TEXT PRIMARY KEY,
+    description TEXT,
+    applied_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+# --- HOT QUERIES ---
+HISTORY_SQL = """
+SELECT year, metric_code, value
+  FROM facts
+ WHERE region_id = %(region)s AND year < %(start_year)s AND quarter = 0 AND metric_code = ANY(%(metrics)s)
+ ORDER BY year
+"""
+
+TRAINING_SQL = """
+SELECT region_id AS region, year, metric_code, value
+  FROM facts
+ WHERE metric_code IN %(metric_tuple)s AND quarter = 0
+"""
+
+TIME_LOOKUP_SQL = """
+SELECT time_id, year, quarter
+  FROM time
+ WHERE year = ANY(%(years)s)
+ ORDER BY time_id DESC
+"""
+
+HOT_QUERIES = {
+    "history": HISTORY_SQL,
+    "training": TRAINING_SQL,
+    "time_lookup": TIME_LOOKUP_SQL,
+}
+
+
+# --- HELPERS ---
+def applied_migrations(cur):
+    cur.execute(MIGRATIONS_DDL)
+    cur.execute("SELECT id FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _record(cur, migration_id, description):
+    cur.execute(
+        "INSERT INTO schema_migrations (id, description) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        (migration_id, description),
+    )
+
+
+def is_partitioned(cur, table="facts"):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", (table,))
+    return cur.fetchone()[0] == "p"
+
+
+def apply_migrations(conn, concurrently=False):
+    """Apply pending index migrations. Returns the ids that were applied.
+
+    With `concurrently` the indexes are built without blocking writers; that
+    needs autocommit, so each statement commits on its own.
+    """
+    applied = []
+    if concurrently:
+        conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            done = applied_migrations(cur)
+            # CONCURRENTLY is not supported on partitioned parents
+            use_concurrently = concurrently and not is_partitioned(cur)
+            for migration_id, description, _, statements in MIGRATIONS:
+                if migration_id in done:
+                    continue
+                for stmt in statements:
+                    cur.execute(stmt.format(concurrently="CONCURRENTLY" if use_concurrently else ""))
+                _record(cur, migration_id, description)
+                applied.append(migration_id)
+                print(f"[OK] Applied {migration_id}: {description}")
+        if not concurrently:
+            conn.commit()
+    except Exception:
+        if not concurrently:
+            conn.rollback()
+        raise
+    finally:
+        conn.autocommit = False
+    return applied
+
+
+def partition_facts(conn, partitions):
+    """Rebuild `facts` as a table hash-partitioned by region_id, in one transaction.
+
+    Queries with `region_id = ...` are pruned to a single partition, and each
+    partition's indexes stay small enough to remain cached.
+    """
+    try:
+        with conn.cursor() as cur:
+            if PARTITION_MIGRATION in applied_migrations(cur) or is_partitioned(cur):
+                print("[INFO] facts is already partitioned, skipping.")
+                return False
+
+            # Same primary key and secondary indexes as the table being replaced
+            cur.execute("SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+                        "WHERE conrelid = 'facts'::regclass AND contype = 'p'")
+            primary_key = cur.fetchone()
+            cur.execute("SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+                        "WHERE indrelid = 'facts'::regclass AND NOT indisprimary")
+            indexes = [row[0] for row in cur.fetchall()]
+
+            cur.execute(
+                "CREATE TABLE facts_partitioned (LIKE facts INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                "PARTITION BY HASH (region_id)"
+            )
+            for i in range(partitions):
+                cur.execute(
+                    f"CREATE TABLE facts_p{i} PARTITION OF facts_partitioned "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+                )
+            cur.execute("INSERT INTO facts_partitioned SELECT * FROM facts")
+            cur.execute("DROP TABLE facts")
+            cur.execute("ALTER TABLE facts_partitioned RENAME TO facts")
+            if primary_key:
+                cur.execute(f"ALTER TABLE facts ADD {primary_key[0]}")
+            # The definitions name `facts`, which is now the partitioned table
+            for index in indexes:
+                cur.execute(index)
+            _record(cur, PARTITION_MIGRATION, f"hash-partition facts by region_id into {partitions}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"[OK] Applied {PARTITION_MIGRATION}: {partitions} partitions")
+    return True
+
+
+def explain_analyze(cur, sql, params, runs=5):
+    """Run EXPLAIN ANALYZE `runs` times; return the median timing and the plan's access path"""
+    timings = []
+    plan = None
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        raw = cur.fetchone()[0]
+        result = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+        timings.append(result["Execution Time"])
+        plan = result["Plan"]
+    return {
+        "execution_ms": round(statistics.median(timings), 3),
+        "planning_ms": round(result["Planning Time"], 3),
+        "access": _access_paths(plan),
+    }
+
+
+def _access_paths(node):
+    """Node types that touch a relation, e.g. ["Index Only Scan facts_metric_region_year_idx"]"""
+    paths = []
+    if "Relation Name" in node or "Index Name" in node:
+        # fold per-partition index names (facts_p3_...) into one entry
+        index = re.sub(r"^facts_p\d+_", "facts_p*_", node.get("Index Name", ""))
+        paths.append(" ".join(filter(None, [node["Node Type"], index])))
+    for child in node.get("Plans", []):
+        paths.extend(_access_paths(child))
+    return sorted(set(paths))
+
+
+# --- BENCHMARK ---
+BENCH_SCHEMA = "polmatrix_bench"
+
+
+def generate_bench_data(cur, regions, years, metrics, first_year=1990, quarterly=False):
+    """Create facts/time in the bench schema and fill them with generate_series.
+
+    With `quarterly` every year also gets four quarter rows per metric (5x the facts).
+    """
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+    cur.execute("""
+        CREATE TABLE facts (
+            region_id   VARCHAR(10),
+            year        INTEGER,
+            quarter     SMALLINT NOT NULL DEFAULT 0,
+            metric_code VARCHAR(50),
+            value       NUMERIC,
+            PRIMARY KEY (region_id, year, quarter, metric_code)
+        )
+    """)
+    cur.execute("""
+        INSERT INTO facts (region_id, year, quarter, metric_code, value)
+        SELECT 'R' || r, %(first_year)s + y, q, 'metric_' || m, round((random() * 100)::numeric, 4)
+          FROM generate_series(0, %(regions)s - 1) r,
+               generate_series(0, %(years)s - 1) y,
+               generate_series(0, %(last_quarter)s) q,
+               generate_series(0, %(metrics)s - 1) m
+    """, {"regions": regions, "years": years, "metrics": metrics, "first_year": first_year,
+          "last_quarter": 4 if quarterly else 0})
+    cur.execute("CREATE TABLE time (time_id SERIAL PRIMARY KEY, year INTEGER, quarter INTEGER)")
+    cur.execute("""
+        INSERT INTO time (year, quarter)
+        SELECT %(first_year)s + y, q
+          FROM generate_series(0, %(years)s - 1) y,
+               (SELECT NULL::int AS q UNION ALL SELECT generate_series(1, 4)) quarters
+    """, {"years": years, "first_year": first_year})
+
+
+def vacuum_analyze(conn, tables=("facts", "time")):
+    """VACUUM ANALYZE outside a transaction so index-only scans see a fresh visibility map"""
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for table in tables:
+                cur.execute(f"VACUUM ANALYZE {table}")
+    finally:
+        conn.autocommit = False
+
+
+def run_hot_queries(cur, params, runs):
+    return {name: explain_analyze(cur, sql, params, runs) for name, sql in HOT_QUERIES.items()}
+
+
+def bench(conn, regions, years, metrics, runs=5, partitions=None, keep=False, quarterly=False):
+    """EXPLAIN ANALYZE the hot queries on generated data, before and after migrating"""
+    first_year = 1990
+    params = {
+        "region": f"R{regions // 2}",
+        "start_year": first_year + years // 2,
+        "metrics": [f"metric_{m}" for m in range(min(3, metrics))],
+        "metric_tuple": tuple(f"metric_{m}" for m in range(min(4, metrics))),
+        "years": list(range(first_year, first_year + years)),
+    }
+    report = {"rows": regions * years * metrics * (5 if quarterly else 1)}
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            generate_bench_data(cur, regions, years, metrics, first_year, quarterly)
+            conn.commit()
+            vacuum_analyze(conn)
+            print(f"[INFO] Generated {report['rows']} fact rows in {time.perf_counter() - started:.1f}s")
+            report["baseline"] = run_hot_queries(cur, params, runs)
+
+        # search_path was committed with the data, so migrations land in the bench schema
+        apply_migrations(conn)
+        vacuum_analyze(conn)
+        with conn.cursor() as cur:
+            report["indexed"] = run_hot_queries(cur, params, runs)
+
+        if partitions:
+            partition_facts(conn, partitions)
+            vacuum_analyze(conn)
+            with conn.cursor() as cur:
+                report["partitioned"] = run_hot_queries(cur, params, runs)
+    finally:
+        conn.rollback()
+        if not keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+    return report
+
+
+def print_report(report):
+    stages = [s for s in ("baseline", "indexed", "partitioned") if s in report]
+    print(f"\nfacts rows: {report['rows']}")
+    for name in HOT_QUERIES:
+        print(f"\n{name}")
+        for stage in stages:
+            r = report[stage][name]
+            print(f"  {stage:<12} {r['execution_ms']:>10.3f} ms   {', '.join(r['access'])}")
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage facts/time indexes and benchmark hot queries")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status", help="list applied and pending migrations")
+
+    migrate = sub.add_parser("migrate", help="apply pending migrations")
+    migrate.add_argument("--concurrently", action="store_true",
+                         help="build indexes without blocking writes")
+    migrate.add_argument("--partition", type=int, metavar="N",
+                         help="also hash-partition facts by region_id into N partitions")
+
+    bench_cmd = sub.add_parser("bench", help="EXPLAIN ANALYZE hot queries on generated data")
+    bench_cmd.add_argument("--regions", type=int, default=200)
+    bench_cmd.add_argument("--years", type=int, default=40)
+    bench_cmd.add_argument("--metrics", type=int, default=20)
+    bench_cmd.add_argument("--runs", type=int, default=5)
+    bench_cmd.add_argument("--partition", type=int, metavar="N")
+    bench_cmd.add_argument("--quarterly", action="store_true", help="also generate quarterly facts (5x rows)")
+    bench_cmd.add_argument("--keep", action="store_true", help=f"keep the {BENCH_SCHEMA} schema")
+    bench_cmd.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    args = parser.parse_args(argv)
+    conn = get_connection()
+    try:
+        if args.command == "status":
+            with conn.cursor() as cur:
+                done = applied_migrations(cur)
+            conn.commit()
+            for migration_id, description, _, _ in MIGRATIONS:
+                mark = "x" if migration_id in done else " "
+                print(f"[{mark}] {migration_id}: {description}")
+            mark = "x" if PARTITION_MIGRATION in done else " "
+            print(f"[{mark}] {PARTITION_MIGRATION}: optional, via migrate --partition N")
+        elif args.command == "migrate":
+            if args.partition:
+                partition_facts(conn, args.partition)
+            apply_migrations(conn, concurrently=args.concurrently)
+        else:
+            report = bench(conn, args.regions, args.years, args.metrics,
+                           runs=args.runs, partitions=args.partition, keep=args.keep,
+                           quarterly=args.quarterly)
+            if args.json:
+                print(json.dumps(report, indent=2))
+            else:
+                print_report(report)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# stream_json.py
+#
+# Incremental JSON parsing for large API payloads (WHO GHO, UN SDG).
+#
+# Items are parsed straight off the HTTP response stream with ijson and handed
+# out as pandas DataFrames of `batch_size` rows, so memory stays flat no matter
+# how many countries/years a payload contains. Numbers are extracted with
+# vectorized pandas string/numeric parsing instead of one regex per fact.
+import re
+
+import ijson
+import pandas as pd
+import requests
+
+# --- CONFIGURATION ---
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_TIMEOUT = 120
+HEAD_BYTES = 300
+
+# Leading float, e.g. "23.3" from "23.3 [15.0-34.2]"
+LEADING_FLOAT = r"^\s*([0-9]+(?:\.[0-9]+)?)"
+
+# WHO sometimes returns "{ , }" for no-data stubs
+EMPTY_STUB = re.compile(rb"\{\s*,\s*\}")
+
+# ijson prefixes of the item arrays in each API's payload
+GHO_FACTS = "fact.item"
+SDG_DATA = "data.item"
+
+
+class NonJSONResponse(Exception):
+    """Raised when a streamed payload turns out not to be (valid) JSON"""
+
+    def __init__(self, status_code, head, empty_stub=False):
+        self.status_code = status_code
+        self.head = head.decode("utf-8", errors="replace")
+        self.empty_stub = empty_stub
+        super().__init__(f"HTTP {status_code}: {self.head.replace(chr(10), ' ')}")
+
+
+class _HeadRecorder:
+    """File-like wrapper that remembers the first bytes read, for error messages"""
+
+    def __init__(self, raw, keep=HEAD_BYTES):
+        self.raw = raw
+        self.keep = keep
+        self.head = b""
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if len(self.head) < self.keep:
+            self.head += data[:self.keep - len(self.head)]
+        return data
+
+
+# --- STREAMING ---
+def open_stream(url, params=None, timeout=DEFAULT_TIMEOUT):
+    """GET `url` without buffering the body. Use as a context manager."""
+    resp = requests.get(url, params=params, stream=True, timeout=timeout)
+    # let urllib3 undo gzip/deflate so ijson sees plain JSON bytes
+    resp.raw.decode_content = True
+    return resp
+
+
+def iter_items(resp, prefix):
+    """Yield the JSON objects under `prefix` one at a time as they arrive"""
+    source = _HeadRecorder(resp.raw)
+    try:
+        yield from ijson.items(source, prefix, use_float=True)
+    except ijson.JSONError:
+        raise NonJSONResponse(
+            resp.status_code, source.head,
+            empty_stub=bool(EMPTY_STUB.fullmatch(source.head.strip()))
+        ) from None
+
+
+def iter_batches(items, batch_size=DEFAULT_BATCH_SIZE):
+    """Group an item iterator into lists of at most `batch_size` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- VECTORIZED PARSING ---
+def extract_leading_floats(values):
+    """Leading float of every value as a float Series (NaN when there is none)"""
+    raw = pd.Series(values, dtype="object")
+    numeric = pd.to_numeric(raw, errors="coerce")
+    text_mask = numeric.isna() & raw.notna()
+    if text_mask.any():
+        extracted = raw[text_mask].astype(str).str.extract(LEADING_FLOAT, expand=False)
+        numeric[text_mask] = pd.to_numeric(extracted, errors="coerce")
+    return numeric.astype("float64")
+
+
+def _finish(frame, years):
+    frame["year"] = pd.to_numeric(frame["year"], errors="coerce")
+    frame = frame.dropna(subset=["year", "value"])
+    frame = frame.astype({"year": "int64"})
+    if years is not None:
+        frame = frame[frame["year"].isin(years)]
+    return frame
+
+
+def iter_gho_frames(resp, years=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream a WHO GHO ("profile=simple") response as DataFrames of country, year, value"""
+    for batch in iter_batches(iter_items(resp, GHO_FACTS), batch_size):
+        dims = [fact.get("dim") or {} for fact in batch]
+        frame = pd.DataFrame({
+            "country": [dim.get("COUNTRY") for dim in dims],
+            "year": [dim.get("YEAR") for dim in dims],
+            "value": extract_leading_floats([fact.get("Value") for fact in batch]),
+        })
+        yield _finish(frame, years)
+
+
+def iter_sdg_frames(resp, years=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream a UN SDG indicator data response as DataFrames of area, year, value"""
+    for batch in iter_batches(iter_items(resp, SDG_DATA), batch_size):
+        frame = pd.DataFrame({
+            "area": [entry.get("geoAreaCode") for entry in batch],
+            "year": [entry.get("timePeriod") for entry in batch],
+            "value": pd.to_numeric(pd.Series([entry.get("value") for entry in batch],
+                                             dtype="object"), errors="coerce"),
+        })
+        yield _finish(frame, years)
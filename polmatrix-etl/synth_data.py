@@ -0,0 +1,419 @@
+# synth_data.py
+#
+# Deterministic synthetic data at configurable scale, for performance testing.
+#
+# Generates regions x years x metrics series with plausible levels, trends and
+# autocorrelated noise, plus the gaps real sources have (series starting late,
+# the latest years not yet published, scattered missing years as in
+# missing_year.csv). The same data is written in three shapes:
+#
+#   facts        long facts(region_id, year, quarter, metric_code, value)
+#   training     wide training_data.csv layout (year, region, <model metric>...)
+#   domain       geography, time and economy/education/environment/health rows
+#                the way the fetchers write them (one indicator per row)
+#
+# "Today's volume" is 1 region x 24 years x every known metric; --scale N
+# generates N regions. --quarterly adds four seasonal quarter rows around every
+# annual value (5x the facts and domain rows). Output for a given seed is
+# identical regardless of --chunk-regions.
+#
+# Usage:
+#   python synth_data.py --scale 100 --out synth/                   # CSV
+#   python synth_data.py --scale 1000 --format parquet --out synth/
+#   python synth_data.py --scale 1000 --format postgres             # schema polmatrix_synth
+#   python synth_data.py --scale 100 --quarterly --out synth/        # plus quarterly rows
+#   PGOPTIONS="-c search_path=polmatrix_synth" python facts_sync.py  # run a job against it
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from facts_loader import get_connection, upsert_facts
+from facts_sync import DOMAIN_METRICS
+
+# --- CONFIGURATION ---
+DEFAULT_SEED = 42
+DEFAULT_FIRST_YEAR = 2000
+DEFAULT_YEARS = 24
+DEFAULT_CHUNK_REGIONS = 500
+DEFAULT_SCHEMA = "polmatrix_synth"
+
+# Metrics the forecast models are trained on (training_data.csv columns)
+MODEL_METRICS = ["co2_emissions", "education_index", "gdp", "green_jobs", "health_index", "spending"]
+
+# metric_code -> (level, yearly growth, noise as a fraction of level, min, max, scales with region size)
+PROFILES = {
+    "gdp":                         (20.0,    0.025, 0.02,  0.0,    None,  True),
+    "education_index":             (0.85,    0.004, 0.01,  0.0,    1.0,   False),
+    "health_index":                (0.80,    0.004, 0.01,  0.0,    1.0,   False),
+    "co2_emissions":               (15.0,   -0.010, 0.03,  0.0,    None,  True),
+    "green_jobs":                  (0.60,    0.050, 0.04,  0.0,    None,  True),
+    "spending":                    (0.22,    0.010, 0.03,  0.0,    1.0,   False),
+    "gdp_growth_rate":             (2.5,     0.0,   0.60, -15.0,   20.0,  False),
+    "unemployment_rate":           (5.5,     0.0,   0.15,  0.5,    40.0,  False),
+    "inflation_rate":              (2.5,     0.0,   0.40, -5.0,    50.0,  False),
+    "trade_balance":               (-50.0,   0.020, 0.20,  None,   None,  True),
+    "foreign_direct_investment":   (30.0,    0.030, 0.25,  0.0,    None,  True),
+    "gdp_per_capita":              (45000.0, 0.020, 0.02,  300.0,  None,  False),
+    "primary_completion_rate":     (92.0,    0.002, 0.02,  0.0,    100.0, False),
+    "secondary_enrollment":        (88.0,    0.003, 0.02,  0.0,    100.0, False),
+    "pupil_teacher_ratio":         (16.0,   -0.005, 0.03,  5.0,    60.0,  False),
+    "ch4_emissions":               (600.0,  -0.005, 0.03,  0.0,    None,  True),
+    "n2o_emissions":               (250.0,  -0.003, 0.03,  0.0,    None,  True),
+    "renewable_energy_percentage": (12.0,    0.040, 0.04,  0.0,    100.0, False),
+    "forest_area_percentage":      (33.0,   -0.001, 0.005, 0.0,    100.0, False),
+    "pm25":                        (9.0,    -0.010, 0.08,  1.0,    None,  False),
+    "life_expectancy":             (77.0,    0.002, 0.005, 40.0,   90.0,  False),
+    "infant_mortality_rate":       (6.0,    -0.020, 0.04,  1.0,    None,  False),
+    "maternal_mortality_rate":     (20.0,   -0.020, 0.06,  1.0,    None,  False),
+    "health_expenditure_pct_gdp":  (16.0,    0.010, 0.02,  1.0,    30.0,  False),
+}
+SYNTHETIC_PROFILE = (100.0, 0.01, 0.05, 0.0, None, False)
+
+# Gap model
+P_LATE_START = 0.20      # series whose coverage starts up to half the span late
+P_PUBLICATION_LAG = 0.30 # series missing their last 1-2 years
+P_NO_SERIES = 0.02       # region has no data at all for the metric
+GAP_RATE = 0.04          # scattered missing years inside the covered span
+AR_COEFF = 0.6           # autocorrelation of the noise
+
+# Quarter value = annual value x factor; the factors average to 1
+SEASONALITY = np.array([0.985, 1.005, 1.015, 0.995])
+
+# Domain table -> metric_code -> column, the inverse of facts_sync.DOMAIN_METRICS
+DOMAIN_COLUMNS = {table: {m: c for c, m in cols.items()} for table, cols in DOMAIN_METRICS.items()}
+
+DOMAIN_DDL = """
+CREATE TABLE {table} (
+    id             SERIAL PRIMARY KEY,
+    geography_id   INTEGER,
+    time_id        INTEGER,
+    indicator_code TEXT,
+    {columns},
+    source         TEXT,
+    UNIQUE (geography_id, time_id, indicator_code)
+)
+"""
+
+
+def default_metrics():
+    """Every metric the pipeline knows: model metrics first, then domain metrics"""
+    domain = [m for cols in DOMAIN_METRICS.values() for m in cols.values()]
+    return list(dict.fromkeys(MODEL_METRICS + domain))
+
+
+def pick_metrics(n_metrics=None):
+    """First `n_metrics` known metrics, padded with synthetic_metric_NNN if more are asked for"""
+    metrics = default_metrics()
+    if n_metrics is None:
+        return metrics
+    extra = [f"synthetic_metric_{i:03d}" for i in range(max(n_metrics - len(metrics), 0))]
+    return (metrics + extra)[:n_metrics]
+
+
+def region_codes(n_regions):
+    """(region_id, country_code) pairs; the first region is the real US so models apply"""
+    regions = [("US", "USA")] if n_regions else []
+    regions += [(f"R{i:05d}", f"R{i:05d}") for i in range(1, n_regions)]
+    return regions
+
+
+def _bounds(metrics):
+    """(lo, hi) arrays of each metric's value range, +-inf where unbounded"""
+    lo = np.array([PROFILES.get(m, SYNTHETIC_PROFILE)[3] for m in metrics], dtype=float)
+    hi = np.array([PROFILES.get(m, SYNTHETIC_PROFILE)[4] for m in metrics], dtype=float)
+    return np.nan_to_num(lo, nan=-np.inf), np.nan_to_num(hi, nan=np.inf)
+
+
+def generate_region(seed, region_index, metrics, years):
+    """(values, present) arrays of shape (metrics, years) for one region"""
+    rng = np.random.default_rng([seed, region_index])
+    n_metrics, n_years = len(metrics), len(years)
+    profiles = np.array([PROFILES.get(m, SYNTHETIC_PROFILE)[:3] for m in metrics])
+    level, growth, noise = profiles.T
+    extensive = np.array([PROFILES.get(m, SYNTHETIC_PROFILE)[5] for m in metrics])
+
+    # Region size scales extensive metrics (lognormal, like country GDPs); the
+    # first region keeps US-like levels
+    size = 1.0 if region_index == 0 else rng.lognormal(-2.0, 1.5)
+    offset = 1.0 if region_index == 0 else 1.0 + 0.1 * rng.standard_normal(n_metrics)
+    base = level * np.where(extensive, size, offset)
+    rate = growth + (0.0 if region_index == 0 else 0.005 * rng.standard_normal(n_metrics))
+    t = np.arange(n_years)
+    trend = base[:, None] * (1.0 + rate[:, None]) ** t
+
+    shocks = rng.standard_normal((n_metrics, n_years)) * noise[:, None]
+    ar = np.empty_like(shocks)
+    ar[:, 0] = shocks[:, 0]
+    for j in range(1, n_years):
+        ar[:, j] = AR_COEFF * ar[:, j - 1] + shocks[:, j]
+    values = trend + np.abs(base)[:, None] * ar
+
+    lo, hi = _bounds(metrics)
+    values = np.clip(values, lo[:, None], hi[:, None])
+
+    start = np.where(rng.random(n_metrics) < P_LATE_START,
+                     rng.integers(1, max(n_years // 2, 1) + 1, n_metrics), 0)
+    stop = n_years - np.where(rng.random(n_metrics) < P_PUBLICATION_LAG,
+                              rng.integers(1, 3, n_metrics), 0)
+    present = (t >= start[:, None]) & (t < stop[:, None]) & (rng.random((n_metrics, n_years)) >= GAP_RATE)
+    present &= (rng.random(n_metrics) >= P_NO_SERIES)[:, None]
+    return np.round(values, 4), present
+
+
+def iter_fact_chunks(seed, n_regions, metrics, years, chunk_regions=DEFAULT_CHUNK_REGIONS, quarterly=False):
+    """Long fact DataFrames, `chunk_regions` regions at a time, sorted by (region, metric, year, quarter)"""
+    regions = region_codes(n_regions)
+    metric_index = np.arange(len(metrics))
+    year_array = np.asarray(years)
+    for lo in range(0, n_regions, chunk_regions):
+        region_col, metric_col, year_col, value_col = [], [], [], []
+        for r in range(lo, min(lo + chunk_regions, n_regions)):
+            values, present = generate_region(seed, r, metrics, years)
+            m_idx, y_idx = np.nonzero(present)
+            region_col.append(np.full(len(m_idx), r))
+            metric_col.append(metric_index[m_idx])
+            year_col.append(year_array[y_idx])
+            value_col.append(values[m_idx, y_idx])
+        region_idx = np.concatenate(region_col)
+        facts = pd.DataFrame({
+            "region_id": pd.Categorical.from_codes(region_idx, [rid for rid, _ in regions]),
+            "year": np.concatenate(year_col),
+            "quarter": np.zeros(len(region_idx), dtype=np.int64),
+            "metric_code": pd.Categorical.from_codes(np.concatenate(metric_col), metrics),
+            "value": np.concatenate(value_col),
+        })
+        if quarterly:
+            facts = pd.concat([facts, quarter_facts(facts)], ignore_index=True)
+            order = np.lexsort((facts["quarter"], facts["year"], facts["metric_code"].cat.codes,
+                                facts["region_id"].cat.codes))
+            facts = facts.iloc[order].reset_index(drop=True)
+        yield facts
+
+
+def quarter_facts(facts):
+    """Four seasonal quarter rows per annual fact row"""
+    out = facts.iloc[np.repeat(np.arange(len(facts)), 4)].reset_index(drop=True)
+    quarters = np.tile(np.arange(1, 5), len(facts))
+    lo, hi = _bounds(facts["metric_code"].cat.categories)
+    codes = out["metric_code"].cat.codes.to_numpy()
+    out["quarter"] = quarters
+    out["value"] = np.round(np.clip(out["value"].to_numpy() * SEASONALITY[quarters - 1], lo[codes], hi[codes]), 4)
+    return out
+
+
+# --- SHAPES ---
+def to_training(facts):
+    """Wide training_data.csv rows for complete (year, region) observations of the model metrics"""
+    subset = facts[facts["metric_code"].isin(MODEL_METRICS) & (facts["quarter"] == 0)]
+    wide = subset.pivot_table(index=["year", "region_id"], columns="metric_code",
+                              values="value", observed=True).reset_index()
+    wide = wide.rename(columns={"region_id": "region"})
+    wide.columns.name = None
+    present = [m for m in MODEL_METRICS if m in wide.columns]
+    return wide[["year", "region"] + present].dropna().sort_values(["region", "year"])
+
+
+def geography_frame(n_regions):
+    regions = region_codes(n_regions)
+    return pd.DataFrame({
+        "geography_id": np.arange(1, n_regions + 1),
+        "country_name": ["United States" if rid == "US" else f"Synthetic region {rid}" for rid, _ in regions],
+        "country_code": [code for _, code in regions],
+        "region": ["North America" if rid == "US" else "Synthetic" for rid, _ in regions],
+    })
+
+
+def time_frame(years):
+    """One annual row (quarter NULL) and four quarterly rows per year"""
+    rows = [(year, q) for year in years for q in (None, 1, 2, 3, 4)]
+    df = pd.DataFrame(rows, columns=["year", "quarter"])
+    df.insert(0, "time_id", np.arange(1, len(df) + 1))
+    df["quarter"] = df["quarter"].astype("Int64")
+    return df
+
+
+def to_domain(facts, years):
+    """{table: rows} in the fetchers' shape, one indicator (metric column) per row"""
+    region_ids = {rid: i + 1 for i, rid in enumerate(facts["region_id"].cat.categories)}
+    annual_time_id = {year: 1 + 5 * i for i, year in enumerate(years)}
+    tables = {}
+    for table, columns in DOMAIN_COLUMNS.items():
+        rows = facts[facts["metric_code"].isin(list(columns))]
+        if rows.empty:
+            continue
+        metric = rows["metric_code"].astype(str)
+        df = pd.DataFrame({
+            "geography_id": rows["region_id"].astype(str).map(region_ids).to_numpy(),
+            "time_id": rows["year"].map(annual_time_id).to_numpy() + rows["quarter"].to_numpy(),
+            "indicator_code": ("SYN." + metric.map(columns).str.upper()).to_numpy(),
+        })
+        for metric_code, column in columns.items():
+            df[column] = np.where(metric.to_numpy() == metric_code, rows["value"].to_numpy(), np.nan)
+        df["source"] = "Synthetic"
+        tables[table] = df
+    return tables
+
+
+# --- WRITERS ---
+class FileWriter:
+    """Appends chunks to <out>/<name>.csv or .parquet"""
+
+    def __init__(self, out_dir, fmt):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.rows = {}
+        self._parquet = {}
+        os.makedirs(out_dir, exist_ok=True)
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise SystemExit("[ERROR] --format parquet needs pyarrow (pip install pyarrow)")
+
+    def write(self, name, df):
+        df = df.astype({c: str for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+        path = os.path.join(self.out_dir, f"{name}.{self.fmt}")
+        if self.fmt == "csv":
+            df.to_csv(path, mode="a" if name in self.rows else "w", header=name not in self.rows, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if name not in self._parquet:
+                self._parquet[name] = pq.ParquetWriter(path, table.schema)
+            self._parquet[name].write_table(table.cast(self._parquet[name].schema))
+        self.rows[name] = self.rows.get(name, 0) + len(df)
+
+    def close(self):
+        for writer in self._parquet.values():
+            writer.close()
+
+
+class PostgresWriter:
+    """Recreates `schema` with facts, geography, time and the domain tables, then COPYs chunks in"""
+
+    def __init__(self, conn, schema):
+        self.conn = conn
+        self.schema = schema
+        self.rows = {}
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET search_path TO {schema}")
+            cur.execute("""
+                CREATE TABLE facts (
+                    region_id   VARCHAR(10),
+                    year        INTEGER,
+                    quarter     SMALLINT NOT NULL DEFAULT 0 CHECK (quarter BETWEEN 0 AND 4),
+                    metric_code VARCHAR(50),
+                    value       NUMERIC,
+                    PRIMARY KEY (region_id, year, quarter, metric_code)
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE geography (
+                    geography_id SERIAL PRIMARY KEY,
+                    country_name TEXT,
+                    country_code TEXT UNIQUE,
+                    region       TEXT
+                )
+            """)
+            cur.execute("CREATE TABLE time (time_id SERIAL PRIMARY KEY, year INTEGER, quarter INTEGER)")
+            for table, columns in DOMAIN_COLUMNS.items():
+                cur.execute(DOMAIN_DDL.format(
+                    table=table, columns=",\n    ".join(f"{c} NUMERIC" for c in columns.values())
+                ))
+
+    def write(self, name, df):
+        if name == "training":
+            return  # derived from facts by extract_training_data.py
+        if name == "facts":
+            staged = upsert_facts(self.conn, [df])
+        else:
+            buf = io.StringIO()
+            df.to_csv(buf, header=False, index=False)
+            buf.seek(0)
+            with self.conn.cursor() as cur:
+                cur.copy_expert(f"COPY {name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+            staged = len(df)
+        self.rows[name] = self.rows.get(name, 0) + staged
+
+    def close(self):
+        with self.conn.cursor() as cur:
+            # Serial ids continue after the explicit ones written above
+            for table, column in (("geography", "geography_id"), ("time", "time_id")):
+                cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                            f"(SELECT COALESCE(MAX({column}), 1) FROM {table}))")
+        self.conn.commit()
+
+
+def generate(writer, seed, n_regions, metrics, years, chunk_regions=DEFAULT_CHUNK_REGIONS,
+             shapes=("facts", "training", "domain"), quarterly=False):
+    """Generate every requested shape into `writer`; returns {name: rows}"""
+    if "domain" in shapes:
+        writer.write("geography", geography_frame(n_regions))
+        writer.write("time", time_frame(years))
+    for facts in iter_fact_chunks(seed, n_regions, metrics, years, chunk_regions, quarterly):
+        if "facts" in shapes:
+            writer.write("facts", facts)
+        if "training" in shapes:
+            writer.write("training", to_training(facts))
+        if "domain" in shapes:
+            for table, df in to_domain(facts, years).items():
+                writer.write(table, df)
+    writer.close()
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic PolMatrix data")
+    parser.add_argument("--scale", type=int, default=1, help="Multiple of today's volume (regions)")
+    parser.add_argument("--regions", type=int, help="Region count (overrides --scale)")
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS)
+    parser.add_argument("--first-year", type=int, default=DEFAULT_FIRST_YEAR)
+    parser.add_argument("--metrics", type=int, help="Metric count (default: every known metric)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--format", choices=["csv", "parquet", "postgres"], default="csv", dest="fmt")
+    parser.add_argument("--out", default="synth", help="Output directory for csv/parquet")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help="Target schema for postgres (recreated)")
+    parser.add_argument("--shapes", default="facts,training,domain",
+                        help="Comma-separated subset of facts,training,domain")
+    parser.add_argument("--chunk-regions", type=int, default=DEFAULT_CHUNK_REGIONS)
+    parser.add_argument("--quarterly", action="store_true", help="Also generate quarterly rows (5x volume)")
+    args = parser.parse_args(argv)
+
+    n_regions = args.regions if args.regions is not None else args.scale
+    metrics = pick_metrics(args.metrics)
+    years = list(range(args.first_year, args.first_year + args.years))
+    shapes = tuple(s.strip() for s in args.shapes.split(",") if s.strip())
+
+    if args.fmt == "postgres":
+        if args.schema == "public":
+            raise SystemExit("[ERROR] Refusing to recreate the public schema; pick another --schema")
+        conn = get_connection()
+        writer = PostgresWriter(conn, args.schema)
+        target = f"schema {args.schema}"
+    else:
+        conn = None
+        writer = FileWriter(args.out, args.fmt)
+        target = args.out
+
+    print(f"[INFO] Generating {n_regions} regions x {len(years)} years x {len(metrics)} metrics "
+          f"(seed {args.seed}) -> {target}")
+    started = time.perf_counter()
+    try:
+        rows = generate(writer, args.seed, n_regions, metrics, years, args.chunk_regions, shapes, args.quarterly)
+    finally:
+        if conn is not None:
+            conn.close()
+    for name, count in rows.items():
+        print(f"[OK] {name}: {count} rows")
+    print(f"[OK] Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# baseline_grid.py
+#
+# Precomputed baseline forecasts (no levers, default context) for every model.
+#
+# The grid is a float64 array of shape (n_models, n_years) stored as
+# models/baseline_grid.npy and opened memory-mapped, plus a JSON header with
+# the model order, year span and the manifest version it was built from.
+# /forecast answers requests without custom context by slicing a row.
+#
+# Usage:
+#   python baseline_grid.py --from 2000 --to 2060
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from model_manifest import build_manifest, load_manifest, manifest_version
+from model_runner import MODELS_DIR, build_features, check_models, load_model
+
+logger = logging.getLogger(__name__)
+
+GRID_PATH = os.path.join(MODELS_DIR, "baseline_grid.npy")
+HEADER_PATH = os.path.join(MODELS_DIR, "baseline_grid.json")
+
+DEFAULT_FIRST_YEAR = 2000
+DEFAULT_LAST_YEAR = 2060
+
+
+def materialize(first_year=DEFAULT_FIRST_YEAR, last_year=DEFAULT_LAST_YEAR,
+                grid_path=GRID_PATH, header_path=HEADER_PATH):
+    """Predict every model's baseline over [first_year, last_year] and write the grid"""
+    manifest = load_manifest()
+    names = sorted(manifest["models"])
+    years = list(range(first_year, last_year + 1))
+
+    tmp_grid = f"{grid_path}.tmp.npy"
+    grid = np.lib.format.open_memmap(tmp_grid, mode="w+", dtype=np.float64,
+                                     shape=(len(names), len(years)))
+    for i, name in enumerate(names):
+        entry = manifest["models"][name]
+        model = load_model(entry["metric"], entry["region"])
+        # Same rounding as predict_future, so grid hits are identical to live results
+        predicted = model.predict(build_features(entry["metric"], years, {}))
+        grid[i] = [round(float(y), 2) for y in predicted]
+    grid.flush()
+    del grid
+
+    header = {
+        "manifest_version": manifest_version(manifest),
+        "first_year": first_year,
+        "last_year": last_year,
+        "models": names,
+        "created_at": time.time(),
+    }
+    tmp_header = f"{header_path}.tmp"
+    with open(tmp_header, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_grid, grid_path)
+    os.replace(tmp_header, header_path)
+    print(f"✅ Baseline grid: {len(names)} models x {len(years)} years -> {grid_path}")
+    return header
+
+
+class BaselineGrid:
+    """Read-only, memory-mapped view of a materialized grid"""
+
+    def __init__(self, grid, header):
+        self.grid = grid
+        self.header = header
+        self.first_year = header["first_year"]
+        self.last_year = header["last_year"]
+        self.rows = {name: i for i, name in enumerate(header["models"])}
+
+    @classmethod
+    def open(cls, grid_path=GRID_PATH, header_path=HEADER_PATH, expected_version=None):
+        """Open the grid, or return None if it is missing or built from other models"""
+        if not (os.path.exists(grid_path) and os.path.exists(header_path)):
+            return None
+        with open(header_path, encoding="utf-8") as f:
+            header = json.load(f)
+        if expected_version is not None and header["manifest_version"] != expected_version:
+            logger.warning(f"Baseline grid is stale (built for {header['manifest_version']}, "
+                           f"models are {expected_version}); ignoring it")
+            return None
+        return cls(np.load(grid_path, mmap_mode="r"), header)
+
+    def lookup(self, metric, region, start_year, end_year):
+        """predict_future-shaped rows for an exact hit, or None"""
+        row = self.rows.get(f"{metric}_{region}")
+        if row is None or start_year < self.first_year or end_year > self.last_year:
+            return None
+        lo = start_year - self.first_year
+        values = self.grid[row, lo:lo + end_year - start_year + 1]
+        return [
+            {"year": start_year + t, "region": region, metric: float(v)}
+            for t, v in enumerate(values)
+        ]
+
+
+_grid = None
+_grid_loaded = False
+
+
+def get_grid():
+    """The current grid, or None when there is no valid grid.
+
+    Opened once and reopened by reload_grid(), which main.py registers with
+    on_models_reloaded so a retrain or a rebuilt grid (seen by check_models)
+    takes effect without /admin/reload_models.
+    """
+    global _grid, _grid_loaded
+    check_models()
+    if not _grid_loaded:
+        reload_grid()
+    return _grid
+
+
+def reload_grid():
+    global _grid, _grid_loaded
+    try:
+        # Versioned from the model files on disk, in case manifest.json was not rewritten
+        _grid = BaselineGrid.open(expected_version=manifest_version(build_manifest()))
+    except Exception as e:
+        logger.error(f"Could not open baseline grid: {e}")
+        _grid = None
+    _grid_loaded = True
+    if _grid is not None:
+        logger.info(f"Baseline grid loaded: {len(_grid.rows)} models, "
+                    f"{_grid.first_year}-{_grid.last_year}")
+    return _grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute baseline forecasts for every model")
+    parser.add_argument("--from", dest="first_year", type=int, default=DEFAULT_FIRST_YEAR)
+    parser.add_argument("--to", dest="last_year", type=int, default=DEFAULT_LAST_YEAR)
+    args = parser.parse_args(argv)
+    materialize(args.first_year, args.last_year)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench_profiling.py
+#
+# Checks that request profiling (profiling.py) costs next to nothing while it
+# is off, and shows what it costs while on.
+#
+# Sends --requests /forecast calls through the app in-process (fastapi
+# TestClient), each with a fresh context so it misses the cache and runs
+# predict_future, in three modes:
+#
+#   off       no X-Profile header, profiling toggle off (the production path)
+#   header    X-Profile: 1 on every request
+#   toggle    POST /admin/profiling {"enabled": true}, no header
+#
+# The only work the off path adds is Profiler.wanted(); it is timed on its own
+# over --hook-calls calls. Passes when that cost is at most --max-overhead of
+# the median off-mode request.
+#
+# Usage:
+#   python bench_profiling.py
+#   python bench_profiling.py --requests 500 --max-overhead 0.005
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("FACTS_SNAPSHOT_CSV", "training_data.csv")
+os.environ.setdefault("FACTS_REFRESH_SECONDS", "0")
+
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+
+from main import app
+from profiling import profiler
+
+MODES = ("off", "header", "toggle")
+
+
+def forecast_body(i):
+    # A distinct context per request, so every request misses the cache
+    return {"metric": "gdp", "region": "US", "startYear": 2024, "endYear": 2030,
+            "context": {"spending": 0.25 + i * 1e-6}}
+
+
+def time_requests(client, mode, n, offset):
+    """Per-request latencies in seconds"""
+    headers = {"X-Profile": "1"} if mode == "header" else None
+    client.post("/admin/profiling", json={"enabled": mode == "toggle"})
+    latencies = []
+    for i in range(n):
+        started = time.perf_counter()
+        response = client.post("/forecast", json=forecast_body(offset + i), headers=headers)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"/forecast returned {response.status_code}: {response.text[:300]}")
+        if (mode != "off") != (response.headers.get("x-profile-id") is not None):
+            raise RuntimeError(f"Mode {mode}: unexpected X-Profile-Id {response.headers.get('x-profile-id')}")
+    client.post("/admin/profiling", json={"enabled": False})
+    return latencies
+
+
+def time_hook(n):
+    """Seconds per Profiler.wanted() call with profiling off, on typical request headers"""
+    headers = Headers({"host": "testserver", "accept": "*/*", "accept-encoding": "gzip, deflate",
+                       "connection": "keep-alive", "user-agent": "python-httpx/0.28",
+                       "content-type": "application/json", "content-length": "120"})
+    assert not profiler.wanted(headers)
+    started = time.perf_counter()
+    for _ in range(n):
+        profiler.wanted(headers)
+    return (time.perf_counter() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of request profiling when off and on")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per mode")
+    parser.add_argument("--hook-calls", type=int, default=200000)
+    parser.add_argument("--max-overhead", type=float, default=0.01,
+                        help="Allowed cost of the off-path check, as a fraction of a request")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # per-request logging would dominate the timings
+    results = {}
+    with TestClient(app) as client:
+        time_requests(client, "off", 20, -20)  # warm up: models, snapshot, threadpool
+        for k, mode in enumerate(MODES):
+            results[mode] = time_requests(client, mode, args.requests, k * args.requests)
+        stored = client.get("/admin/profiling").json()["stored"]
+        sampled = [p for p in profiler.profiles() if p.samples]
+    hook = time_hook(args.hook_calls)
+
+    off_median = statistics.median(results["off"])
+    print(f"{'mode':>8} {'median ms':>10} {'p95 ms':>8} {'vs off':>8}")
+    for mode in MODES:
+        latencies = sorted(results[mode])
+        median = statistics.median(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{mode:>8} {median * 1000:>10.3f} {p95 * 1000:>8.3f} {median / off_median:>7.2f}x")
+    print(f"[INFO] {stored} profile(s) in the ring buffer, {len(sampled)} with samples")
+
+    overhead = hook / off_median
+    print(f"[INFO] Off-path check: {hook * 1e9:.0f} ns per request ({overhead:.4%} of a median request)")
+    if overhead > args.max_overhead:
+        print(f"[FAIL] Profiling hook costs {overhead:.4%} of a request with profiling off "
+              f"(allowed {args.max_overhead:.2%})")
+        sys.exit(1)
+    print(f"[OK] Profiling off adds {overhead:.4%} per request (allowed {args.max_overhead:.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,100 @@
+# extract_training_data.py
+#
+# Writes one row per (year, region) with a column per target metric, from facts.
+#
+# --granularity quarter extracts the quarterly facts instead. Their period is
+# read as one compact integer, year * 10 + quarter (20243 = 2024 Q3), and the
+# output has year, quarter and period columns. Facts are streamed out of
+# Postgres with COPY rather than fetched row by row.
+#
+# Usage:
+#   python extract_training_data.py                         # training_data.csv
+#   python extract_training_data.py --granularity quarter   # training_data_quarterly.csv
 from dotenv import load_dotenv
+import argparse
+import io
 import os
 import psycopg2
 import pandas as pd
 
 load_dotenv()
 
-# 🔧 Update with your actual credentials
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASS")
-)
-
 # List of metrics you want to include in training
 #target_metrics = ['gdp', 'education_index', 'health_index', 'spending', 'co2_emissions', 'green_jobs']
 target_metrics = ['gdp', 'education_index', 'health_index', 'co2_emissions']
 
-# Step 1: Query all relevant data
-query = f"""
+DEFAULT_OUTPUT = {"year": "training_data.csv", "quarter": "training_data_quarterly.csv"}
+
+# Long facts per granularity; annual rows are quarter 0
+QUERIES = {
+    "year": """
 SELECT region_id AS region, year, metric_code, value
 FROM facts
-WHERE metric_code IN %s
-"""
+WHERE metric_code IN %s AND quarter = 0
+""",
+    "quarter": """
+SELECT region_id AS region, year * 10 + quarter AS period, metric_code, value
+FROM facts
+WHERE metric_code IN %s AND quarter > 0
+""",
+}
+
+
+def connect():
+    # 🔧 Update with your actual credentials
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS")
+    )
+
+
+def read_facts(conn, metrics, granularity="year"):
+    """Long DataFrame of the metrics' facts: region, year (or period), metric_code, value"""
+    buf = io.StringIO()
+    with conn.cursor() as cur:
+        query = cur.mogrify(QUERIES[granularity], [tuple(metrics)]).decode()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buf)
+    buf.seek(0)
+    return pd.read_csv(buf, dtype={"region": str, "metric_code": str})
+
+
+def to_training(df, granularity="year"):
+    """Pivot long facts to one row per (period, region), complete rows only"""
+    key = "year" if granularity == "year" else "period"
+    pivot_df = df.pivot_table(index=[key, 'region'], columns='metric_code', values='value').reset_index()
+    pivot_df = pivot_df.dropna()  # remove rows with missing values
+    if granularity == "quarter":
+        year, quarter = divmod(pivot_df["period"], 10)
+        pivot_df.insert(0, "year", year)
+        pivot_df.insert(1, "quarter", quarter)
+    return pivot_df.sort_values(by=['region', key])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract model training data from facts")
+    parser.add_argument("--granularity", choices=list(QUERIES), default="year")
+    parser.add_argument("--metrics", nargs="+", default=target_metrics)
+    parser.add_argument("--out", help="Output CSV (default depends on --granularity)")
+    args = parser.parse_args(argv)
+    out = args.out or DEFAULT_OUTPUT[args.granularity]
+
+    conn = connect()
+    try:
+        # Step 1: Query all relevant data
+        df = read_facts(conn, args.metrics, args.granularity)
+    finally:
+        conn.close()
 
-df = pd.read_sql(query, conn, params=[tuple(target_metrics)])
+    # Step 2: Pivot data: one row per (period, region), one column per metric
+    pivot_df = to_training(df, args.granularity)
 
-# Step 2: Pivot data: one row per (year, region), one column per metric
-pivot_df = df.pivot_table(index=['year', 'region'], columns='metric_code', values='value').reset_index()
+    # Step 3: Export
+    pivot_df.to_csv(out, index=False)
+    print(f"✅ Saved {out} ({len(pivot_df)} rows)")
 
-# Step 3: Optional cleanup
-pivot_df = pivot_df.dropna()  # remove rows with missing values
-pivot_df = pivot_df.sort_values(by=['region', 'year'])
 
-# Step 4: Export
-pivot_df.to_csv("training_data.csv", index=False)
-print("✅ Saved training_data.csv")
+if __name__ == "__main__":
+    main()
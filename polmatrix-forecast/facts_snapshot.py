@@ -0,0 +1,209 @@
+# facts_snapshot.py
+#
+# Compact in-memory, columnar copy of the annual facts(region_id, year, metric_code, value)
+# (quarter 0; quarterly rows are not needed for history or feature defaults).
+#
+# Rows are kept as NumPy arrays sorted by (region, metric, year) with an index
+# of (region, metric) -> slice, so history lookups and "latest observation"
+# queries never touch Postgres. A background thread reloads the snapshot every
+# FACTS_REFRESH_SECONDS and swaps it in atomically. If no snapshot could be
+# loaded, requests fail fast for FACTS_RETRY_SECONDS before the next attempt
+# instead of each waiting on an unreachable database.
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+REFRESH_SECONDS = float(os.getenv("FACTS_REFRESH_SECONDS", "300"))
+# Load from a CSV (long facts or wide training_data.csv layout) instead of the DB
+SNAPSHOT_CSV = os.getenv("FACTS_SNAPSHOT_CSV")
+CONNECT_TIMEOUT = int(os.getenv("FACTS_CONNECT_TIMEOUT", "5"))
+RETRY_SECONDS = float(os.getenv("FACTS_RETRY_SECONDS", "30"))
+
+FACTS_SQL = "SELECT region_id, year, metric_code, value FROM facts WHERE quarter = 0"
+
+
+class FactsSnapshot:
+    """Immutable columnar facts, indexed by (region, metric) with years sorted ascending"""
+
+    def __init__(self, regions, metrics, years, values, slices, loaded_at=None):
+        self.regions = regions      # region_id per region code
+        self.metrics = metrics      # metric_code per metric code
+        self.years = years          # int32, sorted within each (region, metric)
+        self.values = values        # float64
+        self.slices = slices        # {(region_id, metric_code): (start, stop)}
+        self.loaded_at = loaded_at or time.time()
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a long DataFrame with region_id, year, metric_code, value"""
+        df = df.dropna(subset=["region_id", "year", "metric_code", "value"])
+        region_codes, regions = pd.factorize(df["region_id"].astype(str), sort=True)
+        metric_codes, metrics = pd.factorize(df["metric_code"].astype(str), sort=True)
+        years = df["year"].to_numpy(dtype=np.int32)
+        values = df["value"].to_numpy(dtype=np.float64)
+
+        order = np.lexsort((years, metric_codes, region_codes))
+        region_codes = region_codes[order]
+        metric_codes = metric_codes[order]
+        years = years[order]
+        values = values[order]
+
+        # One slice per (region, metric) run in the sorted arrays
+        keys = region_codes.astype(np.int64) * max(len(metrics), 1) + metric_codes
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+        stops = np.r_[starts[1:], len(keys)]
+        slices = {
+            (regions[region_codes[s]], metrics[metric_codes[s]]): (int(s), int(e))
+            for s, e in zip(starts, stops)
+        }
+        return cls(np.asarray(regions), np.asarray(metrics), years, values, slices)
+
+    def __len__(self):
+        return len(self.values)
+
+    def series(self, region, metric, before_year=None):
+        """(years, values) arrays for one region/metric, optionally only years < before_year"""
+        start, stop = self.slices.get((region, metric), (0, 0))
+        years = self.years[start:stop]
+        values = self.values[start:stop]
+        if before_year is not None:
+            cut = int(np.searchsorted(years, before_year, side="left"))
+            years, values = years[:cut], values[:cut]
+        return years, values
+
+    def latest(self, region, metric, before_year=None):
+        """Latest (year, value) observation, or None"""
+        years, values = self.series(region, metric, before_year)
+        if not len(years):
+            return None
+        return int(years[-1]), float(values[-1])
+
+    def latest_values(self, region, metrics, before_year=None):
+        """{metric: latest value} for the metrics that have any observation"""
+        latest = {}
+        for metric in metrics:
+            point = self.latest(region, metric, before_year)
+            if point is not None:
+                latest[metric] = point[1]
+        return latest
+
+    def history(self, region, metrics, before_year):
+        """Rows shaped like simulator.js history: one row per (year, metric), ordered by year"""
+        rows = []
+        for metric in metrics:
+            years, values = self.series(region, metric, before_year)
+            rows.extend(
+                {"year": int(y), "region": region, "source": "real", metric: float(v)}
+                for y, v in zip(years, values)
+            )
+        rows.sort(key=lambda r: r["year"])
+        return rows
+
+
+# --- LOADING ---
+def _connect():
+    load_dotenv()
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD", os.getenv("DB_PASS")),
+        connect_timeout=CONNECT_TIMEOUT
+    )
+
+
+def _read_csv(path):
+    """Long facts CSV, or the wide training_data.csv layout (year, region, <metric>...)"""
+    df = pd.read_csv(path)
+    if "quarter" in df.columns:
+        df = df[df["quarter"].fillna(0) == 0].drop(columns=["quarter"])
+    if "metric_code" in df.columns:
+        return df.rename(columns={"region": "region_id"})
+    df = df.rename(columns={"region": "region_id"})
+    return df.melt(id_vars=["region_id", "year"], var_name="metric_code", value_name="value")
+
+
+def load_snapshot(csv_path=SNAPSHOT_CSV):
+    """Load a fresh snapshot from FACTS_SNAPSHOT_CSV if set, otherwise from the facts table"""
+    started = time.perf_counter()
+    if csv_path:
+        df = _read_csv(csv_path)
+    else:
+        conn = _connect()
+        try:
+            df = pd.read_sql(FACTS_SQL, conn)
+        finally:
+            conn.close()
+    snapshot = FactsSnapshot.from_frame(df)
+    logger.info(f"Loaded facts snapshot: {len(snapshot)} rows, {len(snapshot.slices)} series "
+                f"in {time.perf_counter() - started:.2f}s")
+    return snapshot
+
+
+_snapshot = None
+_refresher = None
+_load_lock = threading.Lock()
+_last_failure = None  # (time.monotonic(), error) of the last failed load
+
+
+def get_snapshot():
+    """Current snapshot, loading it on first use. Raises if it cannot be loaded.
+
+    Blocks (up to the connect timeout) while loading, so call it off the event
+    loop. After a failed load it raises at once until RETRY_SECONDS have passed.
+    """
+    if _snapshot is not None:
+        return _snapshot
+    with _load_lock:
+        if _snapshot is None:
+            if _last_failure is not None:
+                wait = RETRY_SECONDS - (time.monotonic() - _last_failure[0])
+                if wait > 0:
+                    raise RuntimeError(f"Facts snapshot unavailable ({_last_failure[1]}); "
+                                       f"next load attempt in {wait:.0f}s")
+            refresh_snapshot()
+    return _snapshot
+
+
+def refresh_snapshot():
+    """Reload and atomically swap the snapshot; on failure keep serving the old one"""
+    global _snapshot, _last_failure
+    try:
+        _snapshot = load_snapshot()
+        _last_failure = None
+    except Exception as e:
+        _last_failure = (time.monotonic(), e)
+        logger.error(f"Facts snapshot refresh failed: {e}")
+        if _snapshot is None:
+            raise
+    return _snapshot
+
+
+def start_refresher(interval=REFRESH_SECONDS):
+    """Refresh the snapshot every `interval` seconds in a daemon thread"""
+    global _refresher
+    if _refresher is not None or interval <= 0:
+        return _refresher
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            # refresh_snapshot raises while there is no snapshot yet; keep the thread alive
+            try:
+                refresh_snapshot()
+            except Exception as e:
+                logger.warning(f"No facts snapshot yet, retrying in {interval}s: {e}")
+
+    _refresher = threading.Thread(target=loop, name="facts-snapshot-refresh", daemon=True)
+    _refresher.start()
+    return _refresher
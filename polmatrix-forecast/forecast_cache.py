@@ -0,0 +1,171 @@
+# forecast_cache.py
+#
+# Result cache for forecast endpoints with request coalescing.
+#
+# Entries are keyed on a canonical form of the request, expire after a TTL and
+# are evicted least-recently-used once the cache exceeds its byte budget.
+# Concurrent identical misses share one in-flight computation ("singleflight").
+# The cache is cleared whenever models are reloaded, including when a request
+# path's model_runner.check_models() finds the model files changed on disk;
+# results computed by a request that started before the reload are returned
+# but not stored.
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+MAX_BYTES = int(os.getenv("FORECAST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL", "600"))
+
+
+def _normalize(value):
+    """Make equal requests serialize identically (e.g. 23 and 23.0)"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return str(value)
+
+
+def canonical_key(endpoint, request):
+    """Stable string key for an endpoint and its request body"""
+    return json.dumps([endpoint, _normalize(request)], sort_keys=True, separators=(",", ":"))
+
+
+class _Call:
+    """One in-flight computation that concurrent identical requests wait on"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ForecastCache:
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """Cached value for `key`, else compute() once for all concurrent callers"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call(self._generation)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if (call.error is None and call.generation == self._generation
+                        and cacheable(call.value)):
+                    self._store(key, call.value)
+            call.done.set()
+        return call.value
+
+    def get(self, key):
+        """Cached value for `key` or None; counts a hit or a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation=None):
+        """Store a value computed outside get_or_compute, unless the cache was invalidated since `generation`"""
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._store(key, value)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def _store(self, key, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self):
+        """Drop every entry; in-flight results from before this call are not stored"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "in_flight": len(self._inflight),
+            }
+
+
+forecast_cache = ForecastCache()
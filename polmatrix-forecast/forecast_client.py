@@ -0,0 +1,405 @@
+# forecast_client.py
+#
+# Python client for the forecast service.
+#
+#   client = ForecastClient("http://localhost:8000")
+#   gdp = client.forecast("gdp", "US", 2025, 2030, context={"spending": 0.3})
+#   gdp.years, gdp.values
+#   client.forecast("gdp", "US", 2025, 2030, granularity="quarter")   # four points per year
+#
+# Connections are pooled and kept alive. forecast() calls made from many
+# threads (or coroutines, with AsyncForecastClient) within `batch_window`
+# seconds are sent together as one POST /forecast_batch; each caller still
+# gets back just its own result. Connection errors and 429/502/503/504 are
+# retried with exponential backoff. Against a server without /forecast_batch
+# the client falls back to one /forecast call per request.
+#
+# ForecastClient needs `requests`; AsyncForecastClient needs `httpx`.
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- CONFIGURATION ---
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_BATCH_WINDOW = 0.005   # seconds to wait for more calls before sending a batch
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.2          # first retry delay; doubles each attempt, with jitter
+DEFAULT_POOL_SIZE = 16
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class ForecastError(Exception):
+    """The service could not produce a forecast (bad request, missing model, server error)"""
+
+
+@dataclass(frozen=True)
+class ForecastPoint:
+    year: int
+    region: str
+    value: float
+    source: str = "simulated"
+    quarter: int = 0           # 1-4 for quarterly forecasts, 0 for a whole year
+
+
+@dataclass(frozen=True)
+class Forecast:
+    metric: str
+    region: str
+    points: list = field(default_factory=list)
+
+    @property
+    def years(self):
+        return [p.year for p in self.points]
+
+    @property
+    def values(self):
+        return [p.value for p in self.points]
+
+    def as_dict(self):
+        """{year: value}, or {(year, quarter): value} for a quarterly forecast"""
+        return {(p.year, p.quarter) if p.quarter else p.year: p.value for p in self.points}
+
+
+def _request_body(metric, region, start_year, end_year, context, granularity="year"):
+    body = {"metric": metric, "region": region, "startYear": start_year,
+            "endYear": end_year, "context": context or {}}
+    if granularity != "year":
+        body["granularity"] = granularity
+    return body
+
+
+def _parse_forecast(body, result):
+    """Forecast from a /forecast response, or raise ForecastError"""
+    if isinstance(result, dict):
+        raise ForecastError(result.get("error") or result.get("detail") or str(result))
+    metric = body["metric"]
+    points = [
+        ForecastPoint(row["year"], row.get("region", body["region"]), row[metric],
+                      row.get("source", "simulated"), row.get("quarter", 0))
+        for row in result
+    ]
+    return Forecast(metric, body["region"], points)
+
+
+def _parse_batch_item(body, item):
+    if "error" in item:
+        raise ForecastError(item["error"])
+    return _parse_forecast(body, item["result"])
+
+
+def _backoff(attempt, base):
+    return base * (2 ** attempt) * (0.5 + random.random())
+
+
+class ForecastClient:
+    """Thread-safe synchronous client; share one instance across threads"""
+
+    def __init__(self, base_url="http://localhost:8000", timeout=DEFAULT_TIMEOUT,
+                 batch_window=DEFAULT_BATCH_WINDOW, max_batch=DEFAULT_MAX_BATCH,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.batch_supported = True
+        self._pending = []            # [(body, Future)]
+        self._cond = threading.Condition()
+        self._closed = False
+        self._batcher = None
+        self._senders = ThreadPoolExecutor(pool_size, thread_name_prefix="forecast-client-send")
+
+    # --- HTTP ---
+    def _post(self, path, payload):
+        """POST with retries on connection errors and transient statuses; returns the response"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+            time.sleep(_backoff(attempt, self.backoff))
+
+    def _post_json(self, path, payload):
+        response = self._post(path, payload)
+        if response.status_code != 200:
+            raise ForecastError(f"{path} returned {response.status_code}: {response.text[:300]}")
+        return response.json()
+
+    # --- BATCHING ---
+    def _ensure_batcher(self):
+        if self._batcher is None:
+            self._batcher = threading.Thread(target=self._batch_loop, name="forecast-client-batcher",
+                                             daemon=True)
+            self._batcher.start()
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                # Give concurrent callers a short window to join this batch
+                deadline = time.monotonic() + self.batch_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            # Several batches can be in flight, one per pooled connection
+            self._senders.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        try:
+            results = self._run_batch([body for body, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (body, future), (value, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def _run_batch(self, bodies):
+        """[(Forecast, None) | (None, ForecastError)] for each request body"""
+        if self.batch_supported and len(bodies) > 1:
+            response = self._post("/forecast_batch", {"requests": bodies})
+            if response.status_code in (404, 405):
+                self.batch_supported = False
+            elif response.status_code != 200:
+                raise ForecastError(f"/forecast_batch returned {response.status_code}: {response.text[:300]}")
+            else:
+                return [self._outcome(_parse_batch_item, body, item)
+                        for body, item in zip(bodies, response.json()["results"])]
+        return [self._outcome(lambda b, _: self._forecast_one(b), body, None) for body in bodies]
+
+    @staticmethod
+    def _outcome(parse, body, item):
+        try:
+            return parse(body, item), None
+        except ForecastError as e:
+            return None, e
+
+    def _forecast_one(self, body):
+        return _parse_forecast(body, self._post_json("/forecast", body))
+
+    # --- API ---
+    def forecast_async(self, metric, region, start_year, end_year, context=None, granularity="year"):
+        """concurrent.futures.Future of a Forecast, sent with the next batch"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ForecastClient is closed")
+            self._ensure_batcher()
+            self._pending.append((_request_body(metric, region, start_year, end_year, context, granularity),
+                                  future))
+            self._cond.notify()
+        return future
+
+    def forecast(self, metric, region, start_year, end_year, context=None, granularity="year"):
+        """Forecast of `metric` for each year (or quarter) in [start_year, end_year]"""
+        return self.forecast_async(metric, region, start_year, end_year, context, granularity).result()
+
+    def forecast_many(self, requests_):
+        """Forecasts for a list of (metric, region, start_year, end_year[, context[, granularity]]) tuples"""
+        futures = [self.forecast_async(*args) for args in requests_]
+        return [f.result() for f in futures]
+
+    def forecast_with_history(self, metrics, start_year, end_year, region="US", context=None,
+                              model_map=None, levers=None, coupled=False):
+        """Raw /forecast_with_history response (history, forecast, context, errors)"""
+        return self._post_json("/forecast_with_history", {
+            "region": region, "metrics": metrics, "startYear": start_year, "endYear": end_year,
+            "context": context or {}, "modelMap": model_map or {}, "levers": levers or [],
+            "coupled": coupled,
+        })
+
+    def simulate_levers(self, metrics, start_year, end_year, scenarios, region="US", **options):
+        """Raw /simulate_levers response; `options` are passed through (context, modelMap, ...)"""
+        return self._post_json("/simulate_levers", {
+            "region": region, "metrics": metrics, "startYear": start_year, "endYear": end_year,
+            "scenarios": scenarios, **options,
+        })
+
+    def sensitivity(self, metric, start_year, end_year, region="US", **options):
+        """Raw /sensitivity response; `options` are passed through (context, gridPoints, grids, ...)"""
+        return self._post_json("/sensitivity", {
+            "metric": metric, "region": region, "startYear": start_year, "endYear": end_year, **options,
+        })
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._batcher is not None:
+            self._batcher.join()
+        self._senders.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncForecastClient:
+    """asyncio client; forecast() calls awaited concurrently are batched together"""
+
+    def __init__(self, base_url="http://localhost:8000", timeout=DEFAULT_TIMEOUT,
+                 batch_window=DEFAULT_BATCH_WINDOW, max_batch=DEFAULT_MAX_BATCH,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE):
+        import httpx  # only needed by async users
+
+        self._httpx = httpx
+        self.base_url = base_url.rstrip("/")
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.batch_supported = True
+        self._pending = []            # [(body, asyncio.Future)]
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def _post(self, path, payload):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(f"{self.base_url}{path}", json=payload)
+            except self._httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+            await asyncio.sleep(_backoff(attempt, self.backoff))
+
+    async def _post_json(self, path, payload):
+        response = await self._post(path, payload)
+        if response.status_code != 200:
+            raise ForecastError(f"{path} returned {response.status_code}: {response.text[:300]}")
+        return response.json()
+
+    def _flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            self._schedule_flush()
+        task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.max_batch:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_handle = loop.call_soon(self._flush)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+    async def _send_batch(self, batch):
+        bodies = [body for body, _ in batch]
+        try:
+            results = await self._run_batch(bodies)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), (value, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    async def _run_batch(self, bodies):
+        if self.batch_supported and len(bodies) > 1:
+            response = await self._post("/forecast_batch", {"requests": bodies})
+            if response.status_code in (404, 405):
+                self.batch_supported = False
+            elif response.status_code != 200:
+                raise ForecastError(f"/forecast_batch returned {response.status_code}: {response.text[:300]}")
+            else:
+                return [ForecastClient._outcome(_parse_batch_item, body, item)
+                        for body, item in zip(bodies, response.json()["results"])]
+        results = []
+        for body in bodies:
+            try:
+                results.append((_parse_forecast(body, await self._post_json("/forecast", body)), None))
+            except ForecastError as e:
+                results.append((None, e))
+        return results
+
+    async def forecast(self, metric, region, start_year, end_year, context=None, granularity="year"):
+        """Forecast of `metric` for each year (or quarter) in [start_year, end_year]"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((_request_body(metric, region, start_year, end_year, context, granularity), future))
+        self._schedule_flush()
+        return await future
+
+    async def forecast_many(self, requests_):
+        """Forecasts for a list of (metric, region, start_year, end_year[, context[, granularity]]) tuples"""
+        return await asyncio.gather(*(self.forecast(*args) for args in requests_))
+
+    async def forecast_with_history(self, metrics, start_year, end_year, region="US", context=None,
+                                    model_map=None, levers=None, coupled=False):
+        return await self._post_json("/forecast_with_history", {
+            "region": region, "metrics": metrics, "startYear": start_year, "endYear": end_year,
+            "context": context or {}, "modelMap": model_map or {}, "levers": levers or [],
+            "coupled": coupled,
+        })
+
+    async def simulate_levers(self, metrics, start_year, end_year, scenarios, region="US", **options):
+        return await self._post_json("/simulate_levers", {
+            "region": region, "metrics": metrics, "startYear": start_year, "endYear": end_year,
+            "scenarios": scenarios, **options,
+        })
+
+    async def sensitivity(self, metric, start_year, end_year, region="US", **options):
+        return await self._post_json("/sensitivity", {
+            "metric": metric, "region": region, "startYear": start_year, "endYear": end_year, **options,
+        })
+
+    async def aclose(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        while self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
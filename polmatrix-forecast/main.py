@@ -1,6 +1,18 @@
 # main.py
 from fastapi import FastAPI, Request, HTTPException
-from model_runner import predict_future
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from model_runner import (GRANULARITIES, check_models, observed_defaults, on_models_reloaded, predict_future,
+                          predict_many, predict_with_history, quarterly_rows, reload_models, resident_models)
+from facts_snapshot import get_snapshot, refresh_snapshot, start_refresher
+from policy_levers import DECAY_RATE, simulate_levers_response
+from sensitivity import DEFAULT_EPSILON, DEFAULT_GRID_POINTS, DEFAULT_SPREAD, sensitivity_response
+from baseline_grid import get_grid, reload_grid
+from forecast_cache import canonical_key, forecast_cache
+from profiling import EXPORT_FORMATS, PROFILE_ID_HEADER, profiler
+from sharding import SHARD, WrongShardError, check_region
+import os
 import traceback
 import logging
 
@@ -10,29 +22,360 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Cached forecasts and the baseline grid were produced by the old models
+on_models_reloaded(forecast_cache.invalidate)
+on_models_reloaded(reload_grid)
+
+def _is_forecast(result):
+    # predict_future reports a missing model as {"error": ...}; don't cache that
+    return not (isinstance(result, dict) and "error" in result)
+
+def _grid_forecast(body):
+    # Baseline requests (no custom context) are sliced from the precomputed grid
+    if body.get("context"):
+        return None
+    grid = get_grid()
+    return grid.lookup(body["metric"], body["region"], body["startYear"], body["endYear"]) if grid else None
+
+def _forecast_key(body):
+    return canonical_key("forecast", {
+        "metric": body["metric"],
+        "region": body["region"],
+        "startYear": body["startYear"],
+        "endYear": body["endYear"],
+        "context": body.get("context", {}),
+    })
+
+def _granularity(body):
+    granularity = body.get("granularity", "year")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}, expected one of {', '.join(GRANULARITIES)}")
+    return granularity
+
+def _at_granularity(body, result):
+    # Quarterly rows are derived from the annual forecast, so both share its grid/cache entry
+    return quarterly_rows(result, body["metric"]) if _granularity(body) == "quarter" else result
+
+def run_forecast(body):
+    """Result of one /forecast request body at its granularity"""
+    _granularity(body)
+    # Before the baseline grid, which holds every region whatever the shard
+    check_region(body["region"])
+    # A cache hit loads no model, so look for a retrain first
+    check_models()
+    return _at_granularity(body, _annual_forecast(body))
+
+def _annual_forecast(body):
+    """Annual forecast for a /forecast body: baseline grid, then cache, then the model"""
+    result = _grid_forecast(body)
+    if result is not None:
+        logger.info(f"Forecast served from baseline grid, returning {len(result)} result(s)")
+        return result
+
+    # Identical concurrent requests share one computation
+    return forecast_cache.get_or_compute(
+        _forecast_key(body),
+        lambda: predict_future(
+            metric=body["metric"],
+            region=body["region"],
+            start_year=body["startYear"],
+            end_year=body["endYear"],
+            context=body.get("context", {})
+        ),
+        _is_forecast
+    )
+
+async def _in_threadpool(request, func, *args):
+    """func(*args) on the threadpool, profiled when the request asks for it (profiling.py)"""
+    if not profiler.wanted(request.headers):
+        return await run_in_threadpool(func, *args)
+    # Render the JSON inside the profiled call so serialization shows up in the profile
+    response, profile = await run_in_threadpool(
+        profiler.run, request.url.path, lambda: JSONResponse(jsonable_encoder(func(*args)))
+    )
+    response.headers[PROFILE_ID_HEADER] = profile.id
+    return response
+
+def _forecast_request(body):
+    """(metric, region, start_year, end_year, context) of a /forecast body; ValueError if malformed"""
+    context = body.get("context") or {}
+    if not isinstance(context, dict):
+        raise ValueError("context must be an object of feature values")
+    try:
+        context = {feature: float(value) for feature, value in context.items()}
+    except (TypeError, ValueError):
+        raise ValueError(f"context values must be numbers, got {context}")
+    return str(body["metric"]), str(body["region"]), int(body["startYear"]), int(body["endYear"]), context
+
+def run_forecast_batch(items):
+    """[{"result": ...} | {"error": ...}] for /forecast bodies; misses are predicted per model in one call"""
+    results = [None] * len(items)
+    misses = {}
+    check_models()
+    for i, item in enumerate(items):
+        try:
+            _granularity(item)
+            request = _forecast_request(item)
+            check_region(request[1])
+            # The converted values, so the grid, cache key and prediction agree
+            metric, region, start_year, end_year, context = request
+            body = {**item, "metric": metric, "region": region, "startYear": start_year,
+                    "endYear": end_year, "context": context}
+            result = _grid_forecast(body)
+            if result is None:
+                result = forecast_cache.get(_forecast_key(body))
+            if result is None:
+                misses[i] = (body, request)
+            else:
+                results[i] = {"result": _at_granularity(body, result)}
+        except Exception as e:
+            results[i] = {"error": f"Forecast failed: {str(e)}"}
+
+    if misses:
+        generation = forecast_cache.generation
+        predicted = predict_many([request for _, request in misses.values()])
+        for (i, (body, _)), result in zip(misses.items(), predicted):
+            if not _is_forecast(result):
+                results[i] = result
+                continue
+            forecast_cache.put(_forecast_key(body), result, generation)
+            results[i] = {"result": _at_granularity(body, result)}
+    return results
+
 @app.post("/forecast")
 async def forecast(request: Request):
     try:
         logger.info("Forecast endpoint called")
         body = await request.json()
         logger.info(f"Request body: {body}")
-        
-        result = predict_future(
-            metric=body["metric"],
-            region=body["region"],
-            start_year=body["startYear"],
-            end_year=body["endYear"],
-            context=body.get("context", {})  # optional extra features
-        )
-        
+
+        result = await _in_threadpool(request, run_forecast, body)
+
         logger.info(f"Forecast successful, returning {len(result) if isinstance(result, list) else 'single'} result(s)")
         return result
         
+    except WrongShardError as e:
+        # Misrouted: this worker does not serve the region (421 Misdirected Request)
+        raise HTTPException(status_code=421, detail=str(e))
     except Exception as e:
         logger.error(f"Forecast error: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Forecast failed: {str(e)}")
 
+@app.post("/forecast_batch")
+async def forecast_batch(request: Request):
+    # {"requests": [<forecast body>, ...]} -> {"results": [{"result": ...} | {"error": ...}, ...]}
+    # A malformed item does not fail the batch
+    try:
+        body = await request.json()
+        items = body["requests"]
+        logger.info(f"Forecast batch of {len(items)} request(s)")
+
+        return await _in_threadpool(request, lambda: {"results": run_forecast_batch(items)})
+
+    except Exception as e:
+        logger.error(f"Forecast batch error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Forecast batch failed: {str(e)}")
+
+def _history_forecast(request_args):
+    # History and defaults depend on the snapshot, so a refresh starts new keys
+    check_models()
+    try:
+        loaded_at = get_snapshot().loaded_at
+    except Exception:
+        loaded_at = None  # predict_with_history falls back to DEFAULT_VALUES
+    key = canonical_key("forecast_with_history", {**request_args, "snapshot": loaded_at})
+    # Fallback results (no snapshot) are not cached, so they end once the snapshot loads
+    return forecast_cache.get_or_compute(key, lambda: predict_with_history(**request_args),
+                                         lambda result: not result["warnings"])
+
+@app.post("/forecast_with_history")
+async def forecast_with_history(request: Request):
+    try:
+        body = await request.json()
+        logger.info(f"History+forecast request: {body}")
+
+        request_args = {
+            "region": body.get("region", "US"),
+            "metrics": body["metrics"],
+            "start_year": body["startYear"],
+            "end_year": body["endYear"],
+            "context": body.get("context", {}),
+            "model_map": body.get("modelMap", {}),
+            "levers": body.get("levers", []),
+            "coupled": body.get("coupled", False),
+        }
+        return await _in_threadpool(request, _history_forecast, request_args)
+
+    except WrongShardError as e:
+        raise HTTPException(status_code=421, detail=str(e))
+    except Exception as e:
+        logger.error(f"History+forecast error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Forecast failed: {str(e)}")
+
+@app.post("/simulate_levers")
+async def simulate_levers_endpoint(request: Request):
+    try:
+        body = await request.json()
+        logger.info(f"Lever simulation request: {len(body.get('scenarios', []))} scenario(s)")
+
+        region = body.get("region", "US")
+        metrics = body["metrics"]
+        model_map = body.get("modelMap", {})
+        scenarios = body.get("scenarios") or [{"name": "levers", "levers": body.get("levers", [])}]
+
+        def simulate():
+            # Fill missing features from the facts snapshot when it is available
+            try:
+                defaults = observed_defaults(get_snapshot(), region, metrics, body["startYear"], model_map)
+            except Exception as e:
+                logger.warning(f"Facts snapshot unavailable, using DEFAULT_VALUES: {e}")
+                defaults = None
+
+            return simulate_levers_response(
+                region,
+                metrics,
+                body["startYear"],
+                body["endYear"],
+                scenarios,
+                context=body.get("context", {}),
+                defaults=defaults,
+                model_map=model_map,
+                effects=body.get("coefficients"),
+                decay_rate=body.get("decayRate", DECAY_RATE),
+                coupled=body.get("coupled", False)
+            )
+
+        # Model loads and the stacked predict stay off the event loop
+        return await _in_threadpool(request, simulate)
+
+    except WrongShardError as e:
+        raise HTTPException(status_code=421, detail=str(e))
+    except Exception as e:
+        logger.error(f"Lever simulation error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Lever simulation failed: {str(e)}")
+
+@app.post("/sensitivity")
+async def sensitivity_endpoint(request: Request):
+    try:
+        body = await request.json()
+        logger.info(f"Sensitivity request: {body.get('metric')} {body.get('region', 'US')}")
+
+        metric = body["metric"]
+        region = body.get("region", "US")
+
+        def analyse():
+            check_models()
+            try:
+                defaults = observed_defaults(get_snapshot(), region, [metric], body["startYear"])
+            except Exception as e:
+                logger.warning(f"Facts snapshot unavailable, using DEFAULT_VALUES: {e}")
+                defaults = None
+
+            request_args = {
+                "context": body.get("context", {}),
+                "defaults": defaults,
+                "grid_points": body.get("gridPoints", DEFAULT_GRID_POINTS),
+                "spread": body.get("spread", DEFAULT_SPREAD),
+                "grids": body.get("grids"),
+                "epsilon": body.get("epsilon", DEFAULT_EPSILON),
+            }
+            # Defaults are part of the key, so a snapshot refresh with new observations starts new keys
+            key = canonical_key("sensitivity", {"metric": metric, "region": region, "startYear": body["startYear"],
+                                                "endYear": body["endYear"], **request_args})
+            return forecast_cache.get_or_compute(
+                key, lambda: sensitivity_response(metric, region, body["startYear"], body["endYear"], **request_args)
+            )
+
+        # Snapshot loading and the model stay off the event loop
+        return await _in_threadpool(request, analyse)
+
+    except WrongShardError as e:
+        raise HTTPException(status_code=421, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid sensitivity request: {str(e)}")
+    except Exception as e:
+        logger.error(f"Sensitivity error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Sensitivity analysis failed: {str(e)}")
+
+@app.on_event("startup")
+async def load_facts_snapshot():
+    # Warm the facts snapshot; /forecast keeps working if the DB is unreachable
+    try:
+        await run_in_threadpool(refresh_snapshot)
+    except Exception as e:
+        logger.warning(f"Facts snapshot not loaded at startup: {e}")
+    start_refresher()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return forecast_cache.stats()
+
+@app.post("/admin/reload_models")
+async def admin_reload_models():
+    # Forget loaded models; the cache and baseline grid are reset via on_models_reloaded
+    try:
+        reload_models()
+        grid = get_grid()
+        logger.info("Models reloaded")
+        return {"status": "reloaded", "baselineGrid": grid is not None, "cache": forecast_cache.stats()}
+    except Exception as e:
+        logger.error(f"Model reload error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+
+@app.get("/admin/models")
+async def admin_models():
+    # Which models this process keeps loaded (per shard when sharded)
+    models = resident_models()
+    return {
+        "pid": os.getpid(),
+        "shard": f"{SHARD[0]}/{SHARD[1]}" if SHARD else None,
+        "resident": len(models),
+        "models": models,
+    }
+
+@app.get("/admin/profiling")
+async def admin_profiling():
+    return profiler.state()
+
+@app.post("/admin/profiling")
+async def admin_set_profiling(request: Request):
+    # {"enabled": true} profiles every request until switched off; "intervalMs" sets the sampling period
+    try:
+        body = await request.json()
+        state = profiler.configure(enabled=body.get("enabled"), interval_ms=body.get("intervalMs"))
+        logger.info(f"Profiling {'enabled' if state['enabled'] else 'disabled'}, interval {state['intervalMs']} ms")
+        return state
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid profiling settings: {str(e)}")
+
+@app.get("/admin/profiles")
+async def admin_profiles():
+    # Most recent profiles, newest first: this process's, or every worker's under the supervisor
+    return {"pid": os.getpid(), "profiles": [p.summary(top=3) for p in profiler.profiles()]}
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: str, format: str = "summary"):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if format == "speedscope":
+        return JSONResponse(profile.speedscope(), headers={
+            "Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'})
+    if format == "pstats":
+        return Response(profile.pstats(), media_type="application/octet-stream", headers={
+            "Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+    return profile.summary()
+
 @app.get("/")
 async def root():
     return {"message": "Polmatrix Forecast Service", "status": "running"}
@@ -0,0 +1,71 @@
+# model_manifest.py
+#
+# models/manifest.json describes the trained models: one entry per
+# models/{metric}_{region}.joblib with its content hash and features.
+# Derived artifacts (e.g. the baseline grid) record manifest_version() and are
+# ignored once the models they were built from change.
+import hashlib
+import json
+import os
+
+from model_runner import MODEL_FEATURES, MODELS_DIR
+
+MANIFEST_PATH = os.path.join(MODELS_DIR, "manifest.json")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_models(models_dir=MODELS_DIR):
+    """{model_name: entry} for every models/{metric}_{region}.joblib"""
+    models = {}
+    for filename in sorted(os.listdir(models_dir)):
+        if not filename.endswith(".joblib"):
+            continue
+        name = filename[:-len(".joblib")]
+        metric, _, region = name.rpartition("_")
+        models[name] = {
+            "metric": metric,
+            "region": region,
+            "file": filename,
+            "sha256": _sha256(os.path.join(models_dir, filename)),
+            "features": MODEL_FEATURES.get(metric, ["year"]),
+        }
+    return models
+
+
+def build_manifest(models_dir=MODELS_DIR, previous=None):
+    """Manifest for the models on disk, keeping extra per-model keys from `previous`"""
+    models = scan_models(models_dir)
+    for name, entry in models.items():
+        for key, value in ((previous or {}).get("models", {}).get(name) or {}).items():
+            entry.setdefault(key, value)
+    return {"models": models}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """The manifest on disk, or one built from the model files if there is none"""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return build_manifest(os.path.dirname(path))
+
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def manifest_version(manifest=None):
+    """Short hash of the model files' hashes; changes whenever any model changes"""
+    manifest = manifest if manifest is not None else load_manifest()
+    hashes = sorted((name, entry["sha256"]) for name, entry in manifest["models"].items())
+    return hashlib.sha256(json.dumps(hashes).encode()).hexdigest()[:16]
@@ -0,0 +1,223 @@
+# model_pack.py
+#
+# Every model's trees flattened into one NumPy record array, so worker
+# processes can serve forecasts from a read-only memory map instead of each
+# unpickling its own copy of every LightGBM booster.
+#
+# models/forest_pack.npy holds one record per tree node (all trees of all
+# models, concatenated); models/forest_pack.json maps each model to its tree
+# roots, feature order and max depth, and records the manifest version it was
+# built from. Mapped with mmap_mode="r", the pages are shared through the OS
+# page cache by every worker on the host, and workers never import lightgbm.
+#
+# Usage:
+#   python model_pack.py            # build the pack for the current models
+#   python model_pack.py --check    # compare packed and LightGBM predictions
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_manifest import load_manifest, manifest_version
+from model_runner import MODELS_DIR
+
+logger = logging.getLogger(__name__)
+
+PACK_PATH = os.path.join(MODELS_DIR, "forest_pack.npy")
+HEADER_PATH = os.path.join(MODELS_DIR, "forest_pack.json")
+
+NODE_DTYPE = np.dtype([
+    ("feature", np.int32),      # split feature (column in the model's feature order)
+    ("threshold", np.float64),
+    ("left", np.int32),         # global node index of the children
+    ("right", np.int32),
+    ("missing", np.int8),       # MISSING_* handling of the split
+    ("default_left", np.bool_),
+    ("leaf", np.bool_),
+    ("value", np.float64),      # leaf output
+])
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+# Objectives whose prediction is the raw sum of leaf values
+_IDENTITY_OBJECTIVES = ("regression", "regression_l1", "huber", "fair", "quantile", "mape")
+_ZERO_THRESHOLD = 1e-35  # LightGBM's kZeroThreshold
+
+
+def flatten_model(model):
+    """(nodes, roots, feature_names, max_depth) for a fitted LightGBM model, node indices local"""
+    dump = model.booster_.dump_model() if hasattr(model, "booster_") else model.dump_model()
+    objective = dump["objective"].split()[0]
+    if objective not in _IDENTITY_OBJECTIVES or dump["num_tree_per_iteration"] != 1:
+        raise ValueError(f"Unsupported objective for packing: {dump['objective']}")
+
+    nodes, roots = [], []
+    max_depth = 0
+
+    def add(node, depth):
+        nonlocal max_depth
+        index = len(nodes)
+        nodes.append(None)
+        if "leaf_value" in node:
+            nodes[index] = (0, 0.0, index, index, MISSING_NONE, False, True, node["leaf_value"])
+            max_depth = max(max_depth, depth)
+            return index
+        if node["decision_type"] != "<=":
+            raise ValueError("Categorical splits are not supported by the model pack")
+        left = add(node["left_child"], depth + 1)
+        right = add(node["right_child"], depth + 1)
+        nodes[index] = (node["split_feature"], node["threshold"], left, right,
+                        _MISSING_TYPES[node["missing_type"]], node["default_left"], False, 0.0)
+        return index
+
+    for tree in dump["tree_info"]:
+        roots.append(add(tree["tree_structure"], 0))
+    return np.array(nodes, dtype=NODE_DTYPE), roots, dump["feature_names"], max_depth
+
+
+def build_pack(pack_path=PACK_PATH, header_path=HEADER_PATH):
+    """Flatten every model in the manifest into the pack; returns the header"""
+    import joblib
+
+    manifest = load_manifest()
+    parts, models, offset = [], {}, 0
+    for name in sorted(manifest["models"]):
+        entry = manifest["models"][name]
+        model = joblib.load(os.path.join(MODELS_DIR, entry["file"]))
+        try:
+            nodes, roots, features, depth = flatten_model(model)
+        except ValueError as e:
+            logger.warning(f"Not packing {name}: {e}")
+            continue
+        # Local child/root indices -> global indices in the concatenated array
+        nodes["left"] += offset
+        nodes["right"] += offset
+        models[name] = {
+            "roots": [offset + r for r in roots],
+            "features": features,
+            "max_depth": depth,
+        }
+        parts.append(nodes)
+        offset += len(nodes)
+
+    tmp_pack = f"{pack_path}.tmp.npy"
+    np.save(tmp_pack, np.concatenate(parts) if parts else np.zeros(0, dtype=NODE_DTYPE))
+    header = {
+        "manifest_version": manifest_version(manifest),
+        "nodes": offset,
+        "models": models,
+        "created_at": time.time(),
+    }
+    tmp_header = f"{header_path}.tmp"
+    with open(tmp_header, "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(tmp_pack, pack_path)
+    os.replace(tmp_header, header_path)
+    print(f"✅ Model pack: {len(models)} models, {offset} nodes -> {pack_path}")
+    return header
+
+
+class PackedForest:
+    """Predict-only view of one model's trees in the shared node array"""
+
+    def __init__(self, nodes, roots, features, max_depth):
+        self.nodes = nodes
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.feature_names_in_ = features
+        self.max_depth = max_depth
+
+    def predict(self, X):
+        """Same result as LGBMRegressor.predict for a DataFrame or 2-D array of features"""
+        if hasattr(X, "columns"):
+            X = X[self.feature_names_in_].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        nodes = self.nodes
+        rows = np.arange(len(X))[:, None]
+        # (rows, trees) current node; every tree advances one level per step
+        current = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            node = nodes[current]
+            x = X[rows, node["feature"]]
+            missing = node["missing"]
+            nan = np.isnan(x)
+            x = np.where(nan & (missing != MISSING_NAN), 0.0, x)
+            use_default = (((missing == MISSING_ZERO) & (np.abs(x) <= _ZERO_THRESHOLD))
+                           | ((missing == MISSING_NAN) & nan))
+            go_left = np.where(use_default, node["default_left"], x <= node["threshold"])
+            step = np.where(go_left, node["left"], node["right"])
+            current = np.where(node["leaf"], current, step)
+        return nodes["value"][current].sum(axis=1)
+
+
+class ModelPack:
+    """Memory-mapped pack; `get(name)` returns a PackedForest or None"""
+
+    def __init__(self, nodes, header):
+        self.nodes = nodes
+        self.header = header
+        self._forests = {}
+
+    @classmethod
+    def open(cls, pack_path=PACK_PATH, header_path=HEADER_PATH, expected_version=None):
+        """Open the pack, or return None if it is missing or built from other models"""
+        if not (os.path.exists(pack_path) and os.path.exists(header_path)):
+            return None
+        with open(header_path, encoding="utf-8") as f:
+            header = json.load(f)
+        if expected_version is not None and header["manifest_version"] != expected_version:
+            logger.warning(f"Model pack is stale (built for {header['manifest_version']}, "
+                           f"models are {expected_version}); ignoring it")
+            return None
+        return cls(np.load(pack_path, mmap_mode="r"), header)
+
+    def get(self, name):
+        forest = self._forests.get(name)
+        if forest is None:
+            entry = self.header["models"].get(name)
+            if entry is None:
+                return None
+            forest = self._forests[name] = PackedForest(
+                self.nodes, entry["roots"], entry["features"], entry["max_depth"]
+            )
+        return forest
+
+
+def check(pack_path=PACK_PATH, header_path=HEADER_PATH, n_rows=1000, seed=0):
+    """Max absolute difference between packed and LightGBM predictions per model"""
+    import joblib
+
+    pack = ModelPack.open(pack_path, header_path)
+    if pack is None:
+        raise SystemExit("No model pack; run `python model_pack.py` first")
+    rng = np.random.default_rng(seed)
+    worst = 0.0
+    for name, entry in sorted(pack.header["models"].items()):
+        model = joblib.load(os.path.join(MODELS_DIR, f"{name}.joblib"))
+        features = entry["features"]
+        X = pd.DataFrame(rng.normal(size=(n_rows, len(features))), columns=features)
+        X["year"] = rng.integers(1990, 2060, n_rows)
+        X.iloc[::17, 1] = np.nan
+        diff = float(np.max(np.abs(model.predict(X) - pack.get(name).predict(X))))
+        worst = max(worst, diff)
+        print(f"[INFO] {name}: max |packed - lightgbm| = {diff:.3g}")
+    print(f"[OK] Checked {len(pack.header['models'])} models, worst difference {worst:.3g}")
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flatten model trees into a shared, memory-mapped pack")
+    parser.add_argument("--check", action="store_true", help="Compare packed and LightGBM predictions")
+    args = parser.parse_args(argv)
+    if args.check:
+        check()
+    else:
+        build_pack()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 # model_runner.py
+import os
+import threading
+import time
+from collections import OrderedDict
 import joblib
+import numpy as np
 import pandas as pd
 import logging
 
+from sharding import check_region
+
 logger = logging.getLogger(__name__)
 
+MODELS_DIR = os.getenv("FORECAST_MODELS_DIR", os.path.join(os.path.dirname(__file__), "models"))
+
+# Serve from the memory-mapped model pack (model_pack.py) instead of unpickling
+# boosters; set by the multi-worker supervisor so workers share one copy
+USE_MODEL_PACK = os.getenv("FORECAST_MODEL_PACK", "0") == "1"
+
+# Keep at most this many models loaded, least recently used evicted first (0 = no limit)
+MAX_RESIDENT_MODELS = int(os.getenv("FORECAST_MAX_MODELS", "0"))
+
 # Expected features for each model (derived from training)
 MODEL_FEATURES = {
     'co2_emissions': ['year', 'education_index', 'health_index', 'gdp', 'green_jobs', 'spending'],
@@ -25,46 +41,346 @@ DEFAULT_VALUES = {
     'spending': 0.26
 }
 
-def predict_future(metric, region, start_year, end_year, context):
+# How often request paths re-check the model files for a retrain (check_models)
+MODELS_CHECK_SECONDS = float(os.getenv("FORECAST_MODELS_CHECK_SECONDS", "1"))
+
+# Forecasts are annual; granularity "quarter" interpolates them (quarterly_rows)
+GRANULARITIES = ("year", "quarter")
+QUARTERS = (1, 2, 3, 4)
+
+# Loaded models by path: (file mtime, model), least recently used first.
+# A changed file is reloaded on next use.
+_models = OrderedDict()
+_models_lock = threading.Lock()
+_loading = {}  # model path -> Event set when its in-flight load finishes
+_reload_listeners = []
+_pack = None
+_pack_loaded = False
+_files_lock = threading.Lock()
+_files_checked = 0.0
+_files_state = None
+
+
+def on_models_reloaded(callback):
+    """Call `callback()` whenever a model is reloaded or the registry is cleared"""
+    _reload_listeners.append(callback)
+
+
+def _notify_reloaded():
+    for callback in _reload_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Model reload listener failed: {e}")
+
+
+def _get_pack():
+    """The model pack if USE_MODEL_PACK and it matches the current models, else None"""
+    global _pack, _pack_loaded
+    if not _pack_loaded:
+        from model_manifest import manifest_version
+        from model_pack import ModelPack
+        try:
+            _pack = ModelPack.open(expected_version=manifest_version())
+        except Exception as e:
+            logger.error(f"Could not open model pack: {e}")
+            _pack = None
+        if _pack is None:
+            logger.warning("No usable model pack; loading models with joblib")
+        _pack_loaded = True
+    return _pack
+
+
+def _remember(model_path, mtime, model):
+    """Add to the registry (caller holds _models_lock), evicting beyond MAX_RESIDENT_MODELS"""
+    _models[model_path] = (mtime, model)
+    _models.move_to_end(model_path)
+    while MAX_RESIDENT_MODELS and len(_models) > MAX_RESIDENT_MODELS:
+        evicted, _ = _models.popitem(last=False)
+        logger.info(f"Evicted model {evicted}")
+
+
+def load_model(metric, region):
+    """Model for `metric` in `region` from the registry; raises FileNotFoundError if there is none.
+
+    In a sharded worker, raises WrongShardError for regions owned by another shard.
+    Only registry bookkeeping holds _models_lock; a file is unpickled outside
+    it, once, while other requests for the same file wait for that load.
+    """
+    check_region(region)
+    model_path = os.path.join(MODELS_DIR, f"{metric}_{region}.joblib")
+    mtime = os.stat(model_path).st_mtime_ns
+
+    while True:
+        with _models_lock:
+            cached = _models.get(model_path)
+            if cached is None and USE_MODEL_PACK:
+                pack = _get_pack()
+                forest = pack.get(f"{metric}_{region}") if pack is not None else None
+                if forest is not None:
+                    _remember(model_path, mtime, forest)
+                    cached = (mtime, forest)
+            if cached is not None and cached[0] == mtime:
+                _models.move_to_end(model_path)
+                return cached[1]
+            loading = _loading.get(model_path)
+            if loading is None:
+                loading = _loading[model_path] = threading.Event()
+                break
+        # Another request is loading this file; use its result (or retry if it failed)
+        loading.wait()
+
     try:
-        import os
-        model_path = os.path.join(os.path.dirname(__file__), f"models/{metric}_{region}.joblib")
         logger.info(f"Loading model from: {model_path}")
         model = joblib.load(model_path)
+        with _models_lock:
+            _remember(model_path, mtime, model)
+    finally:
+        with _models_lock:
+            del _loading[model_path]
+        loading.set()
+
+    if cached is not None:
+        logger.info(f"Model file changed, reloaded {model_path}")
+        _notify_reloaded()
+    return model
+
+
+def resident_models():
+    """Names of the loaded models, least recently used first"""
+    with _models_lock:
+        return [os.path.basename(path)[:-len(".joblib")] for path in _models]
+
+
+def reload_models():
+    """Drop every loaded model; they are loaded again on next use"""
+    global _pack_loaded
+    with _models_lock:
+        _models.clear()
+        _pack_loaded = False
+    _notify_reloaded()
+
+
+def _model_files_state():
+    """(name, mtime, size) of every file in MODELS_DIR: models, manifest, grid and pack"""
+    state = []
+    for filename in sorted(os.listdir(MODELS_DIR)):
+        if ".tmp" not in filename:
+            stat = os.stat(os.path.join(MODELS_DIR, filename))
+            state.append((filename, stat.st_mtime_ns, stat.st_size))
+    return state
+
+
+def check_models():
+    """Reload models (and notify listeners) if any model file changed since the last check.
+
+    Results derived from the models (cached forecasts, the baseline grid) are
+    served without loading a model, so request paths call this first. The
+    files are stat'ed at most once per MODELS_CHECK_SECONDS.
+    """
+    global _files_checked, _files_state
+    if time.monotonic() - _files_checked < MODELS_CHECK_SECONDS:
+        return
+    with _files_lock:
+        if time.monotonic() - _files_checked < MODELS_CHECK_SECONDS:
+            return
+        try:
+            state = _model_files_state()
+        except OSError as e:
+            logger.error(f"Could not check model files: {e}")
+            return
+        finally:
+            _files_checked = time.monotonic()
+        changed = _files_state is not None and state != _files_state
+        _files_state = state
+    if changed:
+        logger.info("Model files changed on disk, reloading models")
+        reload_models()
+
+
+def feature_value(feature, context, defaults=None):
+    """Value for a non-year feature: context, then defaults, then DEFAULT_VALUES"""
+    if feature in context:
+        return context[feature]
+    if defaults and feature in defaults:
+        return defaults[feature]
+    return DEFAULT_VALUES.get(feature, 0)
+
+
+def build_features(metric, years, context, defaults=None):
+    """Feature matrix (one row per year) in the column order the model expects"""
+    expected_features = MODEL_FEATURES.get(metric, ['year'])
+    columns = {}
+    for feature in expected_features:
+        if feature == 'year':
+            columns[feature] = list(years)
+        else:
+            columns[feature] = [feature_value(feature, context, defaults)] * len(years)
+    return pd.DataFrame(columns)[expected_features]
+
+
+def predict_future(metric, region, start_year, end_year, context, defaults=None):
+    """Forecast `metric` for each year in [start_year, end_year].
+
+    Features missing from `context` come from `defaults` (e.g. the latest real
+    observations) and then from DEFAULT_VALUES.
+    """
+    try:
+        model = load_model(metric, region)
     except FileNotFoundError:
         error_msg = f"No model found for {metric} in {region}"
         logger.error(error_msg)
         return {"error": error_msg}
 
     years = list(range(start_year, end_year + 1))
-    results = []
     
     logger.info(f"Predicting {metric} for years {start_year}-{end_year}")
     logger.info(f"Context provided: {context}")
-    
-    # Get the features this model expects
-    expected_features = MODEL_FEATURES.get(metric, ['year'])
-    logger.info(f"Model expects features: {expected_features}")
-
-    for year in years:
-        # Start with empty row
-        row = {}
-        
-        # Add features in the order the model expects
-        for feature in expected_features:
-            if feature == 'year':
-                row[feature] = year
-            elif feature in context:
-                row[feature] = context[feature]
-            else:
-                row[feature] = DEFAULT_VALUES.get(feature, 0)
-        
-        logger.debug(f"Prediction features for year {year}: {row}")
-        
-        # Create DataFrame with features in correct order
-        X = pd.DataFrame([row])[expected_features]
-        y_pred = model.predict(X)[0]
-        results.append({ "year": year, "region": region, metric: round(y_pred, 2) })
+    logger.info(f"Model expects features: {MODEL_FEATURES.get(metric, ['year'])}")
+
+    # All years in one predict call
+    X = build_features(metric, years, context, defaults)
+    y_pred = model.predict(X)
+    results = [
+        { "year": year, "region": region, metric: round(float(y), 2) }
+        for year, y in zip(years, y_pred)
+    ]
 
     logger.info(f"Successfully predicted {len(results)} points for {metric}")
     return results
+
+
+def predict_many(requests):
+    """predict_future for a list of (metric, region, start_year, end_year, context) requests.
+
+    Requests for the same model are stacked into one feature matrix and
+    predicted with a single model.predict call. If that fails, each of the
+    model's requests gets {"error": ...} and the other models are unaffected.
+    """
+    results = [None] * len(requests)
+    by_model = {}
+    for i, (metric, region, start_year, end_year, context) in enumerate(requests):
+        by_model.setdefault((metric, region), []).append(i)
+
+    for (metric, region), indices in by_model.items():
+        # A failure only affects the requests for this model
+        try:
+            model = load_model(metric, region)
+            spans = [list(range(requests[i][2], requests[i][3] + 1)) for i in indices]
+            X = pd.concat([build_features(metric, years, requests[i][4]) for i, years in zip(indices, spans)],
+                          ignore_index=True)
+            y_pred = model.predict(X) if len(X) else []
+        except FileNotFoundError:
+            error_msg = f"No model found for {metric} in {region}"
+            logger.error(error_msg)
+            for i in indices:
+                results[i] = {"error": error_msg}
+            continue
+        except Exception as e:
+            error_msg = f"Forecast failed for {metric} in {region}: {e}"
+            logger.error(error_msg)
+            for i in indices:
+                results[i] = {"error": error_msg}
+            continue
+
+        offset = 0
+        for i, years in zip(indices, spans):
+            results[i] = [
+                {"year": year, "region": region, metric: round(float(y), 2)}
+                for year, y in zip(years, y_pred[offset:offset + len(years)])
+            ]
+            offset += len(years)
+        logger.info(f"Predicted {len(indices)} request(s) for {metric} in {region} in one call")
+    return results
+
+
+def period_code(year, quarter=0):
+    """Sortable period integer, year * 10 + quarter (0 = the whole year), as in the ETL's periods.py"""
+    return year * 10 + quarter
+
+
+def quarterly_rows(rows, metric):
+    """Quarterly forecast rows from annual predict_future rows.
+
+    Each annual value sits at mid-year and quarters are read off the line
+    through neighbouring years at their midpoints (extended past the first and
+    last year), so a quarter's four values average to the annual value
+    wherever the path is linear. Errors and empty results pass through.
+    """
+    if not isinstance(rows, list) or not rows:
+        return rows
+    mid = np.array([row["year"] for row in rows], dtype=float) + 0.5
+    values = np.array([row[metric] for row in rows], dtype=float)
+    t = (mid[:, None] + (np.array(QUARTERS) - 2.5) / 4).ravel()
+    quarterly = np.interp(t, mid, values)
+    if len(rows) > 1:
+        first_slope = (values[1] - values[0]) / (mid[1] - mid[0])
+        last_slope = (values[-1] - values[-2]) / (mid[-1] - mid[-2])
+        quarterly = np.where(t < mid[0], values[0] + (t - mid[0]) * first_slope, quarterly)
+        quarterly = np.where(t > mid[-1], values[-1] + (t - mid[-1]) * last_slope, quarterly)
+    periods = [(row, quarter) for row in rows for quarter in QUARTERS]
+    return [
+        {**row, "quarter": quarter, "period": period_code(row["year"], quarter), metric: round(float(value), 2)}
+        for (row, quarter), value in zip(periods, quarterly)
+    ]
+
+
+def observed_defaults(snapshot, region, metrics, start_year, model_map=None):
+    """Latest real observation before `start_year` of every feature the metrics' models use"""
+    model_map = model_map or {}
+    features = {f for m in metrics for f in MODEL_FEATURES.get(model_map.get(m, m), []) if f != 'year'}
+    return snapshot.latest_values(region, sorted(features), before_year=start_year)
+
+
+def predict_with_history(region, metrics, start_year, end_year, context=None, model_map=None,
+                         levers=None, coupled=False):
+    """History before `start_year` plus forecasts for every metric, in one call.
+
+    History and feature defaults come from the in-memory facts snapshot, so
+    missing model features are filled with the latest real observations
+    instead of DEFAULT_VALUES. If the snapshot cannot be loaded, history is
+    empty, the forecast uses DEFAULT_VALUES and `warnings` says so.
+    `model_map` maps a metric to the model that forecasts it (defaults to the
+    metric itself). With `levers` the forecast rows are lever-adjusted and the
+    unadjusted rows are returned as `baseline`.
+    """
+    from facts_snapshot import get_snapshot
+    from policy_levers import simulate_levers
+
+    context = context or {}
+    warnings = []
+    try:
+        snapshot = get_snapshot()
+        history = snapshot.history(region, metrics, before_year=start_year)
+        observed = observed_defaults(snapshot, region, metrics, start_year, model_map)
+    except Exception as e:
+        logger.warning(f"Facts snapshot unavailable, using DEFAULT_VALUES: {e}")
+        warnings.append(f"No history and forecast uses DEFAULT_VALUES: {e}")
+        snapshot, history, observed = None, [], {}
+
+    years, baseline, adjusted, errors = simulate_levers(
+        region, metrics, start_year, end_year, [{"name": "levers", "levers": levers or []}],
+        context=context, defaults=observed, model_map=model_map, coupled=coupled
+    )
+
+    def rows(values):
+        out = []
+        for t, year in enumerate(years.tolist()):
+            row = {"year": year, "region": region, "source": "simulated"}
+            for i, metric in enumerate(metrics):
+                if metric not in errors:
+                    row[metric] = round(float(values[i, t]), 2)
+            out.append(row)
+        return out if len(errors) < len(metrics) else []
+
+    result = {
+        "history": history,
+        "forecast": rows(adjusted[0]),
+        "context": {**observed, **context},
+        "errors": errors,
+        "warnings": warnings,
+        "snapshotLoadedAt": snapshot.loaded_at if snapshot is not None else None,
+    }
+    if levers:
+        result["baseline"] = rows(baseline)
+    return result
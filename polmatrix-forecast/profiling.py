@@ -0,0 +1,337 @@
+# profiling.py
+#
+# Opt-in sampling profiler for forecast requests.
+#
+# A request is profiled when it sends the X-Profile header (unless
+# FORECAST_PROFILE_HEADER=0) or while profiling is switched on for every
+# request with POST /admin/profiling. Its work runs on a pool thread and, while
+# it runs, a sampler thread records that thread's Python stack every
+# FORECAST_PROFILE_INTERVAL_MS. Each sample is weighted by the time since the
+# previous one, so time spent in joblib.load, DataFrame construction,
+# model.predict and JSON rendering is attributed to the stacks it was spent
+# under. The sampler needs the GIL to read a stack: code that releases it (file
+# I/O, LightGBM) is sampled at the full rate, pure-Python stretches about once
+# per sys.getswitchinterval() (5 ms by default).
+#
+# The last FORECAST_PROFILE_BUFFER profiles are kept in memory, per worker
+# process, and export as speedscope JSON (https://www.speedscope.app) or as a
+# pstats file (python -m pstats, snakeviz). When profiling is off a request
+# pays one flag check and, if headers are allowed, one header lookup.
+#
+# With several workers on one port (supervisor.py) a request reaches any of
+# them, so the supervisor sets FORECAST_PROFILE_DIR to a directory they share.
+# Each worker then also writes its profiles there, lookups fall back to the
+# directory, and the admin toggle is written to a state file that every worker
+# re-reads at most once per STATE_CHECK_SECONDS.
+import itertools
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# --- CONFIGURATION ---
+BUFFER_SIZE = int(os.getenv("FORECAST_PROFILE_BUFFER", "50"))
+INTERVAL_MS = float(os.getenv("FORECAST_PROFILE_INTERVAL_MS", "1"))
+ALLOW_HEADER = os.getenv("FORECAST_PROFILE_HEADER", "1") == "1"
+SHARED_DIR = os.getenv("FORECAST_PROFILE_DIR")
+STATE_CHECK_SECONDS = 1.0
+STATE_FILE = "state.json"
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+EXPORT_FORMATS = ("summary", "speedscope", "pstats")
+
+logger = logging.getLogger(__name__)
+
+
+class Profile:
+    """Stack samples of one profiled call"""
+
+    def __init__(self, profile_id, name, interval):
+        self.id = profile_id
+        self.name = name
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.error = None
+        self.frames = []        # (function, file, first line)
+        self._frame_index = {}
+        self.samples = []       # stacks of frame indices, outermost first
+        self.weights = []       # seconds each sample stands for
+
+    def to_dict(self):
+        return {
+            "id": self.id, "name": self.name, "interval": self.interval, "startedAt": self.started_at,
+            "duration": self.duration, "error": self.error, "frames": self.frames,
+            "samples": self.samples, "weights": self.weights,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data["id"], data["name"], data["interval"])
+        profile.started_at = data["startedAt"]
+        profile.duration = data["duration"]
+        profile.error = data["error"]
+        profile.frames = [tuple(frame) for frame in data["frames"]]
+        profile.samples = data["samples"]
+        profile.weights = data["weights"]
+        return profile
+
+    def add_sample(self, frame, root, weight):
+        """Record the stack from `frame` out to (not including) `root`"""
+        stack = []
+        while frame is not None and frame is not root:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self.frames)
+                self.frames.append(key)
+            stack.append(index)
+            frame = frame.f_back
+        if stack:
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(weight)
+
+    def function_stats(self):
+        """{frame index: [samples, self seconds, total seconds, {caller index: [samples, seconds]}]}"""
+        stats = {}
+        for stack, weight in zip(self.samples, self.weights):
+            seen = set()
+            for depth, index in enumerate(stack):
+                entry = stats.setdefault(index, [0, 0.0, 0.0, {}])
+                if index in seen:
+                    continue  # recursion: count each function once per sample
+                seen.add(index)
+                entry[0] += 1
+                entry[2] += weight
+                if depth:
+                    edge = entry[3].setdefault(stack[depth - 1], [0, 0.0])
+                    edge[0] += 1
+                    edge[1] += weight
+            stats[stack[-1]][1] += weight
+        return stats
+
+    def summary(self, top=10):
+        stats = self.function_stats()
+        hottest = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "startedAt": self.started_at,
+            "durationMs": round(self.duration * 1000, 3),
+            "samples": len(self.samples),
+            "sampledMs": round(sum(self.weights) * 1000, 3),
+            "intervalMs": self.interval * 1000,
+            "error": self.error,
+            "top": [
+                {
+                    "function": self._label(index),
+                    "selfMs": round(entry[1] * 1000, 3),
+                    "totalMs": round(entry[2] * 1000, 3),
+                }
+                for index, entry in hottest
+            ],
+        }
+
+    def _label(self, index):
+        function, filename, line = self.frames[index]
+        return f"{function} ({os.path.basename(filename)}:{line})"
+
+    def speedscope(self):
+        """Speedscope file (sampled profile, milliseconds)"""
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": f, "file": path, "line": line} for f, path, line in self.frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.name} ({self.id})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(self.duration * 1000, 3),
+                "samples": self.samples,
+                "weights": [round(w * 1000, 3) for w in self.weights],
+            }],
+            "name": f"{self.name} ({self.id})",
+            "activeProfileIndex": 0,
+            "exporter": "polmatrix-forecast profiling.py",
+        }
+
+    def pstats(self):
+        """Marshalled stats dict that pstats.Stats loads; call counts are sample counts"""
+        def key(index):
+            function, filename, line = self.frames[index]
+            return (filename, line, function)
+
+        stats = {}
+        for index, (count, self_time, total, callers) in self.function_stats().items():
+            stats[key(index)] = (count, count, self_time, total,
+                                 {key(c): (n, n, 0.0, t) for c, (n, t) in callers.items()})
+        return marshal.dumps(stats)
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's stack until stopped"""
+
+    def __init__(self, profile, thread_id, root):
+        super().__init__(name=f"profile-{profile.id}", daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.root = root
+        self.stopped = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.profile.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.profile.add_sample(frame, self.root, now - last)
+            last = now
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class Profiler:
+    def __init__(self, capacity=BUFFER_SIZE, interval_ms=INTERVAL_MS, allow_header=ALLOW_HEADER,
+                 shared_dir=SHARED_DIR):
+        self.enabled = False  # admin toggle: profile every request
+        self.allow_header = allow_header
+        self.interval = interval_ms / 1000
+        self.shared_dir = shared_dir
+        self._profiles = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._state_checked = 0.0
+        self._state_mtime = None
+
+    def _shared_path(self, name):
+        return os.path.join(self.shared_dir, name)
+
+    def _sync_state(self):
+        """Pick up a toggle written by another worker"""
+        self._state_checked = time.monotonic()
+        try:
+            mtime = os.stat(self._shared_path(STATE_FILE)).st_mtime_ns
+            if mtime != self._state_mtime:
+                with open(self._shared_path(STATE_FILE), encoding="utf-8") as f:
+                    state = json.load(f)
+                self.enabled = state["enabled"]
+                self.interval = state["intervalMs"] / 1000
+                self._state_mtime = mtime
+        except (OSError, ValueError, KeyError):
+            pass  # no toggle written yet, or one being replaced
+
+    def wanted(self, headers):
+        """Whether a request with these headers should be profiled"""
+        if self.shared_dir is not None and time.monotonic() - self._state_checked >= STATE_CHECK_SECONDS:
+            self._sync_state()
+        if self.enabled:
+            return True
+        if not self.allow_header:
+            return False
+        flag = headers.get(PROFILE_HEADER)
+        return flag is not None and flag.lower() not in ("0", "false", "off")
+
+    def run(self, name, func, *args):
+        """(func(*args), profile); the profile is stored even if func raises"""
+        profile = Profile(f"{os.getpid():x}-{next(self._ids)}", name, self.interval)
+        sampler = _Sampler(profile, threading.get_ident(), sys._getframe())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            return func(*args), profile
+        except Exception as e:
+            profile.error = str(e)
+            raise
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            profile.duration = time.perf_counter() - started
+            with self._lock:
+                evicted = self._profiles[0] if len(self._profiles) == self._profiles.maxlen else None
+                self._profiles.append(profile)
+            if self.shared_dir is not None:
+                self._share(profile, evicted)
+
+    def _share(self, profile, evicted):
+        try:
+            _write_json(self._shared_path(f"{profile.id}.json"), profile.to_dict())
+            if evicted is not None:
+                os.remove(self._shared_path(f"{evicted.id}.json"))
+        except OSError as e:
+            logger.warning(f"Could not share profile {profile.id}: {e}")
+
+    def _shared_profiles(self):
+        profiles = []
+        for filename in os.listdir(self.shared_dir):
+            if filename.endswith(".json") and filename != STATE_FILE:
+                profile = self._read_shared(filename[:-len(".json")])
+                if profile is not None:
+                    profiles.append(profile)
+        return profiles
+
+    def _read_shared(self, profile_id):
+        try:
+            with open(self._shared_path(f"{profile_id}.json"), encoding="utf-8") as f:
+                return Profile.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None  # evicted meanwhile
+
+    def configure(self, enabled=None, interval_ms=None):
+        # Validate, then share, then apply, so a rejected change alters no worker
+        if interval_ms is not None:
+            if isinstance(interval_ms, bool) or not isinstance(interval_ms, (int, float)) or not interval_ms > 0:
+                raise ValueError("intervalMs must be a positive number")
+        enabled = self.enabled if enabled is None else bool(enabled)
+        interval = self.interval if interval_ms is None else interval_ms / 1000
+        if self.shared_dir is not None:
+            _write_json(self._shared_path(STATE_FILE), {"enabled": enabled, "intervalMs": interval * 1000})
+        self.enabled = enabled
+        self.interval = interval
+        return self.state()
+
+    def state(self):
+        if self.shared_dir is not None:
+            self._sync_state()
+        with self._lock:
+            stored = len(self._profiles)
+        return {
+            "enabled": self.enabled,
+            "headerAllowed": self.allow_header,
+            "intervalMs": self.interval * 1000,
+            "stored": stored,
+            "capacity": self._profiles.maxlen,
+            "shared": self.shared_dir is not None,
+        }
+
+    def profiles(self):
+        """Stored profiles, newest first; every worker's when they share a directory"""
+        if self.shared_dir is not None:
+            return sorted(self._shared_profiles(), key=lambda p: p.started_at, reverse=True)
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id):
+        with self._lock:
+            profile = next((p for p in self._profiles if p.id == profile_id), None)
+        if profile is None and self.shared_dir is not None and os.path.basename(profile_id) == profile_id:
+            profile = self._read_shared(profile_id)
+        return profile
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profiler = Profiler()
@@ -0,0 +1,183 @@
+# router.py
+#
+# Front end for region-sharded forecast workers.
+#
+# Exposes the same API as main.py. Each request goes to the shard that owns
+# its region (sharding.HashRing over FORECAST_SHARD_URLS); /forecast_batch is
+# split by shard, the parts are sent concurrently and the results merged back
+# into request order. Admin and stats endpoints fan out to every shard.
+# The X-Profile header (profiling.py) is passed on and the shard's X-Profile-Id
+# returned; /admin/profiles/{id} asks each shard until one has the profile.
+#
+# Started by supervisor.ShardSupervisor (`python run_server.py --shards N`).
+import asyncio
+import logging
+import os
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from profiling import PROFILE_HEADER, PROFILE_ID_HEADER
+from sharding import HashRing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+SHARD_URLS = [u.strip().rstrip("/") for u in os.getenv("FORECAST_SHARD_URLS", "").split(",") if u.strip()]
+TIMEOUT = float(os.getenv("FORECAST_ROUTER_TIMEOUT", "60"))
+DEFAULT_REGION = "US"
+
+ring = HashRing(len(SHARD_URLS)) if SHARD_URLS else None
+client = None
+
+app = FastAPI()
+
+
+def shard_url(region):
+    if ring is None:
+        raise HTTPException(status_code=503, detail="No shards configured (FORECAST_SHARD_URLS)")
+    return SHARD_URLS[ring.shard_for(region)]
+
+
+def _profile_headers(request):
+    flag = request.headers.get(PROFILE_HEADER)
+    return {PROFILE_HEADER: flag} if flag is not None else None
+
+
+async def _post(url, path, body, headers=None):
+    try:
+        return await client.post(f"{url}{path}", json=body, headers=headers)
+    except httpx.HTTPError as e:
+        logger.error(f"Shard {url} unreachable: {e}")
+        raise HTTPException(status_code=502, detail=f"Shard {url} unreachable: {e}")
+
+
+async def _forward(request, region, path, body):
+    response = await _post(shard_url(region), path, body, _profile_headers(request))
+    profile_id = response.headers.get(PROFILE_ID_HEADER)
+    return JSONResponse(status_code=response.status_code, content=response.json(),
+                        headers={PROFILE_ID_HEADER: profile_id} if profile_id else None)
+
+
+@app.on_event("startup")
+async def open_client():
+    global client
+    limits = httpx.Limits(max_connections=64 * max(len(SHARD_URLS), 1), max_keepalive_connections=64)
+    client = httpx.AsyncClient(timeout=TIMEOUT, limits=limits)
+    logger.info(f"Routing to {len(SHARD_URLS)} shard(s): {SHARD_URLS}")
+
+
+@app.on_event("shutdown")
+async def close_client():
+    await client.aclose()
+
+
+@app.post("/forecast")
+async def forecast(request: Request):
+    body = await request.json()
+    return await _forward(request, body.get("region"), "/forecast", body)
+
+
+@app.post("/forecast_with_history")
+async def forecast_with_history(request: Request):
+    body = await request.json()
+    return await _forward(request, body.get("region", DEFAULT_REGION), "/forecast_with_history", body)
+
+
+@app.post("/simulate_levers")
+async def simulate_levers(request: Request):
+    body = await request.json()
+    return await _forward(request, body.get("region", DEFAULT_REGION), "/simulate_levers", body)
+
+
+@app.post("/sensitivity")
+async def sensitivity(request: Request):
+    body = await request.json()
+    return await _forward(request, body.get("region", DEFAULT_REGION), "/sensitivity", body)
+
+
+@app.post("/forecast_batch")
+async def forecast_batch(request: Request):
+    # Split by owning shard, send the parts concurrently, merge in request order
+    body = await request.json()
+    items = body["requests"]
+    parts = {}
+    for i, item in enumerate(items):
+        parts.setdefault(shard_url(item.get("region")), []).append(i)
+
+    async def send(url, indices):
+        response = await _post(url, "/forecast_batch", {"requests": [items[i] for i in indices]},
+                               _profile_headers(request))
+        if response.status_code != 200:
+            return [{"error": f"Shard {url} returned {response.status_code}: {response.text[:300]}"}] * len(indices)
+        return response.json()["results"]
+
+    answers = await asyncio.gather(*(send(url, indices) for url, indices in parts.items()))
+    results = [None] * len(items)
+    for indices, part in zip(parts.values(), answers):
+        for i, result in zip(indices, part):
+            results[i] = result
+    return {"results": results}
+
+
+async def _broadcast(method, path, body=None):
+    async def one(url):
+        try:
+            response = await client.request(method, f"{url}{path}", json=body)
+            return url, response.json()
+        except httpx.HTTPError as e:
+            return url, {"error": str(e)}
+    return dict(await asyncio.gather(*(one(url) for url in SHARD_URLS)))
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return await _broadcast("GET", "/cache/stats")
+
+
+@app.get("/admin/models")
+async def admin_models():
+    return await _broadcast("GET", "/admin/models")
+
+
+@app.post("/admin/reload_models")
+async def admin_reload_models():
+    return await _broadcast("POST", "/admin/reload_models")
+
+
+@app.get("/admin/profiling")
+async def admin_profiling():
+    return await _broadcast("GET", "/admin/profiling")
+
+
+@app.post("/admin/profiling")
+async def admin_set_profiling(request: Request):
+    return await _broadcast("POST", "/admin/profiling", await request.json())
+
+
+@app.get("/admin/profiles")
+async def admin_profiles():
+    return await _broadcast("GET", "/admin/profiles")
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: str, format: str = "summary"):
+    # Profile ids are per process, so ask every shard until one has it
+    for url in SHARD_URLS:
+        try:
+            response = await client.get(f"{url}/admin/profiles/{profile_id}", params={"format": format})
+        except httpx.HTTPError as e:
+            logger.warning(f"Shard {url} unreachable: {e}")
+            continue
+        if response.status_code != 404:
+            headers = {k: v for k, v in response.headers.items() if k.lower() == "content-disposition"}
+            return Response(response.content, status_code=response.status_code,
+                            media_type=response.headers.get("content-type"), headers=headers)
+    raise HTTPException(status_code=404, detail=f"No shard has profile {profile_id}")
+
+
+@app.get("/")
+async def root():
+    return {"message": "Polmatrix Forecast Router", "status": "running", "shards": SHARD_URLS}
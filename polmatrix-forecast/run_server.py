@@ -1,6 +1,34 @@
 # run_server.py
+#
+# Usage:
+#   python run_server.py                  # single process
+#   python run_server.py --workers 4      # supervisor + 4 workers sharing the model pack
+#   python run_server.py --shards 4       # router + 4 workers, each owning a share of the regions
+import argparse
+import logging
+import os
+
 import uvicorn
-from main import app
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="Run the forecast service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("FORECAST_WORKERS", "1")))
+    parser.add_argument("--shards", type=int, default=int(os.getenv("FORECAST_SHARDS", "0")),
+                        help="Region-sharded workers behind a router (ports port+1..port+N)")
+    parser.add_argument("--no-pack", action="store_true",
+                        help="Workers unpickle their own models instead of sharing the model pack")
+    args = parser.parse_args()
+
+    if args.shards > 0:
+        from supervisor import serve_sharded
+        logging.basicConfig(level=logging.INFO)
+        serve_sharded("main:app", args.host, args.port, args.shards, use_pack=not args.no_pack)
+    elif args.workers > 1:
+        from supervisor import serve
+        logging.basicConfig(level=logging.INFO)
+        serve("main:app", args.host, args.port, args.workers, use_pack=not args.no_pack)
+    else:
+        from main import app
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,138 @@
+# sensitivity.py
+#
+# Partial-dependence curves and finite-difference sensitivities of a metric's
+# forecast with respect to each of its context features.
+#
+# For F features with G_f grid points each and T years every perturbed feature
+# matrix is stacked into one (T + sum(G_f)*T + 2*F*T) x n_features array and
+# predicted with a single model.predict call:
+#
+#   rows [0, T)                      the unperturbed forecast
+#   partial_dependence[f][g, t]      feature f set to grid[f][g] in year t
+#   sensitivity[f, t]                central difference (y(x + h) - y(x - h)) / 2h
+#   elasticity[f, t]                 sensitivity * x / y
+#
+# Requests are limited to MAX_GRID_POINTS per feature and MAX_STACKED_ROWS
+# stacked rows, so one request cannot exhaust the worker's memory.
+#
+# Curves are conditional on the request's context (and observed defaults), one
+# per year, rather than averaged over a dataset. `year` is the time axis and is
+# not perturbed. Tree models are piecewise constant, so sensitivities are 0
+# wherever no split lies within +-h of the current value.
+import numpy as np
+import pandas as pd
+
+from model_runner import MODEL_FEATURES, build_features, load_model
+
+DEFAULT_GRID_POINTS = 9
+DEFAULT_SPREAD = 0.5      # grid spans value * (1 +- spread)
+DEFAULT_EPSILON = 0.05    # h = epsilon * |value| (epsilon when the value is 0)
+MAX_GRID_POINTS = 101     # per feature, for gridPoints and explicit grids
+MAX_STACKED_ROWS = 250000  # rows of the stacked matrix, bounds one request's memory
+
+
+def feature_grid(value, n_points=DEFAULT_GRID_POINTS, spread=DEFAULT_SPREAD):
+    """Evenly spaced values around `value`; a single point is `value` itself"""
+    if n_points == 1:
+        return np.array([value], dtype=float)
+    half_width = spread * abs(value) if value else spread
+    return np.linspace(value - half_width, value + half_width, n_points)
+
+
+def sensitivity_analysis(metric, region, start_year, end_year, context=None, defaults=None,
+                         grid_points=DEFAULT_GRID_POINTS, spread=DEFAULT_SPREAD, grids=None,
+                         epsilon=DEFAULT_EPSILON):
+    """(years, features, base_values, grid[F][G_f], baseline[T], pd[F][G_f][T], sensitivity[F][T], elasticity[F][T]).
+
+    `grids` optionally maps a feature to explicit grid values, of any length;
+    grid and pd are lists with one array per feature. Raises ValueError for a
+    grid that is not a non-empty list of numbers, for more than MAX_GRID_POINTS
+    grid points and when the stacked matrix would exceed MAX_STACKED_ROWS;
+    FileNotFoundError if there is no model for metric/region.
+    """
+    context = context or {}
+    grids = grids or {}
+    features = [f for f in MODEL_FEATURES.get(metric, ['year']) if f != 'year']
+
+    # Reject oversized requests before building anything
+    if (not isinstance(grid_points, (int, float)) or grid_points != int(grid_points)
+            or not 1 <= grid_points <= MAX_GRID_POINTS):
+        raise ValueError(f"gridPoints must be an integer from 1 to {MAX_GRID_POINTS}")
+    grid_points = int(grid_points)
+    lengths = []
+    for f in features:
+        n_points = len(grids[f]) if f in grids and isinstance(grids[f], (list, tuple)) else grid_points
+        if n_points > MAX_GRID_POINTS:
+            raise ValueError(f"Grid for {f} has {n_points} points, at most {MAX_GRID_POINTS} allowed")
+        lengths.append(n_points)
+    n_rows = max(end_year - start_year + 1, 0) * (1 + sum(lengths) + 2 * len(features))
+    if n_rows > MAX_STACKED_ROWS:
+        raise ValueError(f"Request needs {n_rows} predictions, at most {MAX_STACKED_ROWS} allowed; "
+                         f"use fewer years or grid points")
+
+    model = load_model(metric, region)
+
+    years = np.arange(start_year, end_year + 1)
+    X = build_features(metric, years, context, defaults)
+    columns = list(X.columns)
+    base = X.to_numpy(dtype=float)
+    n_years, n_features = len(years), len(features)
+
+    base_values = {f: float(base[0, columns.index(f)]) for f in features}
+    grid = []
+    for f in features:
+        values = np.asarray(grids[f], dtype=float) if f in grids else feature_grid(base_values[f], grid_points, spread)
+        if values.ndim != 1 or not len(values):
+            raise ValueError(f"Grid for {f} must be a non-empty list of numbers")
+        grid.append(values)
+    step = np.array([epsilon * abs(base_values[f]) or epsilon for f in features], dtype=float)
+
+    # Every perturbed copy of X in one stacked matrix: each feature's (G_f, T) grid rows, then (F, 2, T) +-h rows
+    blocks = [base]
+    fd_rows = np.broadcast_to(base, (n_features, 2, n_years, base.shape[1])).copy()
+    for i, feature in enumerate(features):
+        col = columns.index(feature)
+        pd_rows = np.broadcast_to(base, (len(grid[i]), n_years, base.shape[1])).copy()
+        pd_rows[:, :, col] = grid[i][:, None]
+        blocks.append(pd_rows.reshape(-1, base.shape[1]))
+        fd_rows[i, 0, :, col] += step[i]
+        fd_rows[i, 1, :, col] -= step[i]
+    blocks.append(fd_rows.reshape(-1, base.shape[1]))
+
+    predicted = model.predict(pd.DataFrame(np.concatenate(blocks), columns=columns))
+
+    baseline = predicted[:n_years]
+    partial, offset = [], n_years
+    for values in grid:
+        partial.append(predicted[offset:offset + len(values) * n_years].reshape(len(values), n_years))
+        offset += len(values) * n_years
+    plus_minus = predicted[offset:].reshape(n_features, 2, n_years)
+    slope = (plus_minus[:, 0] - plus_minus[:, 1]) / (2 * step[:, None])
+    values = np.array([base_values[f] for f in features])[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        elasticity = np.where(baseline != 0, slope * values / baseline, np.nan)
+    return years, features, base_values, grid, baseline, partial, slope, elasticity
+
+
+def _rounded(array, digits=4):
+    """Nested lists with NaN as None"""
+    return np.where(np.isnan(array), None, np.round(array, digits)).tolist()
+
+
+def sensitivity_response(metric, region, start_year, end_year, **kwargs):
+    """JSON-ready result of sensitivity_analysis; arrays are feature-major"""
+    years, features, base_values, grid, baseline, partial, slope, elasticity = sensitivity_analysis(
+        metric, region, start_year, end_year, **kwargs
+    )
+    return {
+        "metric": metric,
+        "region": region,
+        "years": years.tolist(),
+        "features": features,
+        "baseValues": base_values,
+        "grid": [_rounded(g) for g in grid],           # [feature][grid point]
+        "baseline": _rounded(baseline),                # [year]
+        "partialDependence": [_rounded(p) for p in partial],  # [feature][grid point][year]
+        "sensitivity": _rounded(slope),                # [feature][year], d metric / d feature
+        "elasticity": _rounded(elasticity),            # [feature][year]
+    }
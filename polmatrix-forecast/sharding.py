@@ -0,0 +1,64 @@
+# sharding.py
+#
+# Consistent-hash assignment of regions to forecast shards.
+#
+# Every shard owns VNODES points on a 64-bit hash ring; a region belongs to the
+# first shard point at or after the region's hash. The router (router.py) and
+# every worker build the same ring from the shard count, so they agree on
+# ownership without coordination, and growing from N to N+1 shards only moves
+# about 1/(N+1) of the regions.
+#
+# A worker learns its shard from FORECAST_SHARD="<index>/<count>" (set by
+# supervisor.ShardSupervisor); without it the process serves every region.
+import bisect
+import hashlib
+import os
+
+VNODES = 128
+
+
+class WrongShardError(LookupError):
+    """A request for a region owned by another shard reached this worker"""
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, n_shards, vnodes=VNODES):
+        if n_shards < 1:
+            raise ValueError("n_shards must be >= 1")
+        points = sorted((_hash(f"shard-{s}#{v}"), s) for s in range(n_shards) for v in range(vnodes))
+        self.n_shards = n_shards
+        self._keys = [key for key, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, region):
+        i = bisect.bisect_left(self._keys, _hash(str(region)))
+        return self._shards[i % len(self._keys)]
+
+
+def parse_shard(value):
+    """(index, count) from "<index>/<count>", or None for an empty value"""
+    if not value:
+        return None
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}")
+    return index, count
+
+
+SHARD = parse_shard(os.getenv("FORECAST_SHARD"))
+_ring = HashRing(SHARD[1]) if SHARD else None
+
+
+def owns_region(region):
+    return _ring is None or _ring.shard_for(region) == SHARD[0]
+
+
+def check_region(region):
+    """Raise WrongShardError unless this process serves `region`"""
+    if not owns_region(region):
+        raise WrongShardError(f"Region {region} belongs to shard {_ring.shard_for(region)}, "
+                              f"this is shard {SHARD[0]}/{SHARD[1]}")
@@ -0,0 +1,197 @@
+# supervisor.py
+#
+# Multi-process serving: one supervisor binds the listening socket and runs N
+# uvicorn worker processes on it, restarting any worker that dies.
+#
+# Before starting workers the supervisor makes sure models/forest_pack.npy
+# (model_pack.py) matches the current models and sets FORECAST_MODEL_PACK=1,
+# so every worker predicts from the same read-only memory-mapped trees instead
+# of unpickling its own boosters. The baseline grid is memory-mapped the same
+# way. The facts snapshot and forecast cache stay per worker. Workers share a
+# temporary FORECAST_PROFILE_DIR so request profiles and the profiling toggle
+# (profiling.py) work whichever worker a request reaches.
+#
+# ShardSupervisor instead gives every worker its own loopback port and a
+# consistent-hash share of the regions (sharding.py), and runs router.py on the
+# public port in front of them.
+#
+# Signals: SIGTERM/SIGINT stop all workers, SIGHUP restarts them one by one
+# (e.g. after retraining; the pack is rebuilt first if it is stale).
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+CHECK_INTERVAL = 0.5       # seconds between worker liveness checks
+MIN_UPTIME = 5.0           # a worker dying sooner than this counts as a crash loop
+MAX_BACKOFF = 30.0         # longest wait before restarting a crash-looping worker
+STOP_TIMEOUT = 10.0        # grace period for workers on shutdown
+
+
+def ensure_model_pack():
+    """Build the model pack if it is missing or older than the models; returns True if usable"""
+    from model_manifest import manifest_version
+    from model_pack import ModelPack, build_pack
+
+    try:
+        if ModelPack.open(expected_version=manifest_version()) is None:
+            build_pack()
+        return ModelPack.open(expected_version=manifest_version()) is not None
+    except Exception as e:
+        logger.error(f"Could not build model pack, workers will load models with joblib: {e}")
+        return False
+
+
+def _run_worker(config, sock, env=None):
+    # The app is imported by Server.run, after the worker's environment is set
+    os.environ.update(env or {})
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, app="main:app", host="0.0.0.0", port=8000, workers=2, use_pack=True):
+        self.config = uvicorn.Config(app, host=host, port=port, workers=workers)
+        self.n_workers = workers
+        self.use_pack = use_pack
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []          # [process, started_at, backoff, index]
+        self.stopping = False
+        self.restart_requested = False
+        self.profile_dir = None    # created here, removed on stop
+
+    def _worker_args(self, index):
+        """(name, config, socket, extra env) for worker `index`"""
+        return "forecast-worker", self.config, self.sock, {}
+
+    def _spawn(self, index, backoff=0.0):
+        name, config, sock, env = self._worker_args(index)
+        process = self.context.Process(target=_run_worker, args=(config, sock, env),
+                                       name=name, daemon=False)
+        process.start()
+        logger.info(f"Started {name} pid={process.pid}")
+        return [process, time.monotonic(), backoff, index]
+
+    def _bind(self):
+        self.sock = self.config.bind_socket()
+        return [self.sock]
+
+    def _prepare(self):
+        if self.use_pack and ensure_model_pack():
+            os.environ["FORECAST_MODEL_PACK"] = "1"
+        else:
+            os.environ["FORECAST_MODEL_PACK"] = "0"
+        logger.info(f"Workers will use the model pack: {os.environ['FORECAST_MODEL_PACK'] == '1'}")
+        if not os.environ.get("FORECAST_PROFILE_DIR"):
+            self.profile_dir = tempfile.mkdtemp(prefix="polmatrix-profiles-")
+            os.environ["FORECAST_PROFILE_DIR"] = self.profile_dir
+
+    def _handle_stop(self, signum, frame):
+        logger.info(f"Received signal {signum}, stopping workers")
+        self.stopping = True
+
+    def _handle_hup(self, signum, frame):
+        self.restart_requested = True
+
+    def _check_workers(self):
+        for slot in self.workers:
+            process, started_at, backoff, index = slot
+            if process.is_alive():
+                continue
+            uptime = time.monotonic() - started_at
+            # Back off exponentially while a worker keeps dying right after start
+            backoff = min(max(backoff * 2, 1.0), MAX_BACKOFF) if uptime < MIN_UPTIME else 0.0
+            logger.warning(f"Worker pid={process.pid} exited with code {process.exitcode} "
+                           f"after {uptime:.1f}s; restarting in {backoff:.0f}s")
+            time.sleep(backoff)
+            if self.stopping:
+                return
+            slot[:] = self._spawn(index, backoff)
+
+    def _rolling_restart(self):
+        self.restart_requested = False
+        logger.info("Rolling restart of workers")
+        self._prepare()
+        for slot in self.workers:
+            if self.stopping:
+                return
+            old = slot[0]
+            slot[:] = self._spawn(slot[3])
+            # Old worker finishes its in-flight requests while the new one takes over
+            old.terminate()
+            old.join(STOP_TIMEOUT)
+
+    def _stop_workers(self):
+        for process, *_ in self.workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process, *_ in self.workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Worker pid={process.pid} did not stop, killing it")
+                process.kill()
+                process.join()
+
+    def run(self):
+        self._prepare()
+        sockets = self._bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_hup)
+
+        logger.info(f"Supervisor pid={os.getpid()} starting {self.n_workers} workers "
+                    f"on {self.config.host}:{self.config.port}")
+        self.workers = [self._spawn(i) for i in range(self.n_workers)]
+        try:
+            while not self.stopping:
+                if self.restart_requested:
+                    self._rolling_restart()
+                self._check_workers()
+                time.sleep(CHECK_INTERVAL)
+        finally:
+            self._stop_workers()
+            for sock in sockets:
+                sock.close()
+            if self.profile_dir:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+            logger.info("Supervisor stopped")
+
+
+class ShardSupervisor(Supervisor):
+    """N region shards of main.py on loopback ports port+1..port+N, router.py on `port`"""
+
+    def __init__(self, app="main:app", host="0.0.0.0", port=8000, shards=2, use_pack=True):
+        super().__init__(app, host, port, shards + 1, use_pack)
+        self.n_shards = shards
+        self.shard_configs = [
+            uvicorn.Config(app, host="127.0.0.1", port=port + 1 + i) for i in range(shards)
+        ]
+        self.router_config = uvicorn.Config("router:app", host=host, port=port)
+
+    def _bind(self):
+        self.shard_socks = [config.bind_socket() for config in self.shard_configs]
+        self.router_sock = self.router_config.bind_socket()
+        return self.shard_socks + [self.router_sock]
+
+    def _worker_args(self, index):
+        if index < self.n_shards:
+            return (f"forecast-shard-{index}", self.shard_configs[index], self.shard_socks[index],
+                    {"FORECAST_SHARD": f"{index}/{self.n_shards}"})
+        urls = ",".join(f"http://127.0.0.1:{c.port}" for c in self.shard_configs)
+        return "forecast-router", self.router_config, self.router_sock, {"FORECAST_SHARD_URLS": urls}
+
+
+def serve(app="main:app", host="0.0.0.0", port=8000, workers=2, use_pack=True):
+    Supervisor(app, host, port, workers, use_pack).run()
+
+
+def serve_sharded(app="main:app", host="0.0.0.0", port=8000, shards=2, use_pack=True):
+    ShardSupervisor(app, host, port, shards, use_pack).run()
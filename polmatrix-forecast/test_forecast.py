@@ -1,32 +1,88 @@
-import requests
+import argparse
+import asyncio
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from forecast_client import AsyncForecastClient, ForecastClient
+
+BASE_URL = "http://localhost:8000"
+
 
-def test_forecast():
-    url = "http://localhost:8000/forecast"
+def test_forecast(base_url=BASE_URL):
     payload = {
         "metric": "gdp",
-        "region": "US", 
+        "region": "US",
         "startYear": 2025,
         "endYear": 2027,  # Small range for testing
         "context": {"gdp": 23.0}  # Sample context
     }
-    
+
     try:
         print("Testing forecast service...")
-        print("URL:", url)
+        print("URL:", base_url)
         print("Payload:", json.dumps(payload, indent=2))
-        
-        response = requests.post(url, json=payload)
-        print("Status Code:", response.status_code)
-        print("Response Headers:", dict(response.headers))
-        
-        if response.status_code == 200:
-            print("Success! Response:", response.json())
-        else:
-            print("Error Response:", response.text)
-            
+
+        with ForecastClient(base_url) as client:
+            result = client.forecast(payload["metric"], payload["region"], payload["startYear"],
+                                     payload["endYear"], payload["context"])
+        print("Success! Response:", result.as_dict())
+
     except Exception as e:
         print("Exception:", str(e))
 
+
+def _fanout_requests(n):
+    # Distinct contexts so every call is a real prediction, not a cache/grid hit
+    return [("gdp", "US", 2025, 2035, {"spending": 0.2 + i * 1e-4}) for i in range(n)]
+
+
+def bench_fanout(base_url=BASE_URL, n=500, threads=32):
+    """Throughput of thread fan-out: bare requests.post vs the pooled, batching client"""
+    calls = _fanout_requests(n)
+
+    def bare(args):
+        metric, region, start, end, context = args
+        body = {"metric": metric, "region": region, "startYear": start, "endYear": end, "context": context}
+        return requests.post(f"{base_url}/forecast", json=body).json()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(bare, calls))
+    bare_rate = n / (time.perf_counter() - started)
+
+    calls = _fanout_requests(2 * n)[n:]
+    with ForecastClient(base_url) as client:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda args: client.forecast(*args), calls))
+        client_rate = n / (time.perf_counter() - started)
+
+    calls = _fanout_requests(3 * n)[2 * n:]
+
+    async def run_async():
+        async with AsyncForecastClient(base_url) as client:
+            started = time.perf_counter()
+            await client.forecast_many(calls)
+            return n / (time.perf_counter() - started)
+
+    async_rate = asyncio.run(run_async())
+
+    print(f"[INFO] bare requests.post : {bare_rate:8.1f} forecasts/s")
+    print(f"[INFO] ForecastClient     : {client_rate:8.1f} forecasts/s")
+    print(f"[INFO] AsyncForecastClient: {async_rate:8.1f} forecasts/s")
+    print(f"[OK] Client speedup {client_rate / bare_rate:.1f}x (sync), {async_rate / bare_rate:.1f}x (async)")
+
+
 if __name__ == "__main__":
-    test_forecast()
+    parser = argparse.ArgumentParser(description="Smoke test / fan-out benchmark for the forecast service")
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--bench", action="store_true", help="Compare fan-out throughput")
+    parser.add_argument("-n", type=int, default=500)
+    args = parser.parse_args()
+
+    test_forecast(args.url)
+    if args.bench:
+        bench_fanout(args.url, args.n)
@@ -0,0 +1,127 @@
+# test_shard_memory.py
+#
+# Shows that memory per shard stays bounded as the region count grows.
+#
+# For each region count, builds a scratch models directory with one gdp model
+# per region (copies of models/gdp_US.joblib under R00001, R00002, ...),
+# starts `run_server.py --shards N` on loopback, sends a forecast for every
+# region through the router's /forecast_batch and reads each shard's resident
+# model count (GET /admin/models) and USS from /proc/<pid>/smaps_rollup
+# (Linux only). The same is done with a single shard as the unsharded baseline.
+#
+# Passes when no shard holds more than --balance x its fair share of models and
+# each shard's memory growth is at most --balance x the baseline growth / N.
+#
+# Usage:
+#   python test_shard_memory.py --shards 4 --regions 250 1000 4000
+#   python test_shard_memory.py --shards 4 --max-models 500     # also cap resident models per shard
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from test_worker_memory import memory_kb, wait_ready
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_MODEL = os.path.join(HERE, "models", "gdp_US.joblib")
+BATCH = 250
+NOISE_MB = 5.0   # allocator noise tolerated on top of the allowed growth
+
+
+def region_names(n_regions):
+    return ["US"] + [f"R{i:05d}" for i in range(1, n_regions)]
+
+
+def make_models_dir(n_regions):
+    path = tempfile.mkdtemp(prefix="polmatrix_shard_models_")
+    for region in region_names(n_regions):
+        shutil.copyfile(SOURCE_MODEL, os.path.join(path, f"gdp_{region}.joblib"))
+    return path
+
+
+def measure(shards, n_regions, port, max_models=0):
+    """[{shard, pid, resident, uss_mb}] after every region's model was used once"""
+    models_dir = make_models_dir(n_regions)
+    env = dict(os.environ, FORECAST_MODELS_DIR=models_dir, FACTS_REFRESH_SECONDS="0",
+               FORECAST_MAX_MODELS=str(max_models))
+    server = subprocess.Popen(
+        [sys.executable, "run_server.py", "--shards", str(shards), "--port", str(port), "--no-pack"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for url in [base_url] + [f"http://127.0.0.1:{port + 1 + i}" for i in range(shards)]:
+            wait_ready(f"{url}/")
+        regions = region_names(n_regions)
+        for lo in range(0, len(regions), BATCH):
+            items = [{"metric": "gdp", "region": r, "startYear": 2025, "endYear": 2030,
+                      "context": {"spending": 0.25}} for r in regions[lo:lo + BATCH]]
+            response = requests.post(f"{base_url}/forecast_batch", json={"requests": items})
+            response.raise_for_status()
+            errors = [r for r in response.json()["results"] if "error" in r]
+            if errors:
+                raise RuntimeError(f"{len(errors)} forecast(s) failed, e.g. {errors[0]}")
+        time.sleep(1)
+        shards_info = requests.get(f"{base_url}/admin/models").json()
+        return [
+            {"shard": info["shard"], "pid": info["pid"], "resident": info["resident"],
+             "uss_mb": memory_kb(info["pid"])["USS"] / 1024}
+            for info in shards_info.values()
+        ]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(models_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-shard memory as the region count grows")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--regions", type=int, nargs="+", default=[250, 1000, 4000])
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--max-models", type=int, default=0, help="FORECAST_MAX_MODELS per shard")
+    parser.add_argument("--balance", type=float, default=1.5, help="Allowed imbalance factor")
+    args = parser.parse_args()
+
+    print(f"{'regions':>8} {'shards':>6} {'max resident':>12} {'max USS MB':>10}")
+    results = {}
+    for n_regions in args.regions:
+        for shards in (1, args.shards):
+            samples = measure(shards, n_regions, args.port, args.max_models)
+            results[(n_regions, shards)] = samples
+            print(f"{n_regions:>8} {shards:>6} {max(s['resident'] for s in samples):>12} "
+                  f"{max(s['uss_mb'] for s in samples):>10.1f}")
+
+    failures = []
+    lo, hi = min(args.regions), max(args.regions)
+    for n_regions in args.regions:
+        fair = n_regions / args.shards
+        cap = args.max_models or n_regions
+        resident = max(s["resident"] for s in results[(n_regions, args.shards)])
+        if resident > min(args.balance * fair, cap):
+            failures.append(f"{n_regions} regions: a shard holds {resident} models (fair share {fair:.0f})")
+
+    baseline_growth = (max(s["uss_mb"] for s in results[(hi, 1)])
+                       - max(s["uss_mb"] for s in results[(lo, 1)]))
+    shard_growth = (max(s["uss_mb"] for s in results[(hi, args.shards)])
+                    - max(s["uss_mb"] for s in results[(lo, args.shards)]))
+    allowed = args.balance * baseline_growth / args.shards
+    print(f"\n[INFO] {lo} -> {hi} regions: single process +{baseline_growth:.1f} MB, "
+          f"largest shard +{shard_growth:.1f} MB (allowed {allowed:.1f} + {NOISE_MB:.0f} MB)")
+    if hi > lo and shard_growth > allowed + NOISE_MB:
+        failures.append(f"shard memory grew {shard_growth:.1f} MB, more than {allowed + NOISE_MB:.1f} MB")
+
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[OK] Memory per shard stays within {args.balance}x of 1/{args.shards} of the unsharded process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# test_worker_memory.py
+#
+# Measures per-worker memory of the multi-worker server with and without the
+# shared model pack. Starts `run_server.py --workers N` for each mode, sends
+# forecasts for every model until each worker has loaded them, then reads
+# /proc/<pid>/smaps_rollup of every worker (Linux only).
+#
+#   USS (private) - memory only this worker uses; the per-worker overhead
+#   PSS           - RSS with shared pages divided among the processes mapping them
+#
+# Usage:
+#   python test_worker_memory.py --workers 4
+#   python test_worker_memory.py --workers 4 --max-uss-mb 150   # exit 1 if pack mode exceeds it
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_pids(supervisor_pid):
+    """Worker processes spawned by the supervisor (skips multiprocessing's resource tracker)"""
+    pids = []
+    for task in os.listdir(f"/proc/{supervisor_pid}/task"):
+        with open(f"/proc/{supervisor_pid}/task/{task}/children") as f:
+            pids.extend(int(p) for p in f.read().split())
+    workers = []
+    for pid in pids:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ").decode()
+        if "resource_tracker" not in cmdline:
+            workers.append(pid)
+    return workers
+
+
+def memory_kb(pid):
+    """{field: kB} from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    fields["USS"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+def warm_up(base_url, models, rounds, concurrency):
+    """Hit every model with a custom context (bypasses the baseline grid and cache).
+
+    Concurrent requests on fresh connections, so the kernel spreads them over all workers.
+    """
+    def post(args):
+        i, name = args
+        metric, _, region = name.rpartition("_")
+        payload = {"metric": metric, "region": region, "startYear": 2025,
+                   "endYear": 2030, "context": {"warmup": i}}
+        response = requests.post(f"{base_url}/forecast", json=payload, headers={"Connection": "close"})
+        response.raise_for_status()
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(post, [(i, name) for i in range(rounds) for name in models]))
+
+
+def measure(mode, workers, port, rounds):
+    args = [sys.executable, "run_server.py", "--workers", str(workers), "--port", str(port)]
+    if mode == "joblib":
+        args.append("--no-pack")
+    env = dict(os.environ, FACTS_REFRESH_SECONDS="0")
+    server = subprocess.Popen(args, cwd=HERE, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(f"{base_url}/")
+        with open(os.path.join(HERE, "models", "manifest.json")) as f:
+            models = sorted(json.load(f)["models"])
+        warm_up(base_url, models, rounds * workers, concurrency=2 * workers)
+        time.sleep(1)
+        return [memory_kb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def report(mode, samples):
+    print(f"\n[INFO] {mode}: {len(samples)} workers")
+    print(f"  {'worker':>6} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}")
+    for i, s in enumerate(samples):
+        print(f"  {i:>6} {s['Rss'] / 1024:>8.1f} {s['Pss'] / 1024:>8.1f} {s['USS'] / 1024:>8.1f}")
+    uss = sum(s["USS"] for s in samples) / len(samples) / 1024
+    pss = sum(s["Pss"] for s in samples) / 1024
+    print(f"  mean USS {uss:.1f} MB, total PSS {pss:.1f} MB")
+    return uss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory with and without the shared model pack")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rounds", type=int, default=10, help="Warm-up rounds per worker")
+    parser.add_argument("--max-uss-mb", type=float, help="Fail if a pack-mode worker's mean USS exceeds this")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("joblib", "pack"):
+        samples = measure(mode, args.workers, args.port, args.rounds)
+        if not samples:
+            print(f"[ERROR] No worker processes found for {mode}")
+            sys.exit(1)
+        results[mode] = report(mode, samples)
+
+    saved = results["joblib"] - results["pack"]
+    print(f"\n[OK] Shared model pack saves {saved:.1f} MB per worker "
+          f"({saved * args.workers:.1f} MB across {args.workers} workers)")
+    if args.max_uss_mb is not None and results["pack"] > args.max_uss_mb:
+        print(f"[FAIL] Pack-mode mean USS {results['pack']:.1f} MB exceeds {args.max_uss_mb} MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,321 @@
 # train_models.py
-import pandas as pd
-import lightgbm as lgb
-import joblib
+#
+# Trains one LightGBM model per (metric, region) in the training data and saves
+# models/{metric}_{region}.joblib.
+#
+# A plain run (the nightly retrain) does no search: each model is fit with the
+# parameters stored for it in models/manifest.json by an earlier --tune run, or
+# DEFAULT_PARAMS if it was never tuned.
+#
+# --tune runs a bounded random search per model first. Each trial is scored by
+# expanding-window time-series cross-validation (fit on the years before a
+# fold, validate on the fold's years) with early stopping on the validation
+# fold, which also picks n_estimators. Trials run on a fork-started process
+# pool: the dataset is loaded and split once before the pool starts and the
+# workers read it copy-on-write instead of reloading it. --time-budget caps the
+# wall time of the whole search; trials still running then are stopped and
+# each model keeps the best trial finished so far. The chosen parameters and
+# their CV score are written to the manifest.
+#
+# Usage:
+#   python train_models.py                                        # reuse stored parameters
+#   python train_models.py --tune --trials 30 --time-budget 600 --workers 8
+#   python train_models.py --tune --metrics gdp spending --regions US
+import argparse
+import multiprocessing
 import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
 
-# Load training data
-df = pd.read_csv("training_data.csv")
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
 
-# Define base input features (covariates) - excluding targets
-base_features = ['year', 'education_index', 'health_index']
+from model_manifest import build_manifest, load_manifest, write_manifest
+from model_runner import MODELS_DIR
 
 # All potential features (targets can be features for other models)
 all_potential_features = ['year', 'education_index', 'health_index', 'gdp', 'co2_emissions', 'green_jobs', 'spending']
 
-# Automatically detect all target metrics
-predictable_metrics = [
-    col for col in df.columns
-    if col not in ['year', 'region']
-]
-
-# Create output dir
-os.makedirs("models", exist_ok=True)
-
-# Train a model per metric
-for metric in predictable_metrics:
-    print(f"🔧 Training model for {metric}...")
-    
-    # Features for this model: base features + other metrics (excluding the target)
-    features = [f for f in all_potential_features if f != metric and f in df.columns]
-    
-    print(f"Features for {metric}: {features}")
-    
-    X = df[features]
-    y = df[metric]
-
-    model = lgb.LGBMRegressor(
-        min_data_in_leaf=1,
-        min_data_in_bin=1,
-        num_leaves=2,
-        learning_rate=0.1,
-        n_estimators=50
-    )
-    model.fit(X, y)
-
-    filename = f"models/{metric}_US.joblib"
-    joblib.dump(model, filename)
-    print(f"✅ Saved {filename}")
-
-print("✅ All models trained and saved successfully!")
-# This script trains models for each metric in the training data
-# and saves them in the "models" directory.
\ No newline at end of file
+# Key columns of the training CSV; every other column is a metric to predict
+KEY_COLUMNS = ['year', 'quarter', 'period', 'region']
+
+# The configuration every model used before tuning; the first trial of a search
+DEFAULT_PARAMS = {
+    "min_data_in_leaf": 1,
+    "min_data_in_bin": 1,
+    "num_leaves": 2,
+    "learning_rate": 0.1,
+    "n_estimators": 50,
+}
+
+# Random search space; n_estimators comes from early stopping, up to MAX_ESTIMATORS
+SEARCH_SPACE = {
+    "num_leaves": [2, 3, 4, 7, 15],
+    "learning_rate": [0.03, 0.05, 0.1, 0.2],
+    "min_data_in_leaf": [1, 2, 3, 5, 10],
+    "feature_fraction": [0.6, 0.8, 1.0],
+    "lambda_l2": [0.0, 0.1, 1.0, 10.0],
+}
+MAX_ESTIMATORS = 500
+EARLY_STOPPING_ROUNDS = 20
+
+# Per-model (X, y, folds), set before the pool forks so workers share it
+_datasets = {}
+
+
+# --- DATA ---
+def model_name(metric, region):
+    return f"{metric}_{region}"
+
+
+def time_series_folds(times, n_folds, min_train_periods):
+    """[(train_idx, val_idx)] expanding-window folds over the distinct `times`.
+
+    The periods after the first `min_train_periods` are cut into `n_folds`
+    consecutive validation blocks; each fold trains on everything before its
+    block. Empty if there are too few periods to validate on.
+    """
+    periods = np.unique(times)
+    n_val = len(periods) - min_train_periods
+    if n_val < 1:
+        return []
+    n_folds = min(n_folds, n_val)
+    block = n_val // n_folds
+    folds = []
+    for k in range(n_folds):
+        first = periods[min_train_periods + k * block]
+        last = periods[-1] if k == n_folds - 1 else periods[min_train_periods + (k + 1) * block - 1]
+        folds.append((np.flatnonzero(times < first), np.flatnonzero((times >= first) & (times <= last))))
+    return folds
+
+
+def load_datasets(path, metrics=None, regions=None, n_folds=3, min_train_periods=3):
+    """{model_name: (metric, region, features, X, y, folds)} from the training CSV"""
+    df = pd.read_csv(path, dtype={"region": str})
+    if "region" not in df.columns:
+        df["region"] = "US"
+    time_column = "period" if "period" in df.columns else "year"
+    predictable_metrics = [col for col in df.columns if col not in KEY_COLUMNS]
+
+    datasets = {}
+    for region, rows in df.groupby("region", sort=True):
+        if regions and region not in regions:
+            continue
+        rows = rows.sort_values(time_column)
+        for metric in predictable_metrics:
+            if metrics and metric not in metrics:
+                continue
+            # Features for this model: base features + other metrics (excluding the target)
+            features = [f for f in all_potential_features if f != metric and f in df.columns]
+            complete = rows.dropna(subset=features + [metric])
+            X = complete[features].to_numpy(dtype=float)
+            y = complete[metric].to_numpy(dtype=float)
+            folds = time_series_folds(complete[time_column].to_numpy(), n_folds, min_train_periods)
+            datasets[model_name(metric, region)] = (metric, region, features, X, y, folds)
+    return datasets
+
+
+# --- SEARCH ---
+def sample_params(rng):
+    return {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+
+
+def trial_plan(names, stored, n_trials, seed):
+    """[(name, trial, params)], round-robin over the models.
+
+    Trial 0 is the model's stored parameters (or DEFAULT_PARAMS), so a search
+    never picks something worse than what it would replace. Trials are
+    interleaved so that a time budget cuts every model's search short evenly.
+    """
+    per_model = {}
+    for name in names:
+        rng = random.Random(f"{seed}:{name}")
+        baseline = {k: v for k, v in (stored.get(name) or DEFAULT_PARAMS).items() if k != "n_estimators"}
+        candidates, seen = [baseline], {tuple(sorted(baseline.items()))}
+        # Bounded attempts: small search spaces may run out of distinct candidates
+        for _ in range(n_trials * 10):
+            if len(candidates) >= n_trials:
+                break
+            params = {**DEFAULT_PARAMS, **sample_params(rng)}
+            params.pop("n_estimators")
+            key = tuple(sorted(params.items()))
+            if key not in seen:
+                seen.add(key)
+                candidates.append(params)
+        per_model[name] = candidates
+    plan = []
+    for trial in range(n_trials):
+        plan.extend((name, trial, per_model[name][trial]) for name in names if trial < len(per_model[name]))
+    return plan
+
+
+def run_trial(name, trial, params):
+    """Mean validation RMSE of `params` over the model's folds, with early stopping"""
+    _, _, _, X, y, folds = _datasets[name]
+    errors, iterations = [], []
+    for train_idx, val_idx in folds:
+        model = lgb.LGBMRegressor(n_estimators=MAX_ESTIMATORS, n_jobs=1, verbose=-1, **params)
+        model.fit(X[train_idx], y[train_idx], eval_set=[(X[val_idx], y[val_idx])], eval_metric="rmse",
+                  callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+        best = model.best_iteration_ or MAX_ESTIMATORS
+        pred = model.predict(X[val_idx], num_iteration=best)
+        errors.append(float(np.sqrt(np.mean((pred - y[val_idx]) ** 2))))
+        iterations.append(best)
+    return {
+        "name": name,
+        "trial": trial,
+        "params": {**params, "n_estimators": max(1, int(round(np.mean(iterations))))},
+        "cv_rmse": float(np.mean(errors)),
+    }
+
+
+def run_search(plan, workers, deadline):
+    """{name: [trial results]} for the trials of `plan` finished before `deadline`.
+
+    No trial starts after the deadline and trials still running at it are
+    stopped with the pool. Without fork (or with one worker) trials run in
+    this process and the deadline is only checked between trials.
+    """
+    results = {}
+
+    def record(result):
+        if isinstance(result, Exception):
+            print(f"[WARN] Trial failed: {result}")
+        else:
+            results.setdefault(result["name"], []).append(result)
+
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for job in plan:
+            if time.monotonic() >= deadline:
+                print("[WARN] Time budget reached; skipping the remaining trials")
+                break
+            try:
+                record(run_trial(*job))
+            except Exception as e:
+                record(e)
+        return results
+
+    done = queue.Queue()
+    pending = iter(plan)
+    in_flight = 0
+    # Forked workers inherit _datasets; only the (name, trial, params) job is pickled
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        while True:
+            while in_flight < workers and time.monotonic() < deadline:
+                job = next(pending, None)
+                if job is None:
+                    break
+                pool.apply_async(run_trial, job, callback=done.put, error_callback=done.put)
+                in_flight += 1
+            if in_flight == 0:
+                break
+            try:
+                result = done.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                print(f"[WARN] Time budget reached; stopping {in_flight} running trial(s)")
+                break
+            in_flight -= 1
+            record(result)
+    # Leaving the with block terminates the pool, including any running trials
+    return results
+
+
+def tune(datasets, stored, n_trials, time_budget, workers, seed):
+    """{name: manifest fields} with the best parameters found for each model that can be validated"""
+    global _datasets
+    names = []
+    for name, (_, _, _, _, _, folds) in datasets.items():
+        if folds:
+            names.append(name)
+        else:
+            print(f"[WARN] {name}: too few periods for time-series CV; keeping its current parameters")
+    if not names:
+        return {}
+
+    _datasets = datasets
+    plan = trial_plan(names, stored, n_trials, seed)
+    print(f"🔧 Tuning {len(names)} model(s): {len(plan)} trial(s) on {workers} worker(s), "
+          f"budget {time_budget:.0f}s")
+    started = time.monotonic()
+    results = run_search(plan, workers, started + time_budget)
+    elapsed = time.monotonic() - started
+
+    tuned_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    chosen = {}
+    for name in names:
+        trials = results.get(name)
+        if not trials:
+            print(f"[WARN] {name}: no trial finished within the budget; keeping its current parameters")
+            continue
+        best = min(trials, key=lambda r: (r["cv_rmse"], r["trial"]))
+        chosen[name] = {
+            "params": best["params"],
+            "tuning": {
+                "cv_rmse": round(best["cv_rmse"], 6),
+                "baseline_cv_rmse": next((round(r["cv_rmse"], 6) for r in trials if r["trial"] == 0), None),
+                "trials": len(trials),
+                "folds": len(datasets[name][5]),
+                "tuned_at": tuned_at,
+            },
+        }
+        print(f"[INFO] {name}: best CV RMSE {best['cv_rmse']:.4f} after {len(trials)} trial(s) "
+              f"(trial {best['trial']}): {best['params']}")
+    print(f"[OK] Search finished in {elapsed:.1f}s")
+    return chosen
+
+
+# --- TRAINING ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the forecast models, optionally tuning them first")
+    parser.add_argument("--data", default="training_data.csv")
+    parser.add_argument("--metrics", nargs="+", help="Only these metrics (default: every metric column)")
+    parser.add_argument("--regions", nargs="+", help="Only these regions (default: every region)")
+    parser.add_argument("--tune", action="store_true", help="Search hyperparameters before training")
+    parser.add_argument("--trials", type=int, default=20, help="Trials per model, including the current parameters")
+    parser.add_argument("--time-budget", type=float, default=900, help="Wall-time cap of the whole search, seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--min-train-periods", type=int, default=3,
+                        help="Periods the first fold trains on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # Create output dir (before reading the manifest, which scans it)
+    os.makedirs(MODELS_DIR, exist_ok=True)
+
+    datasets = load_datasets(args.data, args.metrics, args.regions, args.folds, args.min_train_periods)
+    manifest = load_manifest()
+    stored = {name: entry.get("params") for name, entry in manifest.get("models", {}).items()}
+    chosen = tune(datasets, stored, args.trials, args.time_budget, args.workers, args.seed) if args.tune else {}
+
+    # Train a model per (metric, region)
+    for name, (metric, region, features, X, y, _) in datasets.items():
+        params = (chosen.get(name) or {}).get("params") or stored.get(name) or DEFAULT_PARAMS
+        source = "tuned" if name in chosen else "stored" if stored.get(name) else "default"
+        print(f"🔧 Training model for {metric} in {region} ({source} parameters)...")
+        print(f"Features for {metric}: {features}")
+
+        model = lgb.LGBMRegressor(**params)
+        model.fit(pd.DataFrame(X, columns=features), y)
+
+        filename = os.path.join(MODELS_DIR, f"{name}.joblib")
+        joblib.dump(model, filename)
+        print(f"✅ Saved {filename}")
+
+    # Record the trained models; derived artifacts (baseline grid) are versioned against it.
+    # Stored parameters carry over from the previous manifest; new ones replace them.
+    manifest = build_manifest(previous=manifest)
+    for name, fields in chosen.items():
+        manifest["models"][name].update(fields)
+    write_manifest(manifest)
+    print(f"✅ Wrote models/manifest.json ({len(chosen)} model(s) tuned)")
+
+    print("✅ All models trained and saved successfully!")
+
+
+if __name__ == "__main__":
+    main()